@@ -0,0 +1,84 @@
+"""Evaluation backend benchmark.
+
+Usage: python3 benchmarks/backends.py [-j WORKERS] [-c CHUNKS]
+                                      [-p POP_SIZES...] [-o OUTPUT]
+
+Times the evaluation of a random population with each evaluation backend
+(see rubicon/backends.py): serial, a thread pool and a process pool of
+WORKERS (all CPUs by default), at every population size, and reports
+the fastest backend for each. Evaluations go through the toolkit's
+fitness function and the backend's map, as in a GA generation, so the
+process pool's times include pickling the individuals and fitnesses."""
+
+import argparse
+import os
+import random
+
+import common
+
+from backends import BACKENDS, evaluation_backend
+from micro import make_toolkit
+
+DEFAULT_OUTPUT = os.path.join(common.BENCH_DIR, "backends.json")
+POP_SIZES = (50, 100, 400, 1600)
+
+
+def run_benchmark(pop_sizes, workers=None, chunks=None, verbose=True):
+    """Time every backend at every population size.
+
+    Parameters:
+    - pop_sizes: population sizes
+    - workers: number of threads and processes (default: number of CPUs)
+    - chunks: number of tasks per map of the threads backend
+    - verbose: if False, nothing is printed to stdout.
+
+    Returns a dict of population size to a dict of backend name to
+    seconds per population evaluation, with the fastest backend in its
+    'best' entry."""
+    random.seed(0)
+    results = {pop_size: {} for pop_size in pop_sizes}
+    for name in BACKENDS:
+        config = {'Backend': name,
+                  name.capitalize(): {'Workers': workers, 'Chunks': chunks}}
+        with evaluation_backend(config) as backend:
+            for pop_size in pop_sizes:
+                toolkit = make_toolkit(pop_size)
+                pop = toolkit.init_pop()
+                map_function = backend.map if backend else toolkit.map
+
+                def evaluate():
+                    return list(map_function(toolkit.fitness, pop))
+
+                results[pop_size][name] = common.time_call(evaluate)
+
+    if verbose:
+        print(" " * 12 + "".join("{:>13}".format(name) for name in BACKENDS))
+    for pop_size, times in results.items():
+        times['best'] = min(BACKENDS, key=times.__getitem__)
+        if verbose:
+            cells = "".join("{:>12.3e}s".format(times[name])
+                            for name in BACKENDS)
+            print("pop={:<8}{}   best: {}".format(pop_size, cells,
+                                                  times['best']))
+    return results
+
+
+def main():
+    """Parse the command line and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of threads and processes")
+    parser.add_argument("-c", "--chunks", type=int, default=None,
+                        help="number of tasks per map of the threads")
+    parser.add_argument("-p", "--pop-sizes", type=int, nargs="+",
+                        default=POP_SIZES, help="population sizes")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT,
+                        help="JSON file to which results are written")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.pop_sizes, args.workers, args.chunks)
+    common.save_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
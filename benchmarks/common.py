@@ -0,0 +1,81 @@
+"""Shared helpers for the benchmark scripts.
+
+Puts the rubicon sources on the import path, times callables and
+compares benchmark results against a stored baseline."""
+
+import json
+import os
+import sys
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+SRC_DIR = os.path.join(ROOT_DIR, "rubicon")
+INPUTS_DIR = os.path.join(ROOT_DIR, "inputs")
+
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+def time_call(function, repeat=5, min_time=0.2):
+    """Time a callable taking no arguments.
+
+    The number of calls per measurement is chosen so that each
+    measurement takes at least min_time seconds.
+
+    Parameters:
+    - function: callable to be timed
+    - repeat: number of measurements
+    - min_time: minimum duration of each measurement, in seconds
+
+    Returns the best time per call, in seconds."""
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+    times = [elapsed] + timer.repeat(repeat=repeat - 1, number=number)
+    return min(times) / number
+
+
+def load_results(path):
+    """Load benchmark results from a JSON file, or None if missing."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(path, results):
+    """Save benchmark results to a JSON file."""
+    with open(path, "w") as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+
+
+def compare(results, baseline, tolerance, file=sys.stdout):
+    """Compare benchmark times against a baseline.
+
+    Parameters:
+    - results: dict of benchmark name to seconds per call
+    - baseline: dict of benchmark name to seconds per call
+    - tolerance: allowed relative slowdown (0.2 allows 20% slower)
+    - file: stream to which the comparison table is printed
+
+    Returns the list of benchmark names slower than the tolerance."""
+    regressions = []
+    for name in sorted(results):
+        new = results[name]
+        old = baseline.get(name)
+        if old is None:
+            print("{:<40} {:>12.3e}s (new)".format(name, new), file=file)
+            continue
+        ratio = new / old
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("{:<40} {:>12.3e}s {:>7.2f}x{}".format(name, new, ratio, flag),
+              file=file)
+    return regressions
@@ -0,0 +1,231 @@
+"""Micro-benchmarks for the cube and GA hot paths.
+
+Usage: python3 benchmarks/micro.py [-o OUTPUT] [-b BASELINE] [-t TOLERANCE]
+                                   [-k FILTER] [--update-baseline]
+
+Times each benchmark, writes the results as JSON and compares them
+against a stored baseline, exiting with status 1 if any benchmark is
+slower than the baseline by more than the tolerance."""
+
+import argparse
+import copy
+import os
+import random
+import sys
+from functools import partial
+
+import common
+
+import numpy as np
+
+import rubikscube as rc
+import beam
+import cube_fitness
+import cubie_fitness
+import fitness_cache
+import graph_fitness
+import rubicon_toolkit
+from ga import run_ga
+from rubicon_toolkit import RubiconToolkit
+
+DEFAULT_BASELINE = os.path.join(common.BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(common.BENCH_DIR, "micro.json")
+
+GENOME_LENGTHS = (10, 50, 100)
+POP_SIZES = (50, 100, 400)
+
+CONFIG = {
+    "Name": "benchmark",
+    "GA": {
+        "InitMinSize": 5,
+        "InitMaxSize": 15,
+        "MutMinSize": 1,
+        "MutMaxSize": 10,
+        "IndMaxSize": 100,
+        "PopSize": 100,
+        "Gens": 1,
+        "TournSize": 3,
+        "NumElitism": 1,
+        "CxProb": 0.9,
+        "MutProb": 0.1
+    },
+    "Rubiks": {
+        "InitialPath": os.path.join(common.INPUTS_DIR, "in1", "in1")
+    },
+    "Runs": 1
+}
+
+
+def make_toolkit(pop_size=100):
+    """Create a RubiconToolkit for the benchmark configuration."""
+    config = copy.deepcopy(CONFIG)
+    config['GA']['PopSize'] = pop_size
+    return RubiconToolkit(config)
+
+
+def random_genome(length):
+    """Create a random genome with a fixed length."""
+    return [random.randint(0, len(rc.moves) - 1) for _ in range(length)]
+
+
+def bench_cube():
+    """Benchmarks for the cube representation."""
+    cube = rc.from_file(CONFIG['Rubiks']['InitialPath'], flatten=True)
+    macros = rc.MacroLibrary()
+    for length in GENOME_LENGTHS:
+        genome = random_genome(length)
+        yield ("apply_moves/len={}".format(length),
+               partial(rc.apply_moves, cube, genome))
+        yield ("macro_apply/len={}".format(length),
+               partial(macros.apply, cube, genome))
+    yield ("from_file",
+           partial(rc.from_file, CONFIG['Rubiks']['InitialPath'],
+                   flatten=True))
+    yield ("from_file/side=5",
+           partial(rc.from_file, os.path.join(common.INPUTS_DIR, "in5", "in5"),
+                   flatten=True))
+    for side in (4, 5):
+        genome = [random.randrange(len(rc.move_table(side).moves))
+                  for _ in range(50)]
+        yield ("apply_moves/side={}/len=50".format(side),
+               partial(rc.apply_moves, rc.gen_cube(side), genome))
+    # state keys, from the whole cube or updated along with the moves
+    genome = random_genome(50)
+    yield ("apply_moves_hashed/len=50",
+           partial(rc.apply_moves_hashed, cube, genome))
+    yield ("zobrist_hash", partial(rc.zobrist_hash, cube))
+    yield ("cache_key", partial(fitness_cache.FitnessCache.key, None, cube))
+    cubes = np.array([rc.apply_moves(cube, random_genome(20))
+                      for _ in range(1000)])
+    yield ("zobrist_hashes/states=1000", partial(rc.zobrist_hashes, cubes))
+    parents = np.repeat(np.arange(len(cubes)), len(rc.moves))
+    moves = np.tile(np.arange(len(rc.moves)), len(cubes))
+    yield ("child_hashes/states=1000",
+           partial(rc.child_hashes, cubes, rc.zobrist_hashes(cubes), parents,
+                   moves))
+
+
+def bench_fitness():
+    """Benchmarks for each fitness component and the combined fitness."""
+    cube = rc.from_file(CONFIG['Rubiks']['InitialPath'], flatten=True)
+    scrambled = rc.apply_moves(cube, random_genome(50))
+    yield ("wrong_color_facelets",
+           partial(cube_fitness.wrong_color_facelets, scrambled))
+    yield ("wrong_cubelets", partial(cube_fitness.wrong_cubelets, scrambled))
+    yield ("solution_distance",
+           partial(graph_fitness.solution_distance, scrambled))
+    yield ("cubie_distance", partial(cubie_fitness.cubie_distance, scrambled))
+    for length in GENOME_LENGTHS:
+        genome = random_genome(length)
+        yield ("combined_fitness/len={}".format(length),
+               partial(rubicon_toolkit.combined_fitness, genome, cube))
+    # a cutoff of 0 bounds every individual, and one of inf none
+    for cutoff in (0, np.inf):
+        yield ("combined_fitness/lazy/cutoff={}/len=50".format(cutoff),
+               partial(rubicon_toolkit.combined_fitness, random_genome(50),
+                       cube, cutoff=cutoff))
+    cubes = np.array([rc.apply_moves(cube, random_genome(20))
+                      for _ in range(1000)])
+    yield ("batch_fitness/states=1000",
+           partial(beam.batch_fitness, cubes, 20))
+    # repeated evaluations of a state are all hits but the first
+    cache = fitness_cache.FitnessCache(1 << 16)
+    yield ("combined_fitness/cached/len=50",
+           partial(rubicon_toolkit.combined_fitness, random_genome(50), cube,
+                   cache=cache))
+    for side in (4, 5):
+        genome = [random.randrange(len(rc.move_table(side).moves))
+                  for _ in range(50)]
+        yield ("combined_fitness/side={}/len=50".format(side),
+               partial(rubicon_toolkit.combined_fitness, genome,
+                       rc.gen_cube(side)))
+        yield ("combined_fitness/cached/side={}/len=50".format(side),
+               partial(rubicon_toolkit.combined_fitness, genome,
+                       rc.gen_cube(side), cache=cache))
+
+
+def bench_operators():
+    """Benchmarks for the GA operators."""
+    toolkit = make_toolkit()
+    pop = toolkit.init_pop()
+    fit_and_pop = [(random.random(), ind) for ind in pop]
+    a, b = random_genome(50), random_genome(50)
+    yield ("create_ind", toolkit.create)
+    yield ("cx_point", partial(rubicon_toolkit.cx_point, a, b))
+    yield ("mutate_replace", partial(rubicon_toolkit.mutate_replace, a, 1, 10))
+    yield ("sel_tourn/pop=100", partial(toolkit.select, fit_and_pop))
+    yield ("sel_best/pop=100", partial(toolkit.best, fit_and_pop))
+    yield ("vary/pop=100", partial(toolkit.vary, pop))
+
+
+def bench_ga():
+    """Benchmarks for a single generation of run_ga."""
+    for pop_size in POP_SIZES:
+        toolkit = make_toolkit(pop_size)
+        pop = toolkit.init_pop()
+        yield ("run_ga/1gen/pop={}".format(pop_size),
+               partial(run_ga, pop, 1, toolkit, verbose=False))
+
+
+BENCHMARKS = [bench_cube, bench_fitness, bench_operators, bench_ga]
+
+
+def run_benchmarks(name_filter=None, verbose=True):
+    """Run every registered benchmark.
+
+    Parameters:
+    - name_filter: if given, only benchmarks whose names contain this
+                   string are run
+    - verbose: if False, nothing is printed to stdout.
+
+    Returns a dict of benchmark name to seconds per call."""
+    random.seed(0)
+    results = {}
+    for group in BENCHMARKS:
+        for name, function in group():
+            if name_filter and name_filter not in name:
+                continue
+            results[name] = common.time_call(function)
+            if verbose:
+                print("{:<40} {:>12.3e}s".format(name, results[name]))
+    return results
+
+
+def main():
+    """Parse the command line, run the benchmarks and compare them."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT,
+                        help="JSON file to which results are written")
+    parser.add_argument("-b", "--baseline", default=DEFAULT_BASELINE,
+                        help="JSON file with the baseline results")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown")
+    parser.add_argument("-k", "--filter", default=None,
+                        help="only run benchmarks containing this string")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.filter)
+    common.save_results(args.output, results)
+
+    if args.update_baseline:
+        common.save_results(args.baseline, results)
+        print("Baseline written to", args.baseline)
+        return
+
+    baseline = common.load_results(args.baseline)
+    if baseline is None:
+        print("No baseline at {} (use --update-baseline)".format(
+            args.baseline))
+        return
+
+    print("\nComparison against", args.baseline)
+    regressions = common.compare(results, baseline, args.tolerance)
+    if regressions:
+        print("{} regressions".format(len(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
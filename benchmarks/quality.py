@@ -0,0 +1,220 @@
+"""Time-to-quality benchmark over the bundled instances.
+
+Usage: python3 benchmarks/quality.py [-c CONFIG] [-s SEEDS] [-e EVALS]
+                                     [-w SECONDS] [-j PROCESSES]
+                                     [-o OUTPUT] [INSTANCE...]
+
+Runs the GA on each instance in inputs/ (in1 to in5 by default), or
+given as a cube file path (e.g. from a corpus written by
+rubicon/scramble.py), for every seed, under an evaluation and/or
+wall-clock budget, and records the best fitness found against time and
+evaluations. Reports the time and evaluations needed to reach each
+fitness target, as well as the evaluation throughput."""
+
+import argparse
+import copy
+import json
+import multiprocessing as mp
+import os
+import random
+import time
+
+import common
+
+import numpy as np
+
+from budget import Budget
+from ga import run_ga
+from rubicon_toolkit import RubiconToolkit
+
+DEFAULT_OUTPUT = os.path.join(common.BENCH_DIR, "quality.json")
+INSTANCES = ("in1", "in2", "in3", "in4", "in5")
+TARGETS = (40, 30, 20, 10, 5, 1)
+
+CONFIG = {
+    "Name": "quality",
+    "GA": {
+        "InitMinSize": 10,
+        "InitMaxSize": 30,
+        "MutMinSize": 1,
+        "MutMaxSize": 10,
+        "IndMaxSize": 100,
+        "PopSize": 100,
+        "Gens": 1000000,
+        "TournSize": 5,
+        "NumElitism": 1,
+        "CxProb": 0.9,
+        "MutProb": 0.1
+    },
+    "Rubiks": {},
+    "Runs": 1
+}
+
+
+class QualityTracker:
+    """Map function which records the best fitness over time.
+
+    Replaces a toolkit's map, recording the elapsed time, evaluation
+    count and best fitness so far after every batch of evaluations.
+
+    Parameters:
+    - map_function: map used for the actual evaluations"""
+    def __init__(self, map_function):
+        self.map_function = map_function
+        self.evals = 0
+        self.best = float("inf")
+        self.curve = []
+        self.start_time = time.perf_counter()
+
+    def __call__(self, function, iterable):
+        fitnesses = list(self.map_function(function, iterable))
+        self.evals += len(fitnesses)
+        self.best = min(self.best, min(fitnesses))
+        elapsed = time.perf_counter() - self.start_time
+        self.curve.append((elapsed, self.evals, float(self.best)))
+        return fitnesses
+
+
+def time_to_targets(curve, targets):
+    """Find when each fitness target was first reached.
+
+    Parameters:
+    - curve: list of (time, evals, best fitness) tuples
+    - targets: fitness values to be reached
+
+    Returns a dict of target to (time, evals), or None for targets
+    which were never reached."""
+    reached = {}
+    for target in targets:
+        reached[target] = next(((t, evals) for t, evals, best in curve
+                                if best <= target), None)
+    return reached
+
+
+def run_instance(config, seed, map_function, max_evals, max_time):
+    """Run the GA on an instance until the budget is exhausted.
+
+    Returns the QualityTracker used for the run."""
+    random.seed(seed)
+    toolkit = RubiconToolkit(config)
+    tracker = QualityTracker(map_function)
+    toolkit.map = tracker
+    pop = toolkit.init_pop()
+    budget = Budget(seconds=max_time, evals=max_evals)
+    run_ga(pop, config['GA']['Gens'], toolkit, verbose=False, budget=budget)
+    return tracker
+
+
+def run_benchmark(config, instances, seeds, max_evals, max_time,
+                  map_function=map, targets=TARGETS, verbose=True):
+    """Run the time-to-quality benchmark.
+
+    Parameters:
+    - config: base GA configuration
+    - instances: names of the instance directories in inputs/, or
+                 paths to cube files
+    - seeds: random seeds, one run per seed and instance
+    - max_evals: evaluation budget per run
+    - max_time: wall-clock budget per run, in seconds
+    - map_function: map used for evaluations (e.g. Pool.map)
+    - targets: fitness targets
+    - verbose: if False, nothing is printed to stdout.
+
+    Returns a dict of instance name to a list of per-seed results."""
+    results = {}
+    for instance in instances:
+        config = copy.deepcopy(config)
+        config['Rubiks']['InitialPath'] = (
+            instance if os.path.isfile(instance)
+            else os.path.join(common.INPUTS_DIR, instance, instance))
+        try:
+            RubiconToolkit(config)
+        except (IndexError, KeyError, ValueError) as e:
+            # e.g. unreadable or unsolvable instances
+            if verbose:
+                print("Skipping {}: {!r}".format(instance, e))
+            continue
+        results[instance] = []
+        for seed in seeds:
+            tracker = run_instance(config, seed, map_function, max_evals,
+                                   max_time)
+            elapsed = tracker.curve[-1][0]
+            reached = time_to_targets(tracker.curve, targets)
+            results[instance].append({
+                "seed": seed,
+                "best": tracker.best,
+                "evals": tracker.evals,
+                "time": elapsed,
+                "evals_per_sec": tracker.evals / elapsed,
+                "curve": tracker.curve,
+                "time_to_target": {str(t): r for t, r in reached.items()},
+            })
+            if verbose:
+                print("{} seed {}: best {:.3f}, {} evals in {:.1f}s "
+                      "({:.0f} evals/s)".format(
+                          instance, seed, tracker.best, tracker.evals,
+                          elapsed, tracker.evals / elapsed))
+    return results
+
+
+def print_summary(results, targets=TARGETS):
+    """Print the median time to each target for every instance.
+
+    Targets reached by less than half of the seeds are shown as '-'."""
+    print("\n{:<8}".format("") +
+          "".join("{:>10}".format("<= {}".format(t)) for t in targets) +
+          "{:>12}".format("evals/s"))
+    for instance, runs in results.items():
+        cells = []
+        for target in targets:
+            times = [r['time_to_target'][str(target)] for r in runs]
+            times = [t[0] if t else np.inf for t in times]
+            median = np.median(times)
+            cells.append("{:>9.2f}s".format(median) if np.isfinite(median)
+                         else "{:>10}".format("-"))
+        throughput = np.mean([r['evals_per_sec'] for r in runs])
+        print("{:<8}".format(instance) + "".join(cells) +
+              "{:>12.0f}".format(throughput))
+
+
+def main():
+    """Parse the command line and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("instances", nargs="*", default=INSTANCES,
+                        help="instance names in inputs/ or cube files")
+    parser.add_argument("-c", "--config", default=None,
+                        help="JSON configuration with the GA parameters")
+    parser.add_argument("-s", "--seeds", type=int, default=5,
+                        help="number of seeds per instance")
+    parser.add_argument("-e", "--max-evals", type=int, default=20000,
+                        help="evaluation budget per run")
+    parser.add_argument("-w", "--max-time", type=float, default=None,
+                        help="wall-clock budget per run, in seconds")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="evaluate with a process pool of this size")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT,
+                        help="JSON file to which results are written")
+    args = parser.parse_args()
+
+    config = CONFIG
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+
+    pool = None
+    map_function = map
+    if args.processes:
+        pool = mp.Pool(args.processes)
+        map_function = pool.map
+
+    results = run_benchmark(config, args.instances, range(args.seeds),
+                            args.max_evals, args.max_time, map_function)
+    if pool:
+        pool.close()
+
+    print_summary(results)
+    common.save_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,112 +1,23 @@
-import math
 import json
 import datetime
-import time
 import os
 import sys
-import pprint
-import multiprocessing as mp
-from collections import namedtuple
 
-import numpy as np
-
-import rubikscube as rc
-from ga import run_ga, summarize_stats
+from backends import evaluation_backend, use_backend
 from rubicon_toolkit import RubiconToolkit
-from log_tools import log_run, log_multi_run, log_individuals
+from runner import single_run, multi_run
 
 THIS_FILE = os.path.realpath(__file__)
 RUNS_DIR = os.path.join(os.path.dirname(THIS_FILE), "../runs")
 
 
-def single_run(toolkit, run_dir, verbose=True):
-    """Perform a single run of the genetic algorithm.
-
-    Parameters:
-    - toolkit: Toolkit object containing the operators and the fitness
-               function, to be passed to the GA procedure.
-    - run_dir: directory to which the log data should be saved for
-               the run
-    - verbose: if False, nothing is printed to stdout.
-
-    Returns the best individual and its fitness, the entire population
-    after all generations and the execution stats."""
-    config = toolkit.config
-
-    if not os.path.exists(run_dir):
-        os.makedirs(run_dir)
-
-    start_time = time.time()
-
-    pop = toolkit.init_pop()
-    fit_and_pop, stats = run_ga(pop, config['GA']['Gens'], toolkit, verbose)
-
-    best_fitness, best = min(fit_and_pop)
-
-    end_time = time.time()
-    duration = end_time - start_time  # in seconds
-
-    best_final_cube = rc.apply_moves(toolkit.initial_cube, best)
-    if verbose:
-        pprint.pprint(best, indent=4, compact=True)
-        print("Fitness:", best_fitness)
-        rc.print_3d_cube(best_final_cube)
-
-    log_run(run_dir, config, stats, duration)
-    log_individuals(run_dir, fit_and_pop, best_final_cube)
-
-    return (best_fitness, best), pop, stats
-
-
-def multi_run(toolkit, all_runs_dir):
-    """Performs a set of GA runs.
-
-    Parameters:
-    - toolkit: Toolkit object containing the operators and the fitness
-               function, to be passed to the GA procedure.
-    - all_runs_dir: directory to which the summarized log data for all
-                    runs should be saved.
-    """
-    config = toolkit.config
-
-    fit_and_best = []
-    run_stats = []
-
-    start_time = time.time()
-
-    for run in range(config['Runs']):
-        digits = int(math.log(config['Runs'], 10)) + 1
-        run_id = str(run).zfill(digits)
-        run_dir = os.path.join(all_runs_dir, "run_{}".format(run_id))
-        run_fit_and_best, _, stats = single_run(toolkit, run_dir, verbose=True)
-        log_fmt = "Run {}: Fitness {}\nBest: {}"
-        print(log_fmt.format(run, *run_fit_and_best))
-        fit_and_best.append(run_fit_and_best)
-        run_stats.append(stats)
-
-    fitness, best = min(fit_and_best)
-    print('Best:', best)
-    print('Fitness:', fitness)
-    best_final_cube = rc.apply_moves(toolkit.initial_cube, best)
-    rc.print_3d_cube(best_final_cube)
-
-    end_time = time.time()
-    duration = end_time - start_time  # in seconds
-
-    summary = summarize_stats(run_stats)
-
-    log_multi_run(all_runs_dir, config, summary, duration)
-    log_individuals(all_runs_dir, fit_and_best, best_final_cube)
-
-
-def main(pool=None):
+def main():
     """Main function for the program.
 
     Interprets the first command line argument as the path to the
-    configuration JSON.
-
-    Parameters:
-    - pool: multiprocessing.Pool for parallelization."""
+    configuration JSON. Fitnesses are evaluated by the configuration's
+    backend, a process pool by default (see
+    backends.evaluation_backend)."""
     config_path = sys.argv[1]
     with open(config_path) as f:
         config = json.load(f)
@@ -114,8 +25,6 @@ def main(pool=None):
     run_name = config['Name']
 
     toolkit = RubiconToolkit(config)
-    if pool:
-        toolkit.map = pool.map
 
     timestr = datetime.datetime.now().strftime("%Y%m%d-%Hh%Mm%Ss")
     all_runs_dir = os.path.join(RUNS_DIR, "{}-{}".format(timestr, run_name))
@@ -123,11 +32,13 @@ def main(pool=None):
     print("Start of execution:", timestr)
     print("{} runs".format(config['Runs']))
 
-    if config['Runs'] == 1:
-        single_run(toolkit, all_runs_dir)
-    elif config['Runs'] > 1:
-        multi_run(toolkit, all_runs_dir)
+    with evaluation_backend(config) as backend:
+        use_backend(toolkit, backend)
+        if config['Runs'] == 1:
+            single_run(toolkit, all_runs_dir)
+        elif config['Runs'] > 1:
+            multi_run(toolkit, all_runs_dir)
 
 
 if __name__ == '__main__':
-    main(pool=mp.Pool())
+    main()
@@ -0,0 +1,110 @@
+"""Evaluation backends, which provide the map and apply_async functions
+with which a toolkit evaluates fitnesses (see ga.Toolkit).
+
+- processes: a multiprocessing.Pool, whose workers each hold a copy of
+  the cube and fitness tables and receive pickled individuals;
+- threads: a ThreadMap, whose threads share the process's tables and
+  individuals, and only run in parallel where the GIL is released (in
+  NumPy, or on a free-threaded interpreter);
+- serial: the toolkit's own map and apply_async."""
+
+import multiprocessing as mp
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import chain
+
+BACKENDS = ("processes", "threads", "serial")
+
+
+def map_chunk(function, chunk):
+    """Apply a function to every item of a chunk (a ThreadMap task)."""
+    return [function(item) for item in chunk]
+
+
+class ThreadMap:
+    """Thread pool with the map and apply_async functions of a
+    multiprocessing.Pool.
+
+    Each map call splits its items into a few chunks of consecutive
+    items, one task per chunk, so threads aren't scheduled per item.
+
+    Parameters:
+    - workers: number of threads (default: number of CPUs)
+    - chunks: number of chunks per map call (default: one per thread)"""
+    def __init__(self, workers=None, chunks=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunks = chunks or self.workers
+        self.executor = ThreadPoolExecutor(self.workers)
+
+    def map(self, function, iterable):
+        """Apply a function to every item, in chunks, returning the
+        list of results in order."""
+        items = list(iterable)
+        size = max(-(-len(items) // self.chunks), 1)
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        results = self.executor.map(partial(map_chunk, function), chunks)
+        return list(chain.from_iterable(results))
+
+    def apply_async(self, function, args=(), callback=None,
+                    error_callback=None):
+        """Call a function on a thread, passing its result to callback,
+        or its exception to error_callback, from that thread."""
+        def done(future):
+            error = future.exception()
+            if error is None:
+                if callback:
+                    callback(future.result())
+            elif error_callback:
+                error_callback(error)
+
+        self.executor.submit(function, *args).add_done_callback(done)
+
+    def close(self):
+        """Wait for the pending tasks and stop the threads."""
+        self.executor.shutdown()
+
+
+@contextmanager
+def evaluation_backend(config):
+    """Create the evaluation backend described by a configuration.
+
+    The 'Backend' entry of the configuration is one of BACKENDS
+    ("processes" by default). The 'Workers' entry of the section named
+    after it ('Processes' or 'Threads') sets the number of processes or
+    threads (default: number of CPUs), and the 'Chunks' entry of the
+    'Threads' section the number of tasks of every map (default: one
+    per thread).
+
+    Pool workers ignore SIGINT, which stops the runs gracefully instead
+    (see budget.handle_signals).
+
+    Yields an object with map and apply_async methods, or None for the
+    serial backend, and stops the workers on exit."""
+    name = config.get('Backend', "processes")
+    backend_config = config.get(name.capitalize(), {})
+    workers = backend_config.get('Workers')
+    if name == "serial":
+        yield None
+    elif name == "threads":
+        backend = ThreadMap(workers, backend_config.get('Chunks'))
+        try:
+            yield backend
+        finally:
+            backend.close()
+    elif name == "processes":
+        with mp.Pool(workers, initializer=signal.signal,
+                     initargs=(signal.SIGINT, signal.SIG_IGN)) as pool:
+            yield pool
+    else:
+        raise ValueError("Unknown backend: {}".format(name))
+
+
+def use_backend(toolkit, backend):
+    """Make a toolkit evaluate fitnesses with a backend, unless it's
+    None (serial)."""
+    if backend is not None:
+        toolkit.map = backend.map
+        toolkit.apply_async = backend.apply_async
@@ -0,0 +1,215 @@
+"""Solve batches of cubes with a single configuration.
+
+Usage: python3 rubicon/batch.py CONFIG INSTANCES... [-j CORES] [-n SIDE]
+                                [-s SEED] [-o OUTPUT]
+
+Instances are given by:
+- cube files, in the format of inputs/inN/inN;
+- directories, searched recursively for cube files;
+- scramble corpora (.npz files) written by scramble.py;
+- manifests (.txt files), whose lines are cube file paths, relative to
+  the manifest, or scrambles, i.e. space-separated move names applied
+  to a solved cube of side SIDE (3 by default); blank lines and lines
+  starting with # are ignored.
+
+Every instance is a single run of the configuration's search engine,
+scheduled on a process pool whose workers keep their move and fitness
+tables across instances. One result row per instance is written to a
+CSV file as soon as it's solved."""
+
+import argparse
+import csv
+import datetime
+import json
+import multiprocessing as mp
+import os
+import random
+import time
+
+import rubikscube as rc
+import run_db
+from budget import Budget
+from cube_fitness import wrong_color_facelets
+from rubicon_toolkit import RubiconToolkit
+from runner import run_search
+from scramble import load_corpus
+
+RESULT_FIELDS = ("instance", "side", "solved", "fitness", "length", "gens",
+                 "stop", "evals", "seconds", "moves")
+
+
+def is_cube_file(path):
+    """Check whether a file starts like a cube file, with its side."""
+    try:
+        with open(path) as f:
+            return f.readline().strip().isdigit()
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def read_manifest(path, side=rc.SIDE):
+    """Read the instances listed in a manifest.
+
+    Parameters:
+    - path: path to the manifest
+    - side: side length of the cubes to which scrambles are applied
+
+    Returns a list of (name, facelet cube) tuples."""
+    base_dir = os.path.dirname(path)
+    instances = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            cube_path = os.path.join(base_dir, line)
+            if os.path.isfile(cube_path):
+                instances.append((cube_path, load_cube(cube_path)))
+                continue
+            moves = rc.move_names_to_ids(line, side)
+            name = "{}:{}".format(path, line_number)
+            instances.append((name, rc.apply_moves(rc.gen_cube(side), moves)))
+    return instances
+
+
+def load_cube(path):
+    """Read a flat facelet cube from a cube file, checking it."""
+    return rc.from_file(path, flatten=True, validate=True)
+
+
+def find_instances(paths, side=rc.SIDE):
+    """Collect the instances given on the command line.
+
+    Parameters:
+    - paths: cube files, directories, scramble corpora and manifests
+    - side: side length of the cubes to which scrambles are applied
+
+    Returns a list of (name, facelet cube) tuples."""
+    instances = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    cube_path = os.path.join(dirpath, filename)
+                    if is_cube_file(cube_path):
+                        instances.append((cube_path, load_cube(cube_path)))
+        elif path.endswith(".npz"):
+            instances.extend(load_corpus(path))
+        elif is_cube_file(path):
+            instances.append((path, load_cube(path)))
+        else:
+            instances.extend(read_manifest(path, side))
+    return instances
+
+
+def _solve_task(task):
+    """Solve a single instance inside a worker process.
+
+    Parameters:
+    - task: (name, facelet cube, config, seed) tuple
+
+    Returns a result dict with the RESULT_FIELDS."""
+    name, cube, config, seed = task
+    random.seed(seed)
+    start_time = time.time()
+
+    toolkit = RubiconToolkit(config, initial_cube=cube)
+    budget = Budget.from_config(config)
+    try:
+        _, stats = run_search(toolkit, verbose=False, budget=budget)
+    finally:
+        # the instance's cache isn't used by any other task
+        if toolkit.cache:
+            toolkit.cache.close()
+    fitness, best = stats['best']
+    best = toolkit.expand(best)
+
+    side = rc.cube_side(cube)
+    names = list(rc.move_table(side).moves)
+    final_cube = rc.apply_moves(cube, best)
+    return {
+        "instance": name,
+        "side": side,
+        "solved": wrong_color_facelets(final_cube) == 0,
+        "fitness": float(fitness),
+        "length": len(best),
+        "gens": stats['stop'].gen,
+        "stop": stats['stop'].reason,
+        "evals": budget.used_evals,
+        "seconds": time.time() - start_time,
+        "moves": " ".join(names[move] for move in best),
+    }
+
+
+def batch(config, instances, output_path, cores=None, verbose=True):
+    """Solve every instance of a batch.
+
+    Parameters:
+    - config: configuration object
+    - instances: list of (name, facelet cube) tuples
+    - output_path: path of the CSV file to which results are written
+    - cores: number of worker processes (default: all cores)
+    - verbose: if False, nothing is printed to stdout.
+
+    Returns the list of result dicts, in completion order."""
+    tasks = [(name, cube, config, random.getrandbits(32))
+             for name, cube in instances]
+    results = []
+    start_time = time.time()
+    with open(output_path, "w", newline="") as f, mp.Pool(cores) as pool:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        for result in pool.imap_unordered(_solve_task, tasks):
+            writer.writerow(result)
+            f.flush()
+            results.append(result)
+            if verbose:
+                print("{instance}: Fitness {fitness}, {length} moves, "
+                      "solved: {solved} ({seconds:.1f}s)".format(**result))
+
+    duration = time.time() - start_time
+    if verbose:
+        solved = sum(result['solved'] for result in results)
+        print("{} instances ({} solved) in {:.1f}s: {:.0f} instances/hour"
+              .format(len(results), solved, duration,
+                      len(results) / duration * 3600))
+    return results
+
+
+def main():
+    """Parse the command line and solve the batch."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("config", help="configuration JSON")
+    parser.add_argument("instances", nargs="+",
+                        help="cube files, directories, corpora and manifests")
+    parser.add_argument("-j", "--cores", type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument("-n", "--side", type=int, default=rc.SIDE,
+                        help="side length of the scrambled cubes")
+    parser.add_argument("-s", "--seed", type=int, default=None,
+                        help="seed for the runs' random seeds")
+    parser.add_argument("-o", "--output", default=None,
+                        help="CSV file to which results are written")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with open(args.config) as f:
+        config = json.load(f)
+
+    instances = find_instances(args.instances, args.side)
+
+    output_path = args.output
+    if output_path is None:
+        timestr = datetime.datetime.now().strftime("%Y%m%d-%Hh%Mm%Ss")
+        if not os.path.exists(run_db.RUNS_DIR):
+            os.makedirs(run_db.RUNS_DIR)
+        output_path = os.path.join(run_db.RUNS_DIR,
+                                   "batch-{}.csv".format(timestr))
+
+    batch(config, instances, output_path, args.cores)
+    print("Results written to", output_path)
+
+
+if __name__ == '__main__':
+    main()
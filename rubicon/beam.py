@@ -0,0 +1,202 @@
+"""Beam search engine, an alternative to ga.run_ga.
+
+Starting from the initial cube, every step expands each of the W best
+states by every move of the cube, except those which the canonical
+successor rules prune, scores all children at once with the same terms
+as rubicon_toolkit.combined_fitness, drops children seen before and
+keeps the best W. Every step is a few array operations over the whole
+beam, so its cost only depends on the beam width and the cube size."""
+
+import math
+import time
+from functools import lru_cache
+
+import numpy as np
+
+import rubikscube as rc
+from cube_fitness import piece_slots, right_colors, FACES
+from cubie_fitness import cubie_table
+from ga.ga import Record, StopRecord, stats_record
+from graph_fitness import distance_table
+
+BEAM_STATS = ("nodes", "node_rate")
+
+
+@lru_cache(maxsize=None)
+def move_layers(side=rc.SIDE):
+    """Find the axis and the layer turned by every move of a cube size.
+
+    Returns an (axes, layers) tuple of arrays, where layers are numbered
+    along their axis, from the first face of the axis to its opposite."""
+    # U/D, L/R and F/B axes
+    axis_of_face = np.array([0, 1, 2, 1, 2, 0])
+    reversed_face = np.array([False, False, False, True, True, True])
+    num_moves = len(rc.move_table(side).moves)
+    faces = np.arange(num_moves) // 3 % FACES
+    depths = np.arange(num_moves) // (3 * FACES)
+    layers = np.where(reversed_face[faces], side - 1 - depths, depths)
+    return axis_of_face[faces], layers
+
+
+@lru_cache(maxsize=None)
+def successor_table(side=rc.SIDE):
+    """Build the canonical successor rules of a cube size.
+
+    A move may not follow another move of the same layer, which could
+    be merged with it, nor a move of a later layer of the same axis,
+    with which it commutes, so every sequence of commuting moves is
+    only expanded in one order.
+
+    Returns a (moves + 1, moves) boolean array A, where A[i, j] tells
+    whether move j may follow move i. Its last row is for the initial
+    state, which may be followed by any move."""
+    axes, layers = move_layers(side)
+    allowed = ((axes[:, None] != axes[None, :]) |
+               (layers[:, None] < layers[None, :]))
+    return np.vstack([allowed, np.ones(len(axes), dtype=bool)])
+
+
+def batch_scores(cubes, cubie=False):
+    """Compute rubicon_toolkit.cube_scores for many cubes at once.
+
+    Parameters:
+    - cubes: (states, facelets) array of flat cubes of the same size
+    - cubie: whether to compute the cubie distances (0 otherwise)
+
+    Returns a (states, 4) integer array of scores."""
+    num_facelets = cubes.shape[1]
+    side = rc.cube_side(cubes[0])
+    positions = np.arange(num_facelets)
+    scores = np.zeros((len(cubes), 4), dtype=int)
+
+    slots = piece_slots(side)
+    classes = rc.move_table(side).piece_classes
+    scores[:, 0] = (classes[cubes[:, slots]] != classes[slots]).sum(axis=1)
+    scores[:, 1] = (cubes // (num_facelets // FACES) !=
+                    right_colors(num_facelets)).sum(axis=1)
+    scores[:, 2] = distance_table(side)[positions, cubes].sum(axis=1)
+    if cubie:
+        references, rows, distances = cubie_table(side)
+        inverse = np.empty_like(cubes)
+        inverse[np.arange(len(cubes))[:, None], cubes] = positions
+        scores[:, 3] = distances[rows, inverse[:, references]].sum(axis=1)
+    return scores
+
+
+def batch_fitness(cubes, length, cubie_weight=0):
+    """Compute rubicon_toolkit.combined_fitness for many cubes reached
+    by sequences of the same length.
+
+    Returns an array of fitnesses."""
+    scores = batch_scores(cubes, bool(cubie_weight))
+    fitnesses = (scores[:, 0] + scores[:, 1] / 2.4 + scores[:, 2] / 4.8 +
+                 math.log(length) / 30)
+    if cubie_weight:
+        fitnesses += cubie_weight * scores[:, 3]
+    return fitnesses
+
+
+def run_beam(toolkit, width, depth, verbose=True, budget=None):
+    """Runs a beam search from a toolkit's initial cube.
+
+    Parameters:
+    - toolkit: ga.Toolkit with the initial cube, whose report and stop
+               hooks are called after every step, as in ga.run_ga
+    - width: number of states kept after every step
+    - depth: maximum number of steps, i.e. of moves of the solutions
+    - verbose: if False, nothing is printed to stdout.
+    - budget: budget.Budget counting every scored child as an
+              evaluation
+
+    Returns the final beam as a list of (fitness, move list) tuples and
+    the stats, shaped as ga.run_ga's: every step is a generation, whose
+    'fitness' and 'size' records describe the beam, 'same' counts the
+    children dropped as already seen and 'improved' those kept which are
+    better than their parent. 'nodes' and 'node_rate' record the number
+    of children scored and how many were scored per second."""
+    initial_cube = toolkit.initial_cube
+    side = rc.cube_side(initial_cube)
+    perms = rc.move_table(side).perms
+    successors = successor_table(side)
+    cubie_weight = toolkit.config['GA'].get('CubieWeight', 0)
+
+    cubes = initial_cube[None, :]
+    last_moves = np.array([len(perms)])  # successor row of no move
+    fitnesses = batch_fitness(cubes, 1, cubie_weight)
+    paths = [[]]
+    hashes = rc.zobrist_hashes(cubes)
+    seen = np.sort(hashes)
+
+    stats = {key: list() for key in ("fitness", "size", "improved", "same")}
+    stats.update({key: list() for key in BEAM_STATS})
+    stats['stop'] = StopRecord(reason="max generations", gen=depth)
+    stats['best'] = None
+
+    best_history = []
+    for step in range(depth):
+        parents, moves = np.nonzero(successors[last_moves])
+        reason = budget.exhausted(len(parents)) if budget else None
+        if reason:
+            stats['stop'] = StopRecord(reason=reason, gen=step)
+            if verbose:
+                print("Stopping after {} steps: {}".format(step, reason))
+            break
+        start_time = time.perf_counter()
+
+        # new children of every state of the beam, told apart by their
+        # hashes before they're computed
+        child_hashes = rc.child_hashes(cubes, hashes, parents, moves)
+        child_hashes, first = np.unique(child_hashes, return_index=True)
+        new = ~np.isin(child_hashes, seen, assume_unique=True)
+        first = first[new]
+        child_hashes = child_hashes[new]
+        seen = np.union1d(seen, child_hashes)
+        if not len(first):
+            stats['stop'] = StopRecord(reason="no new states", gen=step)
+            break
+        children = cubes.ravel().take(parents[first, None] * cubes.shape[1] +
+                                      perms[moves[first]])
+        child_fitnesses = batch_fitness(children, step + 1, cubie_weight)
+        if budget:
+            budget.count(len(parents))
+
+        # best children
+        kept = np.argsort(child_fitnesses, kind="stable")[:width]
+        chosen = first[kept]
+        improved = int((child_fitnesses[kept] <
+                        fitnesses[parents[chosen]]).sum())
+        paths = [paths[parent] + [int(move)]
+                 for parent, move in zip(parents[chosen], moves[chosen])]
+        cubes = children[kept]
+        hashes = child_hashes[kept]
+        last_moves = moves[chosen]
+        fitnesses = child_fitnesses[kept]
+        elapsed = time.perf_counter() - start_time
+
+        fit_stats = stats_record(fitnesses)
+        stats['fitness'].append(fit_stats)
+        stats['size'].append(Record(min=step + 1, max=step + 1,
+                                    mean=step + 1, std=0))
+        stats['same'].append(len(parents) - len(first))
+        stats['improved'].append(improved)
+        stats['nodes'].append(len(parents))
+        stats['node_rate'].append(len(parents) / max(elapsed, 1e-9))
+        if verbose:
+            print("{}\tMin: {}, Avg: {}, Beam: {}, Nodes: {}, Nodes/s: {:.0f}"
+                  .format(step, fit_stats.min, fit_stats.mean, len(cubes),
+                          len(parents), stats['node_rate'][-1]))
+
+        if stats['best'] is None or fitnesses[0] < stats['best'][0]:
+            stats['best'] = (fitnesses[0], paths[0])
+        best_history.append(stats['best'][0])
+        toolkit.report(step, stats)
+        reason = toolkit.stop(best_history)
+        if reason:
+            stats['stop'] = StopRecord(reason=reason, gen=step + 1)
+            if verbose:
+                print("Stopping after {} steps: {}".format(step + 1, reason))
+            break
+
+    if stats['best'] is None:
+        stats['best'] = (fitnesses[0], paths[0])
+    return list(zip(fitnesses, paths)), stats
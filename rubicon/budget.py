@@ -0,0 +1,164 @@
+import signal
+import time
+
+from contextlib import contextmanager
+
+
+class Budget:
+    """Wall-clock and evaluation budget for a set of GA runs.
+
+    A budget may be split into smaller budgets (e.g. one per run),
+    which share their parent's consumption and interruption state.
+
+    Parameters:
+    - seconds: wall-clock budget, in seconds (None for no limit)
+    - evals: maximum number of fitness evaluations (None for no limit)
+    - parent: budget this one was split from, if any"""
+    def __init__(self, seconds=None, evals=None, parent=None):
+        self.seconds = seconds
+        self.evals = evals
+        self.parent = parent
+        self.start_time = time.monotonic()
+        self.used_evals = 0
+        self.phases = {}
+        self._interrupted = False
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a budget from a configuration's 'Budget' section.
+
+        Parameters:
+        - config: configuration object, whose optional 'Budget' section
+                  may have 'Seconds' and 'Evals' entries."""
+        budget_config = config.get('Budget', {})
+        return cls(seconds=budget_config.get('Seconds'),
+                   evals=budget_config.get('Evals'))
+
+    def elapsed(self):
+        """Wall-clock time since the budget was created, in seconds."""
+        return time.monotonic() - self.start_time
+
+    def remaining_seconds(self):
+        """Remaining wall-clock time, or None if unlimited."""
+        if self.seconds is None:
+            return None
+        return max(self.seconds - self.elapsed(), 0)
+
+    def remaining_evals(self):
+        """Remaining evaluations, or None if unlimited."""
+        if self.evals is None:
+            return None
+        return max(self.evals - self.used_evals, 0)
+
+    def count(self, evals):
+        """Record fitness evaluations against this budget and its
+        parents."""
+        self.used_evals += evals
+        if self.parent:
+            self.parent.count(evals)
+
+    def interrupt(self):
+        """Mark the budget, and every budget split from the same root,
+        as interrupted."""
+        if self.parent:
+            self.parent.interrupt()
+        else:
+            self._interrupted = True
+
+    @property
+    def interrupted(self):
+        """Whether the budget's root has been interrupted."""
+        if self.parent:
+            return self.parent.interrupted
+        return self._interrupted
+
+    def exhausted(self, next_evals=0):
+        """Check whether the budget is used up.
+
+        Parameters:
+        - next_evals: number of evaluations about to be performed;
+                      the budget is exhausted if they don't fit in it.
+
+        Returns a string with the reason why the budget is exhausted,
+        or None if it isn't."""
+        if self.interrupted:
+            return "interrupted"
+        remaining = self.remaining_seconds()
+        if remaining is not None and remaining <= 0:
+            return "time budget"
+        remaining = self.remaining_evals()
+        if remaining is not None and (remaining <= 0 or
+                                      next_evals > remaining):
+            return "evaluation budget"
+        if self.parent:
+            return self.parent.exhausted(next_evals)
+        return None
+
+    def split(self, parts):
+        """Create a budget for the next of several equal parts of the
+        remaining budget.
+
+        Parameters:
+        - parts: number of parts the remaining budget is divided into
+
+        Returns the new budget."""
+        seconds = self.remaining_seconds()
+        evals = self.remaining_evals()
+        return Budget(seconds=None if seconds is None else seconds / parts,
+                      evals=None if evals is None else evals // parts,
+                      parent=self)
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager recording the time spent in a named phase,
+        in this budget and its parents."""
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start_time
+            budget = self
+            while budget:
+                budget.phases[name] = budget.phases.get(name, 0) + elapsed
+                budget = budget.parent
+
+    def report(self):
+        """Describe the budget's consumption in a single line."""
+        seconds = "{:.2f}s".format(self.elapsed())
+        if self.seconds is not None:
+            seconds += " of {:.2f}s".format(self.seconds)
+        evals = str(self.used_evals)
+        if self.evals is not None:
+            evals += " of {}".format(self.evals)
+        phases = ", ".join("{} {:.2f}s".format(name, elapsed)
+                           for name, elapsed in self.phases.items())
+        return "Budget used: {} ({}), {} evaluations".format(seconds, phases,
+                                                             evals)
+
+
+@contextmanager
+def handle_signals(budget, signals=(signal.SIGINT, signal.SIGTERM)):
+    """Interrupt a budget, instead of exiting, on SIGINT or SIGTERM.
+
+    Runs using the budget stop at the end of the current generation,
+    so their best individuals are still returned and logged. Outside of
+    the main thread, signals can't be handled, and nothing is done.
+
+    Parameters:
+    - budget: Budget to be interrupted
+    - signals: signals which interrupt the budget"""
+    def handler(signum, frame):
+        print("Received signal {}, stopping".format(signum))
+        budget.interrupt()
+
+    previous = {}
+    try:
+        for signum in signals:
+            previous[signum] = signal.signal(signum, handler)
+    except ValueError:
+        pass  # not in the main thread
+    try:
+        yield budget
+    finally:
+        for signum, previous_handler in previous.items():
+            signal.signal(signum, previous_handler)
@@ -0,0 +1,137 @@
+"""Thin client for the solve server (see server.py).
+
+Usage: python3 rubicon/client.py [-s SOCKET] CONFIG [-c CUBE | -f FACELETS]
+                                 [-r RUN_DIR] [-q]
+       python3 rubicon/client.py [-s SOCKET] --cancel JOB | --status
+                                 | --shutdown
+
+Submits a solve job and prints its progress and result. The cube is
+read from the configuration, unless a cube file or a facelet string is
+given. On Ctrl-C, the job is cancelled and its best individual so far
+is still printed."""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+from protocol import SOCKET_PATH, send, receive
+
+
+def request(path, message):
+    """Send a request to the server.
+
+    Parameters:
+    - path: path of the server's socket
+    - message: request message
+
+    Returns a (socket, rfile, wfile) tuple for reading the replies."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    rfile = sock.makefile("rb")
+    wfile = sock.makefile("wb")
+    send(wfile, message)
+    return sock, rfile, wfile
+
+
+def solve(path, config, run_dir=None, verbose=True):
+    """Submit a solve job and wait for its result.
+
+    Parameters:
+    - path: path of the server's socket
+    - config: configuration object, with absolute paths
+    - run_dir: directory to which the server should log the run
+    - verbose: if False, progress messages aren't printed.
+
+    Returns the result message, or None if the job failed."""
+    solve_request = {"config": config}
+    if run_dir:
+        solve_request['run_dir'] = os.path.abspath(run_dir)
+    sock, rfile, _ = request(path, {"solve": solve_request})
+    job_id = None
+    with sock:
+        while True:
+            try:
+                message = receive(rfile)
+            except KeyboardInterrupt:
+                if job_id is not None:
+                    cancel_sock, cancel_rfile, _ = request(
+                        path, {"cancel": job_id})
+                    with cancel_sock:
+                        receive(cancel_rfile)
+                    print("Cancelled job", job_id)
+                continue
+
+            if message is None:
+                print("Connection closed by the server", file=sys.stderr)
+                return None
+            if 'job' in message:
+                job_id = message['job']
+            elif 'progress' in message:
+                if verbose:
+                    progress = message['progress']
+                    print("{gen}\tMin: {min}, Avg: {mean}, Avg size: {size}, "
+                          "Best: {best}, Evals: {evals}".format(**progress))
+            elif 'result' in message:
+                return message['result']
+            elif 'error' in message:
+                print("Error:", message['error'], file=sys.stderr)
+                return None
+
+
+def main():
+    """Parse the command line and send the request."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("config", nargs="?",
+                        help="configuration JSON of the solve job")
+    parser.add_argument("-s", "--socket", default=SOCKET_PATH,
+                        help="path of the server's Unix socket")
+    parser.add_argument("-c", "--cube", default=None,
+                        help="cube file, instead of Rubiks.InitialPath")
+    parser.add_argument("-f", "--facelets", default=None,
+                        help="facelet string (see rc.from_string)")
+    parser.add_argument("-r", "--run-dir", default=None,
+                        help="directory to which the run is logged")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="don't print the progress")
+    parser.add_argument("--cancel", type=int, default=None,
+                        help="cancel a job")
+    parser.add_argument("--status", action="store_true",
+                        help="list the running jobs")
+    parser.add_argument("--shutdown", action="store_true",
+                        help="stop the server")
+    args = parser.parse_args()
+
+    for flag, message in ((args.cancel is not None, {"cancel": args.cancel}),
+                          (args.status, {"status": True}),
+                          (args.shutdown, {"shutdown": True})):
+        if flag:
+            sock, rfile, _ = request(args.socket, message)
+            with sock:
+                print(json.dumps(receive(rfile), indent=4))
+            return
+
+    if not args.config:
+        parser.error("a configuration is required to solve")
+    with open(args.config) as f:
+        config = json.load(f)
+    rubiks = config.setdefault('Rubiks', {})
+    if args.facelets:
+        rubiks['Facelets'] = args.facelets
+    elif args.cube:
+        rubiks['InitialPath'] = args.cube
+    if 'InitialPath' in rubiks:
+        # the server may run in another directory
+        rubiks['InitialPath'] = os.path.abspath(rubiks['InitialPath'])
+
+    result = solve(args.socket, config, args.run_dir, not args.quiet)
+    if result is None:
+        sys.exit(1)
+    print("Job {job}: Fitness {fitness} after {gens} generations "
+          "({stop}), {evals} evaluations in {seconds:.2f}s".format(**result))
+    print("Best:", result['moves'])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
-from rubikscube import piece_iter, gen_3d_cube
+from functools import lru_cache
+
+import numpy as np
+
+from rubikscube import piece_iter, move_table, cube_side
 
 
-SIDE = 3
 FACES = 6
 
 
@@ -9,11 +12,12 @@ def facelet_to_color(cube):
     """Convert a facelet cube into a color-coded cube.
 
     Parameters:
-    - cube: flat array Rubik's Cube with integers from 0 to 53
+    - cube: flat array Rubik's Cube with integers from 0 to
+            6 * side ** 2 - 1
 
     Returns an array with integers from 0 to 5, in reference to each
     of the six colors/faces."""
-    return cube // (SIDE * SIDE)
+    return cube // (len(cube) // FACES)
 
 
 def wrong_color_facelets(cube):
@@ -23,27 +27,41 @@ def wrong_color_facelets(cube):
     - cube: flat array Rubik's Cube
 
     Returns the number of wrong color facelets in the cube."""
-    color_cube = facelet_to_color(cube)
-    total = 0
-    for right_color, face in enumerate(color_cube.reshape(FACES, SIDE * SIDE)):
-        total += sum(face != right_color)
-    return total
+    face_area = len(cube) // FACES
+    return int((cube // face_area != right_colors(len(cube))).sum())
+
 
-_perfect_cube = gen_3d_cube()
+@lru_cache(maxsize=None)
+def right_colors(num_facelets):
+    """Color of every position of a solved cube with a number of
+    facelets."""
+    return np.arange(num_facelets) // (num_facelets // FACES)
+
+
+@lru_cache(maxsize=None)
+def piece_slots(side):
+    """Find the first facelet of every piece position of a cube size.
+
+    Parameters:
+    - side: side length of the cube
+
+    Returns an array of flat facelet indices, one per piece."""
+    shape = (FACES, side, side)
+    return np.array([np.ravel_multi_index(index, shape)[0]
+                     for index in piece_iter(side)])
 
 
 def wrong_cubelets(cube):
     """Count the number of wrongly positioned cubelets in the cube.
 
+    A cubelet is wrongly positioned if its position doesn't hold it, or
+    an identical one, in any orientation.
+
     Parameters:
     - cube: flat array Rubik's Cube
 
     Returns the number of wrongly positioned cubelets in the cube."""
-    cube = cube.reshape(FACES, SIDE, SIDE)
-    total = 0
-    for index in piece_iter():
-        if not sorted(cube[index]) == sorted(_perfect_cube[index]):
-            total += 1
-    return total
-
-
+    side = cube_side(cube)
+    slots = piece_slots(side)
+    classes = move_table(side).piece_classes
+    return int((classes[cube[slots]] != classes[slots]).sum())
@@ -0,0 +1,108 @@
+"""Cubie-level distance heuristic.
+
+Each movable cubie (the 8 corners and 12 edges of a 3x3x3, plus the
+movable centers of larger cubes) has a state given by its position and
+orientation, which is determined by the position of any one of its
+facelets, its reference facelet. The minimum number of moves taking a
+cubie from each state back to its home position, correctly oriented, is
+precomputed by a BFS over the positions of its reference facelet, and
+the heuristic of a cube is the sum of these distances over all movable
+cubies.
+
+Unlike graph_fitness.solution_distance, which sums the distance of
+every facelet, each cubie is counted once, regardless of how many
+facelets it has."""
+
+from functools import lru_cache
+
+import numpy as np
+
+import rubikscube as rc
+
+
+def reference_facelets(side=rc.SIDE):
+    """Choose the reference facelet of every movable cubie.
+
+    The reference facelet of a cubie is the one with the smallest
+    facelet class (see rc.move_table), so identical cubies have
+    interchangeable reference facelets.
+
+    Parameters:
+    - side: side length of the cube
+
+    Returns an array of flat facelet indices, one per movable cubie."""
+    table = rc.move_table(side)
+    references = []
+    for index in rc.piece_iter(side):
+        facelets = np.ravel_multi_index(index, (rc.FACES, side, side))
+        if (table.perms[:, facelets] == facelets).all():
+            continue  # fixed center
+        references.append(facelets[np.argmin(
+            table.facelet_classes[facelets])])
+    return np.array(references)
+
+
+def cubie_distances(side=rc.SIDE):
+    """Compute the distance of every state of every movable cubie.
+
+    Parameters:
+    - side: side length of the cube
+
+    Returns a (cubies, facelets) array D, where D[h, p] is the minimum
+    number of moves taking cubie h (or an identical one) to its solved
+    state, when its reference facelet is at position p (-1 if it can't
+    be)."""
+    table = rc.move_table(side)
+    references = reference_facelets(side)
+    # a move puts the facelet at position perms[m, i] into position i
+    inverse_perms = np.argsort(table.perms, axis=1)
+    distances = np.full((len(references), table.perms.shape[1]), -1)
+
+    for cubie, reference in enumerate(references):
+        # the set of moves is closed under inversion, so distances from
+        # the solved state are also distances to it
+        frontier = np.array([reference])
+        distance = 0
+        while len(frontier):
+            distances[cubie, frontier] = distance
+            reached = np.unique(inverse_perms[:, frontier])
+            frontier = reached[distances[cubie, reached] < 0]
+            distance += 1
+
+    classes = table.facelet_classes[references]
+    for label in np.unique(classes):
+        identical = classes == label
+        if identical.sum() > 1:
+            distances[identical] = distances[identical].min(axis=0)
+
+    return distances
+
+
+@lru_cache(maxsize=None)
+def cubie_table(side=rc.SIDE):
+    """Build the lookup tables of a cube size, once.
+
+    Parameters:
+    - side: side length of the cube
+
+    Returns a (references, rows, distances) tuple, with the reference
+    facelets, the indices of the cubies and their distances."""
+    references = reference_facelets(side)
+    return references, np.arange(len(references)), cubie_distances(side)
+
+
+def cubie_distance(cube):
+    """Compute the cubie distance of a cube.
+
+    The cubie distance is the sum, for all movable cubies, of the
+    minimum number of moves taking the cubie to its solved position
+    and orientation.
+
+    Parameters:
+    - cube: flat array Rubik's Cube
+
+    Returns the cubie distance."""
+    references, rows, distances = cubie_table(rc.cube_side(cube))
+    positions = np.empty_like(cube)
+    positions[cube] = np.arange(len(cube))
+    return int(distances[rows, positions[references]].sum())
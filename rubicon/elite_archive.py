@@ -0,0 +1,133 @@
+"""Archive of the best individuals found for an instance, across runs.
+
+The archive keeps the best individuals of every run on an instance whose
+final cubes are all different, so it isn't taken over by copies of one
+solution which only differ in moves that cancel out. Individuals are
+stored as primitive moves, which are valid genes of any macro library
+(see rubikscube.MacroLibrary), along with their exact fitness as such in
+the run which found them (see runner.archive_run).
+
+Archives are saved as compressed .npz files named after a hash of the
+instance (see fitness_cache.instance_hash), with every individual's
+moves concatenated into a single small integer array. Saving merges the
+archive with the file's current contents, so runs in other processes
+don't overwrite each other's individuals."""
+
+import os
+import tempfile
+
+import numpy as np
+
+import rubikscube as rc
+from fitness_cache import instance_hash
+
+
+def archive_path(archive_dir, initial_cube):
+    """Build the path of an instance's archive in a directory."""
+    return os.path.join(archive_dir, "{}.npz".format(
+        instance_hash(initial_cube)[:16]))
+
+
+def read_archive(path):
+    """Read an archive file written by EliteArchive.save.
+
+    Returns a list of (fitness, individual, state hash) tuples."""
+    with np.load(path) as data:
+        fitnesses = data['fitnesses'].tolist()
+        inds = np.split(data['moves'].astype(int),
+                        np.cumsum(data['lengths'])[:-1])
+        hashes = data['hashes'].tolist()
+    return [(fitness, ind.tolist(), state_hash)
+            for fitness, ind, state_hash in zip(fitnesses, inds, hashes)]
+
+
+class EliteArchive:
+    """Best individuals with distinct final cubes found for an instance.
+
+    Parameters:
+    - initial_cube: flat facelet cube of the instance
+    - size: maximum number of individuals
+    - path: file from which the archive is read, if it exists, and to
+            which it's saved (see archive_path); None to keep it in
+            memory"""
+    def __init__(self, initial_cube, size=50, path=None):
+        self.initial_cube = np.asarray(initial_cube)
+        self.size = size
+        self.path = path
+        self.entries = []  # (fitness, individual, state hash), best first
+        if path and os.path.exists(path):
+            self.entries = self._merge(read_archive(path))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _merge(self, entries):
+        """Merge entries into the archive's, keeping the best individual
+        of every final cube, shortest first on ties.
+
+        Returns the merged list of entries, best first."""
+        merged = []
+        seen = set()
+        for entry in sorted(self.entries + entries,
+                            key=lambda entry: (entry[0], len(entry[1]))):
+            if entry[2] not in seen:
+                seen.add(entry[2])
+                merged.append(entry)
+                if len(merged) == self.size:
+                    break
+        return merged
+
+    def best(self, count, max_size=None):
+        """Get the best individuals of the archive.
+
+        Parameters:
+        - count: maximum number of individuals
+        - max_size: maximum length of the individuals, longer ones
+                    being skipped
+
+        Returns a list of individuals, best first."""
+        inds = [ind for _, ind, _ in self.entries
+                if max_size is None or len(ind) <= max_size]
+        return inds[:count]
+
+    def add(self, fit_and_pop):
+        """Add a run's individuals to the archive.
+
+        Parameters:
+        - fit_and_pop: list of (fitness, individual) tuples, with the
+                       individuals as primitive moves"""
+        fit_and_pop = [(float(fitness), list(ind))
+                       for fitness, ind in fit_and_pop]
+        if not fit_and_pop:
+            return
+        cubes = np.array([rc.apply_moves(self.initial_cube, ind)
+                          for _, ind in fit_and_pop])
+        hashes = rc.zobrist_hashes(cubes).tolist()
+        self.entries = self._merge([
+            (fitness, ind, state_hash)
+            for (fitness, ind), state_hash in zip(fit_and_pop, hashes)])
+
+    def save(self):
+        """Save the archive to its file, merged with the file's current
+        contents. The file is replaced at once, so readers never see a
+        partial archive."""
+        if not self.path:
+            return
+        if os.path.exists(self.path):
+            self.entries = self._merge(read_archive(self.path))
+        archive_dir = os.path.dirname(self.path) or "."
+        if not os.path.exists(archive_dir):
+            os.makedirs(archive_dir)
+
+        lengths = [len(ind) for _, ind, _ in self.entries]
+        moves = [move for _, ind, _ in self.entries for move in ind]
+        fd, tmp_path = tempfile.mkstemp(suffix=".npz", dir=archive_dir)
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(
+                f,
+                fitnesses=np.array([entry[0] for entry in self.entries]),
+                lengths=np.array(lengths, dtype=np.uint16),
+                moves=np.array(moves, dtype=np.uint16),
+                hashes=np.array([entry[2] for entry in self.entries],
+                                dtype=np.uint64))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,236 @@
+"""Fitness cache shared by every process evaluating the same instance.
+
+The cache maps cube states to the terms of their fitness which don't
+depend on the individual (see rubicon_toolkit.cube_scores). It's a
+fixed-size, direct-mapped hash table in a memory-mapped .npy file, so
+pool workers, which evaluate individuals of every run of an instance,
+attach to the same table by its path.
+
+Every slot holds two 64-bit words: the packed scores of a state and
+their XOR with the state's hash. Each word is written atomically, and
+a reader only accepts a slot whose words XOR to the hash it's looking
+up, so no locks are needed: a slot being written by another process
+reads as a miss. A new state always replaces the slot's previous one.
+
+Hits and misses are counted in a header of per-thread stripes, and
+reported in the run logs to help size the table."""
+
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+
+from multiprocessing.util import Finalize
+
+import numpy as np
+
+STRIPES = 64  # header rows of hit and miss counters
+SCORE_BITS = 16
+SCORE_MASK = (1 << SCORE_BITS) - 1
+NUM_SCORES = 4
+
+_attached = collections.OrderedDict()  # path -> table, in each process
+MAX_ATTACHED = 8
+
+
+def instance_hash(cube):
+    """Hash a cube's facelets, e.g. to name the cache of an instance."""
+    return hashlib.sha1(np.ascontiguousarray(cube).tobytes()).hexdigest()
+
+
+def pack_scores(scores):
+    """Pack up to NUM_SCORES small non-negative integers into a word.
+
+    Returns the packed word, or None if a score doesn't fit."""
+    value = 0
+    for i, score in enumerate(scores):
+        if not 0 <= score <= SCORE_MASK:
+            return None
+        value |= score << (i * SCORE_BITS)
+    return value
+
+
+def unpack_scores(value):
+    """Unpack a word packed by pack_scores into a tuple of scores."""
+    return tuple((value >> (i * SCORE_BITS)) & SCORE_MASK
+                 for i in range(NUM_SCORES))
+
+
+def _open_table(path, slots=None):
+    """Map a cache file, creating or resizing it if needed.
+
+    Parameters:
+    - path: path of the .npy file
+    - slots: number of slots of the table (None to attach to an
+             existing file without checking it)
+
+    Returns the memory-mapped (STRIPES + slots, 2) uint64 array."""
+    shape = None if slots is None else (STRIPES + slots, 2)
+    if os.path.exists(path) and os.path.getsize(path):
+        try:
+            table = np.load(path, mmap_mode="r+")
+            if shape is None or (table.shape == shape and
+                                 table.dtype == np.uint64):
+                return table
+        except ValueError:
+            pass  # not a cache file, overwritten below
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint64,
+                                     shape=shape)
+
+
+def _attach(path):
+    """Map a cache file once per process, keeping the latest ones."""
+    table = _attached.pop(path, None)
+    if table is None:
+        table = _open_table(path)
+    _attached[path] = table
+    while len(_attached) > MAX_ATTACHED:
+        _attached.popitem(last=False)
+    return table
+
+
+def _remove(pid, table, path, delete):
+    """Flush or delete the cache file of a table, in its creator."""
+    if os.getpid() != pid:
+        return  # a forked copy of the creator's cache
+    if delete:
+        _attached.pop(path, None)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    else:
+        table.flush()
+
+
+class FitnessCache:
+    """Lossy state -> scores table shared through a memory-mapped file.
+
+    Pickled caches, e.g. in fitness functions sent to pool workers,
+    attach to the creator's file instead of copying the table.
+
+    Parameters:
+    - slots: number of slots, rounded up to a power of 2
+    - path: .npy file of a persistent cache, reused if it exists with
+            the same number of slots. By default, the table is stored
+            in a temporary file, deleted with the cache, which should
+            be closed when it's no longer used (see close)."""
+    def __init__(self, slots=1 << 20, path=None):
+        slots = 1 << max(int(slots) - 1, 1).bit_length()
+        delete = path is None
+        if delete:
+            shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+            fd, path = tempfile.mkstemp(prefix="rubicon-cache-",
+                                        suffix=".npy", dir=shm_dir)
+            os.close(fd)
+        else:
+            cache_dir = os.path.dirname(path)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+        self.path = path
+        self.slots = slots
+        self._set_table(_open_table(path, slots))
+        # saved tables keep counting across caches
+        self.initial_counts = self.counts()
+        # run at exit by multiprocessing too, in pool workers which end
+        # without running atexit handlers
+        self._finalizer = Finalize(self, _remove, exitpriority=0,
+                                   args=(os.getpid(), self._table, path,
+                                         delete))
+
+    def _set_table(self, table):
+        self._table = table
+        self._words = memoryview(table).cast("B").cast("Q")
+        self._mask = self.slots - 1
+
+    def __getstate__(self):
+        return {"path": self.path, "slots": self.slots}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.slots = state['slots']
+        self._set_table(_attach(self.path))
+        self.initial_counts = (0, 0)
+        self._finalizer = None
+
+    def key(self, cube, variant=0):
+        """Hash a cube state, with a variant of the cached scores.
+
+        Parameters:
+        - cube: flat array Rubik's Cube
+        - variant: small integer telling apart different sets of scores
+                   of the same state
+
+        Returns a non-zero 64-bit hash."""
+        digest = hashlib.blake2b(cube.tobytes(), digest_size=8,
+                                 salt=bytes([variant]))
+        return int.from_bytes(digest.digest(), "little") or 1
+
+    def lookup(self, cube, variant=0):
+        """Look up the scores of a cube state.
+
+        Parameters:
+        - cube: flat array Rubik's Cube
+        - variant: variant of the scores (see key)
+
+        Returns a (key, scores) tuple, where scores is None on a miss.
+        The key is then used to store the computed scores."""
+        key = self.key(cube, variant)
+        words = self._words
+        index = 2 * (STRIPES + (key & self._mask))
+        value = words[index + 1]
+        # native thread ids are unique across processes, and the main
+        # thread's is its process id
+        stripe = 2 * (threading.get_native_id() % STRIPES)
+        if words[index] ^ value == key:
+            words[stripe] += 1
+            return key, unpack_scores(value)
+        words[stripe + 1] += 1
+        return key, None
+
+    def store(self, key, scores):
+        """Store the scores of a cube state, replacing its slot.
+
+        Parameters:
+        - key: hash of the state, returned by lookup
+        - scores: up to NUM_SCORES integers from 0 to 65535; scores out
+                  of range aren't stored."""
+        value = pack_scores(scores)
+        if value is None:
+            return
+        index = 2 * (STRIPES + (key & self._mask))
+        self._words[index + 1] = value
+        self._words[index] = key ^ value
+
+    def counts(self):
+        """Total hits and misses of every process, as a tuple."""
+        hits, misses = self._table[:STRIPES].sum(axis=0)
+        return int(hits), int(misses)
+
+    def used_slots(self):
+        """Number of slots holding a state."""
+        return int(np.count_nonzero(self._table[STRIPES:, 0]))
+
+    def report(self, since=None):
+        """Describe the cache's hit rate and occupancy in a single line.
+
+        Parameters:
+        - since: (hits, misses) counts to be subtracted, e.g. the counts
+                 at the start of a run (default: the counts when the
+                 cache was created)"""
+        if since is None:
+            since = self.initial_counts
+        hits, misses = (now - before
+                        for now, before in zip(self.counts(), since))
+        lookups = hits + misses
+        used = self.used_slots()
+        return ("Fitness cache: {} hits of {} lookups ({:.1%}), "
+                "{} of {} slots used ({:.1%})".format(
+                    hits, lookups, hits / lookups if lookups else 0,
+                    used, self.slots, used / self.slots))
+
+    def close(self):
+        """Flush a persistent cache, or delete a temporary one."""
+        if self._finalizer:
+            self._finalizer()
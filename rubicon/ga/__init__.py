@@ -1,3 +1,4 @@
 from . import operators
 from .toolkit import Toolkit
-from .ga import run_ga, summarize_stats
+from .ga import run_ga, summarize_stats, evaluate, FitnessBound
+from .steady import run_steady
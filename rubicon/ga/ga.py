@@ -1,9 +1,16 @@
+import time
 from enum import Enum
 from collections import namedtuple
+from functools import partial
+from itertools import zip_longest
 import numpy as np
 import rubikscube as rc
 
 Record = namedtuple('Record', ('min', 'max', 'mean', 'std'))
+StopRecord = namedtuple('StopRecord', ('reason', 'gen'))
+
+# stats entries which describe the whole run instead of each generation
+RUN_STATS = ('stop', 'best')
 
 def stats_record(entries):
     """Create a stats Record from a list of entries of the stat.
@@ -17,6 +24,69 @@ def stats_record(entries):
                   mean=np.mean(entries), std=np.std(entries))
 
 
+class FitnessBound(float):
+    """Lower bound of an individual's fitness, which the fitness
+    function of a lazy toolkit (see Toolkit.lazy) may return instead of
+    the exact fitness when the bound is at least the given cutoff."""
+    __slots__ = ()
+
+
+def lazy_fitness(ind_and_cutoff, fitness):
+    """Evaluate an (individual, cutoff) pair (see evaluate)."""
+    ind, cutoff = ind_and_cutoff
+    return fitness(ind, cutoff=cutoff)
+
+
+def evaluate(toolkit, inds, cutoffs=None):
+    """Evaluate individuals with a single toolkit.map call.
+
+    Parameters:
+    - toolkit: ga.Toolkit with the fitness function
+    - inds: list of individuals
+    - cutoffs: cutoff of each individual, from which the fitness
+               function may return a FitnessBound, if the toolkit is
+               lazy (ignored otherwise)
+
+    Returns an array of fitnesses and a boolean array telling which of
+    them are bounds, which are added to toolkit.skipped_evals."""
+    if not toolkit.lazy or cutoffs is None:
+        fitnesses = np.array(list(toolkit.map(toolkit.fitness, inds)))
+        return fitnesses, np.zeros(len(inds), dtype=bool)
+    fitnesses = list(toolkit.map(partial(lazy_fitness,
+                                         fitness=toolkit.fitness),
+                                 list(zip(inds, cutoffs))))
+    bounded = np.array([isinstance(fitness, FitnessBound)
+                        for fitness in fitnesses], dtype=bool)
+    toolkit.skipped_evals += int(bounded.sum())
+    return np.array(fitnesses, dtype=float), bounded
+
+
+def _evaluate_generation(toolkit, pop, prev_fitnesses):
+    """Evaluate a new generation, lazily if the toolkit is.
+
+    The cutoff of the previous generation (see Toolkit.cutoff) is
+    used as an estimate of the new one's. Individuals bounded above it
+    are then evaluated exactly, unless the new generation's exact
+    fitnesses rule them out of selection too, so bounds are only kept
+    for individuals which can't be selected.
+
+    Returns the array of fitnesses."""
+    cutoff = toolkit.cutoff(prev_fitnesses) if toolkit.lazy else None
+    if cutoff is None:
+        return np.array(list(toolkit.map(toolkit.fitness, pop)))
+    fitnesses, bounded = evaluate(toolkit, pop, [cutoff] * len(pop))
+    if not bounded.any():
+        return fitnesses
+
+    cutoff = toolkit.cutoff(np.where(bounded, np.inf, fitnesses))
+    unsure = bounded if cutoff is None else bounded & (fitnesses < cutoff)
+    unsure = np.nonzero(unsure)[0]
+    if len(unsure):
+        fitnesses[unsure], _ = evaluate(toolkit, [pop[i] for i in unsure])
+        toolkit.skipped_evals -= len(unsure)
+    return fitnesses
+
+
 def count_repeated(pop):
     """Counts the number of repeated individuals in a population.
 
@@ -48,69 +118,177 @@ def count_improved(prev_fitnesses, fitnesses):
     return sum(fitnesses < prev_fitnesses)
 
 
-def run_ga(pop, generations, toolkit, verbose=True):
+PHASES = ("select", "vary", "eval", "stats", "log")
+INSTRUMENT_STATS = tuple("time_" + phase for phase in PHASES) + ("evals",
+                                                                 "moves")
+
+
+def _no_clock():
+    """Stand-in for the monotonic clock when instrumentation is off."""
+    return 0
+
+
+def _best_of(fitnesses, pop, best):
+    """Update the best (fitness, individual) pair found so far."""
+    i = np.argmin(fitnesses)
+    if best is None or fitnesses[i] < best[0]:
+        return fitnesses[i], pop[i]
+    return best
+
+
+def run_ga(pop, generations, toolkit, verbose=True, instrument=False,
+           budget=None):
     """Runs a genetic algorithm.
 
     Parameters:
     - pop: initial population
     - generations: number of generations the GA should run for
     - toolkit: ga.Toolkit which implements select, best, vary operators
-               and a fitness function."""
+               and a fitness function.
+    - instrument: if True, the time spent in each phase of every
+                  generation (see PHASES) and the number of evaluations
+                  and moves applied are added to the stats.
+    - budget: object with count(evals) and exhausted(next_evals)
+              methods (see budget.Budget); the GA stops before any
+              generation for which exhausted returns a reason.
+
+    If the toolkit is lazy, individuals which can't be selected may
+    keep a FitnessBound instead of their fitness, and the number of
+    full evaluations avoided in every generation is recorded in the
+    'skipped' stats.
+
+    After every generation is evaluated, toolkit.refine may improve
+    its individuals, e.g. by local search. toolkit.report is called
+    with the stats at the end of every generation. The GA stops early
+    if toolkit.stop returns a reason to stop. The reason and the number
+    of generations run are recorded in the 'stop' entry of the stats as
+    a StopRecord, and the best individual found in any generation in
+    its 'best' entry, as a (fitness, individual) pair.
+
+    Returns the final population as a list of (fitness, individual)
+    tuples, and the stats."""
+    for fitnesses, pop, stats in ga_steps(pop, generations, toolkit,
+                                          verbose, instrument, budget):
+        pass
+    return list(zip(fitnesses, pop)), stats
+
+
+def ga_steps(pop, generations, toolkit, verbose=True, instrument=False,
+             budget=None):
+    """Runs a genetic algorithm one generation at a time, as run_ga.
+
+    A generator which yields the fitnesses, population and stats of the
+    run once the initial population is evaluated, and after every
+    generation, so runs may be paused between generations (e.g. to race
+    them, see runner.race). The stats are updated in place, and their
+    'stop' entry is only final once the generator is exhausted."""
+    clock = time.perf_counter if instrument else _no_clock
+
     fitnesses = np.array(list(toolkit.map(toolkit.fitness, pop)))
+    if budget:
+        budget.count(len(pop))
     stats = {key: list() for key in ("fitness", "size", "improved", "same")}
-
+    if instrument:
+        stats.update({key: list() for key in INSTRUMENT_STATS})
+    if toolkit.lazy:
+        stats['skipped'] = []
+    stats['stop'] = StopRecord(reason="max generations", gen=generations)
+    stats['best'] = _best_of(fitnesses, pop, None)
+    yield fitnesses, pop, stats
+
+    best_history = []
     for gen in range(generations):
+        skipped_evals = toolkit.skipped_evals
+        reason = budget.exhausted(len(pop)) if budget else None
+        if reason:
+            stats['stop'] = StopRecord(reason=reason, gen=gen)
+            if verbose:
+                print("Stopping after {} generations: {}".format(gen, reason))
+            break
+
+        t_select = clock()
         fit_and_pop = list(zip(fitnesses, pop))
         fit_and_offspring = toolkit.select(fit_and_pop)
         best = toolkit.best(fit_and_pop)
 
-        _, offspring = zip(*fit_and_offspring)
+        parent_fitnesses, offspring = zip(*fit_and_offspring)
 
         if best:
             _, best = zip(*best)
         else:
             best = tuple()
 
+        t_vary = clock()
         offspring = toolkit.vary(offspring)
 
         pop = offspring + list(best)
 
+        t_eval = clock()
         prev_fitnesses = fitnesses
-        fitnesses = np.array(list(toolkit.map(toolkit.fitness, pop)))
+        fitnesses = _evaluate_generation(toolkit, pop, prev_fitnesses)
+        if budget:
+            budget.count(len(pop))
+
+        t_stats = clock()
+        adapt_stats = toolkit.adapt(parent_fitnesses,
+                                    fitnesses[:len(offspring)])
+        for key, value in (adapt_stats or {}).items():
+            stats.setdefault(key, []).append(value)
+        fitnesses, pop, refine_evals = toolkit.refine(gen, fitnesses, pop)
+        if budget and refine_evals:
+            budget.count(refine_evals)
         sizes = [len(ind) for ind in pop]
-
-
         fit_stats = stats_record(fitnesses)
         size_stats = stats_record(sizes)
         same = count_repeated(pop)
         improved = count_improved(prev_fitnesses, fitnesses)
 
+        t_log = clock()
         log_fmt = "{}\tMin: {}, Avg: {}, Avg size: {}, Same: {}, Improved: {}"
         if verbose:
             print(log_fmt.format(gen, fit_stats.min, fit_stats.mean,
                                  size_stats.mean, same, improved))
+        t_end = clock()
 
         stats['fitness'].append(fit_stats)
         stats['size'].append(size_stats)
         stats['same'].append(same)
         stats['improved'].append(improved)
-
-    fit_and_pop = list(zip(fitnesses, pop))
-    return fit_and_pop, stats
+        if toolkit.lazy:
+            stats['skipped'].append(toolkit.skipped_evals - skipped_evals)
+
+        if instrument:
+            times = (t_select, t_vary, t_eval, t_stats, t_log, t_end)
+            for phase, begin, end in zip(PHASES, times, times[1:]):
+                stats['time_' + phase].append(end - begin)
+            stats['evals'].append(len(pop) + refine_evals)
+            stats['moves'].append(sum(sizes))
+
+        stats['best'] = _best_of(fitnesses, pop, stats['best'])
+        best_history.append(stats['best'][0])
+        toolkit.report(gen, stats)
+        yield fitnesses, pop, stats
+        reason = toolkit.stop(best_history)
+        if reason:
+            stats['stop'] = StopRecord(reason=reason, gen=gen + 1)
+            if verbose:
+                print("Stopping after {} generations: {}".format(gen + 1,
+                                                                 reason))
+            break
 
 
 def group_by_key(list_of_maps):
     """Groups a list of maps onto a map of lists
 
     Parameters:
-    - list_of_maps: list of map containers which have all the same
-                    set of keys.
-
-    Returns a map whose keys are the same as each element of the
-    original list, and whose elements are lists of the values for a
-    given key in all maps."""
-    keys = list_of_maps[0].keys()
-    return {key: [m[key] for m in list_of_maps]
+    - list_of_maps: list of map containers, which may have different
+                    sets of keys.
+
+    Returns a map whose keys are those of any element of the original
+    list, in order of appearance, and whose elements are lists of the
+    values for a given key in the maps which have it."""
+    keys = dict.fromkeys(key for m in list_of_maps for key in m)
+    return {key: [m[key] for m in list_of_maps if key in m]
             for key in keys}
 
 
@@ -120,14 +298,24 @@ SummaryRecord = namedtuple('SummaryRecord', ['min_mins', 'mean_mins', 'std_mins'
 def summarize_stats(run_stats):
     """Summarize a list of stats dictionary into a single dictionary.
 
+    Runs may have different numbers of generations, in which case each
+    generation is summarized over the runs which reached it, and the
+    'runs' entry counts these runs.
+
     Parameters:
     - run_stats: list of stats for many runs of the GA
 
-    Returns a dictionary with summarized records."""
-    summary = {key: list() for key in ('fitness', 'size', 'same', 'improved')}
+    Returns a dictionary with summarized records. Its 'stop' entry
+    lists the StopRecord of each run."""
+    stats_by_key = group_by_key(run_stats)
+    summary = {key: list() for key in stats_by_key}
     multi_stats = {'fitness', 'size'}
-    for stat_name, stat_by_run in group_by_key(run_stats).items():
-        for gen_stats in zip(*stat_by_run):
+    for stat_name, stat_by_run in stats_by_key.items():
+        if stat_name in RUN_STATS:
+            summary[stat_name] = stat_by_run
+            continue
+        for gen_stats in zip_longest(*stat_by_run):
+            gen_stats = [stat for stat in gen_stats if stat is not None]
             if stat_name in multi_stats:
                 mins, maxes, means, stds = zip(*gen_stats)
                 kwargs = {
@@ -146,4 +334,6 @@ def summarize_stats(run_stats):
                 record = Record(min=min(gen_stats), max=max(gen_stats),
                                 mean=np.mean(gen_stats), std=np.std(gen_stats))
                 summary[stat_name].append(record)
+            if stat_name == 'fitness':
+                summary.setdefault('runs', []).append(len(gen_stats))
     return summary
@@ -3,6 +3,10 @@ import heapq
 
 from functools import wraps
 
+import numpy as np
+
+from .ga import evaluate
+
 
 def sel_tourn(fit_and_pop, num_offspring, k):
     """Select offspring from a population via tournament selection.
@@ -20,6 +24,27 @@ def sel_tourn(fit_and_pop, num_offspring, k):
     return offspring
 
 
+def tourn_cutoff(fitnesses, k, num_elites=0):
+    """Find the fitness from which individuals of a population can't be
+    chosen by sel_tourn with tournaments of size k, nor by sel_best.
+
+    Tournaments are sampled without replacement, so an individual worse
+    than all but k - 1 others of the population never wins one.
+
+    Parameters:
+    - fitnesses: array of fitnesses of the population
+    - k: tournament size
+    - num_elites: number of individuals chosen by sel_best
+
+    Returns the cutoff, just above the fitness of the worst individual
+    which may be chosen, or None if any individual may be chosen."""
+    chosen = max(len(fitnesses) - k + 1, num_elites)
+    if chosen >= len(fitnesses):
+        return None
+    worst_chosen = np.partition(fitnesses, chosen - 1)[chosen - 1]
+    return float(np.nextafter(worst_chosen, np.inf))
+
+
 def sel_best(fit_and_pop, num_offspring):
     """Select the n best offspring from a population.
 
@@ -43,31 +68,168 @@ def vary(pop, toolkit, cx_prob, mut_prob):
     - mut_prob: mutation probability
 
     Returns the population after variation."""
+    pop_after_mut, _ = vary_lineage(pop, toolkit, cx_prob, mut_prob)
+    return pop_after_mut
+
+
+def vary_lineage(pop, toolkit, cx_prob, mut_prob):
+    """Vary population as in vary, also recording each individual's
+    origin.
+
+    Parameters:
+    - pop: list of individuals
+    - toolkit: object containing mate and mutate operators
+    - cx_prob: crossover probability
+    - mut_prob: mutation probability
+
+    Returns the population after variation and a list of (parent index,
+    crossed over, mutated) tuples, one per individual, where the parent
+    index points to the individual of pop it replaced."""
     half = len(pop) // 2
 
     # crossover
     pop_after_cx = []
-    for a, b in zip(pop[:half], pop[half:]):
+    lineage = []
+    for i, (a, b) in enumerate(zip(pop[:half], pop[half:])):
         roll = random.random()
-        if roll < cx_prob:
+        crossed = roll < cx_prob
+        if crossed:
             a, b = toolkit.mate(a, b)
         pop_after_cx.append(a)
         pop_after_cx.append(b)
+        lineage.append((i, crossed))
+        lineage.append((half + i, crossed))
 
     # if there's an odd number of individuals in the population, the
     # last one won't have been copied to the new list
     if len(pop) % 2:
         pop_after_cx.append(pop[-1])
+        lineage.append((len(pop) - 1, False))
 
     # mutation
     pop_after_mut = []
-    for ind in pop_after_cx:
+    for j, ind in enumerate(pop_after_cx):
         roll = random.random()
-        if roll < mut_prob:
+        mutated = roll < mut_prob
+        if mutated:
             ind, = toolkit.mutate(ind)
         pop_after_mut.append(ind)
+        lineage[j] += (mutated,)
 
-    return pop_after_mut
+    return pop_after_mut, lineage
+
+
+def vary_adaptive(pop, toolkit, rates):
+    """Vary population as in vary, with probabilities taken from an
+    AdaptiveRates object, which is told each individual's origin.
+
+    Parameters:
+    - pop: list of individuals
+    - toolkit: object containing mate and mutate operators
+    - rates: AdaptiveRates object
+
+    Returns the population after variation."""
+    pop, lineage = vary_lineage(pop, toolkit, rates.cx_prob, rates.mut_prob)
+    rates.lineage = lineage
+    return pop
+
+
+ADAPTIVE_STATS = ("cx_prob", "mut_prob", "mut_size", "cx_success",
+                  "mut_success")
+
+
+class AdaptiveRates:
+    """Self-adaptive variation probabilities and mutation size.
+
+    Tracks the success rate of crossover and mutation, i.e. how often
+    they yield an individual better than the one it replaced, as an
+    exponential moving average. The sum of both probabilities is kept
+    constant, and is shared between the operators in proportion to
+    their success rates (probability matching). Following the 1/5th
+    success rule, mutation fragments get longer while the mutation
+    success rate is above the target, and shorter otherwise.
+
+    Parameters:
+    - cx_prob: initial crossover probability
+    - mut_prob: initial mutation probability
+    - mut_size: initial maximum mutation fragment size
+    - min_mut_size, max_mut_size: bounds for the fragment size
+    - learning_rate: how fast the rates move towards their new values
+    - target_success: mutation success rate above which fragments grow
+    - memory: weight of past generations in the success rates
+    - min_prob, max_prob: bounds for the probabilities"""
+    def __init__(self, cx_prob, mut_prob, mut_size, min_mut_size,
+                 max_mut_size, learning_rate=0.1, target_success=0.2,
+                 memory=0.8, min_prob=0.01, max_prob=1.0):
+        self.cx_prob = cx_prob
+        self.mut_prob = mut_prob
+        self.mut_size = mut_size
+        self.min_mut_size = min_mut_size
+        self.max_mut_size = max_mut_size
+        self.learning_rate = learning_rate
+        self.target_success = target_success
+        self.memory = memory
+        self.min_prob = min_prob
+        self.max_prob = max_prob
+        self.cx_success = target_success
+        self.mut_success = target_success
+        self.total_prob = cx_prob + mut_prob
+        self.lineage = []
+
+    def mut_max_size(self):
+        """Current maximum mutation fragment size, as an integer."""
+        return int(round(self.mut_size))
+
+    def update(self, parent_fitnesses, fitnesses):
+        """Update the rates with the outcome of the last variation.
+
+        Parameters:
+        - parent_fitnesses: fitnesses of the individuals before variation
+        - fitnesses: fitnesses of the varied individuals, in the order
+                     returned by vary_adaptive
+
+        Returns a dict with the current value of each ADAPTIVE_STATS
+        entry."""
+        cx_outcomes = []
+        mut_outcomes = []
+        for (parent, crossed, mutated), fitness in zip(self.lineage,
+                                                       fitnesses):
+            improved = fitness < parent_fitnesses[parent]
+            if crossed:
+                cx_outcomes.append(improved)
+            if mutated:
+                mut_outcomes.append(improved)
+
+        keep = self.memory
+        if cx_outcomes:
+            rate = sum(cx_outcomes) / len(cx_outcomes)
+            self.cx_success = keep * self.cx_success + (1 - keep) * rate
+        if mut_outcomes:
+            rate = sum(mut_outcomes) / len(mut_outcomes)
+            self.mut_success = keep * self.mut_success + (1 - keep) * rate
+
+        # probability matching
+        lr = self.learning_rate
+        total_success = self.cx_success + self.mut_success
+        if total_success > 0:
+            shared = self.total_prob - 2 * self.min_prob
+            for op in ("cx", "mut"):
+                success = getattr(self, op + "_success")
+                prob = getattr(self, op + "_prob")
+                target = self.min_prob + shared * success / total_success
+                prob += lr * (target - prob)
+                setattr(self, op + "_prob",
+                        min(max(prob, self.min_prob), self.max_prob))
+
+        # 1/5th success rule
+        if self.mut_success > self.target_success:
+            self.mut_size *= 1 + lr
+        else:
+            self.mut_size /= 1 + lr
+        self.mut_size = min(max(self.mut_size, self.min_mut_size),
+                            self.max_mut_size)
+
+        return {key: getattr(self, key) for key in ADAPTIVE_STATS}
 
 
 def size_limit(operator, limit):
@@ -94,3 +256,112 @@ def size_limit(operator, limit):
         return output_inds
     return limited_function
 
+
+def stop_criteria(best_history, target_fitness=None, stagnation_gens=None,
+                  min_improvement=None, improvement_window=None):
+    """Check early termination criteria for a GA run.
+
+    Criteria which are None are ignored. Fitness is minimized.
+
+    Parameters:
+    - best_history: best fitness found so far, for each generation
+    - target_fitness: stop once the best fitness is at most this value
+    - stagnation_gens: stop if the best fitness hasn't improved in this
+                       many generations
+    - min_improvement: stop if the best fitness improved by less than
+                       this much per generation, on average, over the
+                       last improvement_window generations
+    - improvement_window: number of generations over which the
+                          improvement rate is measured
+
+    Returns a string with the reason to stop, or None to go on."""
+    gens = len(best_history)
+    best = best_history[-1]
+    if target_fitness is not None and best <= target_fitness:
+        return "target fitness"
+    if stagnation_gens and gens > stagnation_gens:
+        if best >= best_history[-1 - stagnation_gens]:
+            return "stagnation"
+    if min_improvement is not None and improvement_window:
+        if gens > improvement_window:
+            previous = best_history[-1 - improvement_window]
+            rate = (previous - best) / improvement_window
+            if rate < min_improvement:
+                return "slow improvement"
+    return None
+
+
+def hill_climb(fit_and_inds, toolkit, steps, neighbours):
+    """Refine individuals by batched first-improvement hill climbing.
+
+    At every step, a batch of random neighbours of each individual
+    still climbing is evaluated with a single toolkit.map call. Each
+    individual moves to its first neighbour, in batch order, which is
+    better than it, and stops climbing once a batch has none. Lazy
+    toolkits may bound the fitness of neighbours which aren't better
+    than their individual (see ga.evaluate).
+
+    Parameters:
+    - fit_and_inds: list of (fitness, individual) tuples
+    - toolkit: ga.Toolkit containing a neighbour operator, a map
+               function and a fitness function
+    - steps: maximum number of steps
+    - neighbours: number of neighbours evaluated per individual and step
+
+    Returns the list of refined (fitness, individual) tuples, in the
+    same order, and the number of evaluations done."""
+    current = list(fit_and_inds)
+    climbing = list(range(len(current)))
+    evals = 0
+    for _ in range(steps):
+        if not climbing:
+            break
+        candidates = [(i, toolkit.neighbour(current[i][1]))
+                      for i in climbing for _ in range(neighbours)]
+        fitnesses, _ = evaluate(toolkit, [ind for _, ind in candidates],
+                                [current[i][0] for i, _ in candidates])
+        evals += len(candidates)
+
+        improved = set()
+        for (i, ind), fitness in zip(candidates, fitnesses):
+            if i not in improved and fitness < current[i][0]:
+                current[i] = (fitness, ind)
+                improved.add(i)
+        climbing = [i for i in climbing if i in improved]
+    return current, evals
+
+
+def refine_elites(gen, fitnesses, pop, toolkit, interval, elites, steps,
+                  neighbours):
+    """Memetic step: refine the best individuals of a population with
+    hill_climb, every few generations.
+
+    Parameters:
+    - gen: index of the generation
+    - fitnesses: array of fitnesses of the population
+    - pop: list of individuals
+    - toolkit: object with the operators required by hill_climb
+    - interval: number of generations between refinements
+    - elites: number of distinct best individuals to refine
+    - steps, neighbours: as in hill_climb
+
+    Returns the fitnesses and the population, with refined individuals
+    in place of their originals, and the number of evaluations done."""
+    if (gen + 1) % interval:
+        return fitnesses, pop, 0
+
+    chosen = []
+    for i in sorted(range(len(pop)), key=lambda i: fitnesses[i]):
+        if len(chosen) == elites:
+            break
+        if all(pop[i] != pop[j] for j in chosen):
+            chosen.append(i)
+
+    refined, evals = hill_climb([(fitnesses[i], pop[i]) for i in chosen],
+                                toolkit, steps, neighbours)
+    fitnesses = fitnesses.copy()
+    pop = list(pop)
+    for i, (fitness, ind) in zip(chosen, refined):
+        fitnesses[i] = fitness
+        pop[i] = ind
+    return fitnesses, pop, evals
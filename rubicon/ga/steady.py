@@ -0,0 +1,204 @@
+import os
+import queue
+import random
+
+from collections import Counter
+
+import numpy as np
+
+from .ga import (StopRecord, FitnessBound, stats_record, count_repeated,
+                 _best_of)
+
+
+def evaluate_all(fitness, inds, cutoff=None):
+    """Evaluate a batch of individuals (a task of run_steady), with a
+    cutoff if one is given (see ga.FitnessBound)."""
+    if cutoff is None:
+        return [fitness(ind) for ind in inds]
+    return [fitness(ind, cutoff=cutoff) for ind in inds]
+
+
+def run_steady(pop, generations, toolkit, tourn_size, batch_size=32,
+               in_flight=None, verbose=True, budget=None):
+    """Runs an asynchronous steady-state genetic algorithm.
+
+    Instead of waiting for a whole generation to be evaluated, offspring
+    are evaluated in small batches, submitted with toolkit.apply_async,
+    and up to in_flight batches are kept pending so the workers never
+    wait for each other. As each batch returns, every offspring replaces
+    the loser of a reverse tournament, i.e. the worst of tourn_size
+    random individuals, if it's at least as good and not already in the
+    population. The parents of every
+    batch are tournament winners of the population at the time it's
+    submitted.
+
+    Every len(pop) evaluations make a generation, whose stats are
+    recorded as in ga.run_ga ('improved' counts the replacements), and
+    after which toolkit.refine, toolkit.report and toolkit.stop are
+    called. toolkit.adapt isn't called, since offspring don't belong to
+    a single variation step.
+
+    Lazy toolkits are given the worst fitness of the population as the
+    cutoff of every batch, since offspring which aren't better can't
+    replace anyone, and the number of full evaluations avoided in every
+    generation is recorded in the 'skipped' stats.
+
+    Parameters:
+    - pop: initial population
+    - generations: number of generations the GA should run for
+    - toolkit: ga.Toolkit which implements vary and a fitness function,
+               with a map function for the initial population and an
+               apply_async function for the offspring
+    - tourn_size: size of the selection and replacement tournaments
+    - batch_size: number of offspring evaluated per task
+    - in_flight: maximum number of pending tasks (default: twice the
+                 number of CPUs)
+    - verbose: if False, nothing is printed to stdout.
+    - budget: object with count(evals) and exhausted(next_evals)
+              methods (see budget.Budget); no batch is submitted once
+              exhausted returns a reason for it and the pending ones,
+              which still complete generations.
+
+    Returns the final population as a list of (fitness, individual)
+    tuples and the stats, as ga.run_ga."""
+    if in_flight is None:
+        in_flight = 2 * (os.cpu_count() or 1)
+    pop = list(pop)
+    fitnesses = list(toolkit.map(toolkit.fitness, pop))
+    if budget:
+        budget.count(len(pop))
+    stats = {key: list() for key in ("fitness", "size", "improved", "same")}
+    if toolkit.lazy:
+        stats['skipped'] = []
+    stats['stop'] = StopRecord(reason="max generations", gen=generations)
+    stats['best'] = _best_of(fitnesses, pop, None)
+
+    results = queue.Queue()
+
+    def tournament():
+        contenders = random.sample(range(len(pop)), tourn_size)
+        return pop[min(contenders, key=fitnesses.__getitem__)]
+
+    # copies of individuals already in the population are rejected, or
+    # copies of the best would soon take it over
+    present = Counter(tuple(ind) for ind in pop)
+
+    def insert(ind, fitness):
+        key = tuple(ind)
+        if present[key]:
+            return False
+        contenders = random.sample(range(len(pop)), tourn_size)
+        loser = max(contenders, key=fitnesses.__getitem__)
+        if fitness <= fitnesses[loser]:
+            present[tuple(pop[loser])] -= 1
+            present[key] += 1
+            pop[loser] = ind
+            fitnesses[loser] = fitness
+            return True
+        return False
+
+    def submit():
+        offspring = []
+        while len(offspring) < batch_size:
+            offspring.extend(toolkit.vary([tournament(), tournament()]))
+        offspring = offspring[:batch_size]
+        # the worst fitness only decreases while the batch is evaluated
+        cutoff = (float(np.nextafter(max(fitnesses), np.inf))
+                  if toolkit.lazy else None)
+        toolkit.apply_async(evaluate_all,
+                            (toolkit.fitness, offspring, cutoff),
+                            callback=lambda f: results.put((offspring, f)),
+                            error_callback=lambda e: results.put((None, e)))
+
+    best_history = []
+    skipped_evals = toolkit.skipped_evals
+    evals = 0
+    replaced = 0
+    gen = 0
+    pending = 0
+    budget_reason = None
+    while gen < generations:
+        while budget_reason is None and pending < in_flight:
+            # pending batches aren't counted yet, but will be
+            reason = (budget.exhausted(batch_size * (pending + 1))
+                      if budget else None)
+            if reason:
+                # the pending batches still make generations
+                budget_reason = reason
+                break
+            submit()
+            pending += 1
+        if not pending:
+            stats['stop'] = StopRecord(reason=budget_reason, gen=gen)
+            if verbose:
+                print("Stopping after {} generations: {}".format(
+                    gen, budget_reason))
+            break
+
+        offspring, batch_fitnesses = results.get()
+        pending -= 1
+        if offspring is None:
+            raise batch_fitnesses
+        if budget:
+            budget.count(len(offspring))
+        toolkit.skipped_evals += sum(isinstance(fitness, FitnessBound)
+                                     for fitness in batch_fitnesses)
+        replaced += sum(insert(ind, fitness)
+                        for ind, fitness in zip(offspring, batch_fitnesses))
+        evals += len(offspring)
+        if evals < len(pop):
+            continue
+
+        # a generation's worth of evaluations
+        evals -= len(pop)
+        refined, pop, refine_evals = toolkit.refine(gen, np.array(fitnesses),
+                                                    pop)
+        fitnesses = list(refined)
+        if refine_evals:
+            present.clear()
+            present.update(tuple(ind) for ind in pop)
+            if budget:
+                budget.count(refine_evals)
+
+        sizes = [len(ind) for ind in pop]
+        fit_stats = stats_record(fitnesses)
+        size_stats = stats_record(sizes)
+        same = count_repeated(pop)
+        if verbose:
+            print("{}\tMin: {}, Avg: {}, Avg size: {}, Same: {}, Improved: {}"
+                  .format(gen, fit_stats.min, fit_stats.mean, size_stats.mean,
+                          same, replaced))
+        stats['fitness'].append(fit_stats)
+        stats['size'].append(size_stats)
+        stats['same'].append(same)
+        stats['improved'].append(replaced)
+        replaced = 0
+        if toolkit.lazy:
+            stats['skipped'].append(toolkit.skipped_evals - skipped_evals)
+            skipped_evals = toolkit.skipped_evals
+
+        stats['best'] = _best_of(fitnesses, pop, stats['best'])
+        best_history.append(stats['best'][0])
+        toolkit.report(gen, stats)
+        gen += 1
+        reason = toolkit.stop(best_history)
+        if reason:
+            stats['stop'] = StopRecord(reason=reason, gen=gen)
+            if verbose:
+                print("Stopping after {} generations: {}".format(gen, reason))
+            break
+
+    # wait for the pending batches, whose individuals are still inserted
+    # (in the final population and best, but not in the stats)
+    while pending:
+        offspring, batch_fitnesses = results.get()
+        pending -= 1
+        if offspring is None:
+            continue
+        if budget:
+            budget.count(len(offspring))
+        for ind, fitness in zip(offspring, batch_fitnesses):
+            insert(ind, fitness)
+    stats['best'] = _best_of(fitnesses, pop, stats['best'])
+
+    return list(zip(fitnesses, pop)), stats
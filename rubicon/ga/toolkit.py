@@ -2,6 +2,19 @@ class Toolkit:
     """Container for the operators and the fitness function of a GA
     run. Must be specialized before being used."""
 
+    # whether the fitness function takes a cutoff, from which it may
+    # return a ga.FitnessBound instead of the exact fitness
+    lazy = False
+    # full evaluations avoided by lazy evaluation (see ga.evaluate)
+    skipped_evals = 0
+
+    def for_run(self):
+        """Gets the toolkit to use for a single run, with its own copy
+        of any state the operators change during a run.
+
+        Returns a toolkit; by default, the toolkit itself."""
+        return self
+
     def create(self):
         """Create a single individual."""
         raise NotImplementedError
@@ -33,17 +46,85 @@ class Toolkit:
         Returns a new, varied population."""
         raise NotImplementedError
 
-    def fitness(self, ind):
+    def adapt(self, parent_fitnesses, fitnesses):
+        """Adapts the operators to the outcome of the last variation.
+
+        Parameters:
+        - parent_fitnesses: fitnesses of the individuals given to vary
+        - fitnesses: fitnesses of the individuals returned by vary
+
+        Returns a dict of per-generation stats to be recorded, or None."""
+        return None
+
+    def refine(self, gen, fitnesses, pop):
+        """Locally improves individuals of an evaluated population.
+
+        Parameters:
+        - gen: index of the generation
+        - fitnesses: array of fitnesses of the population
+        - pop: list of individuals
+
+        Returns the new fitnesses and population, and the number of
+        fitness evaluations done."""
+        return fitnesses, pop, 0
+
+    def cutoff(self, fitnesses):
+        """Finds the fitness from which individuals can't be chosen by
+        select nor best, for lazy evaluation.
+
+        Parameters:
+        - fitnesses: array of fitnesses of the population
+
+        Returns the cutoff, or None if any individual may be chosen."""
+        return None
+
+    def stop(self, best_history):
+        """Decides whether the GA should stop before its last generation.
+
+        Parameters:
+        - best_history: best fitness found so far, for each generation
+
+        Returns a string with the reason to stop, or None to go on."""
+        return None
+
+    def report(self, gen, stats):
+        """Reports the progress of the GA after each generation.
+
+        Parameters:
+        - gen: index of the generation
+        - stats: stats of the run so far (see run_ga)"""
+        pass
+
+    def fitness(self, ind, cutoff=None):
         """Evaluated an individual's fitness.
 
         Parameters:
         - ind: individual to be evaluated.
+        - cutoff: (lazy toolkits only) fitness from which a
+                  ga.FitnessBound may be returned instead, if given
 
         Returns a numerical value corresponding to its fitness."""
         raise NotImplementedError
 
+    def expand(self, ind):
+        """Converts an individual to its output representation.
+
+        Parameters:
+        - ind: individual, as handled by the operators
+
+        Returns the individual as it should be reported and logged."""
+        return ind
+
     @staticmethod
     def map(*args, **kwargs):
         """Map used for evaluating fitnesses. May be replaced by a
         parallel map function, such as multiprocessing.Pool.map."""
         return map(*args, **kwargs)
+
+    @staticmethod
+    def apply_async(function, args=(), callback=None, error_callback=None):
+        """Call used for evaluating fitnesses asynchronously, with the
+        result passed to callback (see ga.steady). May be replaced by a
+        parallel version, such as multiprocessing.Pool.apply_async. By
+        default, the call is made right away."""
+        callback(function(*args))
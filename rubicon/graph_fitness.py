@@ -1,11 +1,10 @@
+from functools import lru_cache
+
 import rubikscube as rc
 import numpy as np
 
 
-N = 54  # facelets in a 3x3 cube
-
-
-def move_transition_adjmatrix(move):
+def move_transition_adjmatrix(perm):
     """Generate the adjacency matrix for a cube move's transitions
 
     This adjacency matrix has edges between the position of each of
@@ -13,81 +12,85 @@ def move_transition_adjmatrix(move):
     recorded)
 
     Parameters:
-    - move: flat Rubik's Cube move function
+    - perm: permutation array of the move (see rc.move_table)
 
     Returns the aforementioned adjacency matrix"""
-    cube = rc.gen_cube()
-    move(cube)
+    n = len(perm)
+    adjmatrix = np.zeros((n, n), dtype=int)
 
-    adjmatrix = np.zeros((N, N), dtype=int)
-
-    for before, after in enumerate(cube):
-        if before != after:
-            adjmatrix[before, after] = 1
+    moved = perm != np.arange(n)
+    adjmatrix[np.flatnonzero(moved), perm[moved]] = 1
 
     return adjmatrix
 
 
-def all_moves_adj_matrix():
+def all_moves_adj_matrix(side=rc.SIDE):
     """Combine move transition graphs for all possible moves.
 
+    Parameters:
+    - side: side length of the cube
+
     Returns a single adjacency matrix which is the union of the move
     graphs for all possible moves for a cube."""
-    adjmatrix = np.zeros((N, N), dtype=int)
+    perms = rc.move_table(side).perms
+    adjmatrix = np.zeros((perms.shape[1],) * 2, dtype=int)
 
-    for move in rc.move_list:
-        adjmatrix |= move_transition_adjmatrix(move)
+    for perm in perms:
+        adjmatrix |= move_transition_adjmatrix(perm)
 
     return adjmatrix
 
 
-def bfs_all(adjmatrix, source):
-    """Find the BFS distance to all vertices from a source vertex.
-
-    Parameters:
-    - adjmatrix: graph, in the form of an adjacency matrix
-    - source: source vertex index
-
-    Returns a list of distances, indexed by vertex index."""
-    n = adjmatrix.shape[0]
-    assert source >= 0 and source < n
-
-    visited = np.zeros(n, dtype=bool)
-    distance = np.zeros(n, dtype=int)
-    distance.fill(-999)
+def facelet_distances(side=rc.SIDE):
+    """Compute the pairwise distance matrix between all facelets.
 
-    queue = [(source, 0)]
-    visited[source] = True
+    The distance between two facelets i and j is the minimum amount
+    of moves required to move facelet i to facelet j's position.
 
-    while queue:
-        vertex, dist = queue.pop(0)
-        distance[vertex] = dist
+    All sources are searched at once, with a boolean frontier matrix.
 
-        for neighbor, is_adjacent in enumerate(adjmatrix[vertex]):
-            if is_adjacent and not visited[neighbor]:
-                queue.append((neighbor, dist + 1))
-                visited[neighbor] = True
+    Parameters:
+    - side: side length of the cube
 
-    return distance
+    Returns a 6N^2x6N^2 matrix D where D[i, j] is the distance between
+    facelets i and j."""
+    adjmatrix = all_moves_adj_matrix(side).astype(bool)
+    n = adjmatrix.shape[0]
+    distances = np.full((n, n), -999)
 
+    frontier = np.eye(n, dtype=bool)
+    distance = 0
+    while frontier.any():
+        distances[frontier] = distance
+        reached = (frontier.astype(int) @ adjmatrix) > 0
+        frontier = reached & (distances < 0)
+        distance += 1
 
-def facelet_distances():
-    """Compute the pairwise distance matrix between all facelets.
+    return distances
 
-    The distance between two facelets i and j is the minimum amount
-    of moves required to move facelet i to facelet j's position.
 
-    Returns a 54x54 matrix D where D[i, j] is the distance between
-    facelets i and j."""
-    adjmatrix = all_moves_adj_matrix()
-    distances = np.zeros((N, N), dtype=int)
+@lru_cache(maxsize=None)
+def distance_table(side=rc.SIDE):
+    """Compute the solution distance table of a cube size, once.
 
-    for i in range(N):
-        distances[i, :] = bfs_all(adjmatrix, i)
+    Interchangeable facelets (see rc.move_table) are at the distance of
+    the nearest of their class's positions.
 
+    Parameters:
+    - side: side length of the cube
+
+    Returns a matrix D where D[i, j] is the solution distance of
+    facelet j when it's at position i."""
+    distances = facelet_distances(side)
+    classes = rc.move_table(side).facelet_classes
+    for label in np.unique(classes):
+        members = classes == label
+        if members.sum() > 1:
+            distances[:, members] = distances[:, members].min(
+                axis=1, keepdims=True)
     return distances
 
-_distances = facelet_distances()
+_distances = distance_table()
 
 
 def solution_distance(cube):
@@ -99,8 +102,11 @@ def solution_distance(cube):
 
     Parameters:
     - cube: cube for which the distance should be calculated"""
-    distances = [_distances[pos, facelet] for pos, facelet in enumerate(cube)]
-    return sum(distances)
+    if len(cube) == len(_distances):
+        distances = _distances
+    else:
+        distances = distance_table(rc.cube_side(cube))
+    return int(distances[np.arange(len(cube)), cube].sum())
 
 
 def graph_fitness(ind, initial_cube):
@@ -7,6 +7,8 @@ from collections import namedtuple
 from functools import partial
 
 import rubikscube as rc
+from ga.ga import PHASES
+from ga.operators import ADAPTIVE_STATS
 
 try:
     from plotting import plot_graphs
@@ -30,6 +32,11 @@ def print_run_stats(stats, file=sys.stdout, multi=False):
                           "Means:\tmin {min_means}, mean {mean_means}, std {std_means}/"
                           "Std: {mean_stds}\n")
     row_fmt = "{gen}\tFit: {fit}/Size: {size}/Same: {same}, Improved: {improved}"
+    instrument_fmt = "/Times: {times}/Evals: {evals}, Moves: {moves}"
+    instrumented = 'evals' in stats
+    adaptive = 'cx_prob' in stats
+    beam = 'nodes' in stats
+    lazy = 'skipped' in stats
 
     stat_lists = (stats['fitness'], stats['size'], stats['same'], stats['improved'])
     for i, (fit, size, same, improved) in enumerate(zip(*stat_lists)):
@@ -45,17 +52,52 @@ def print_run_stats(stats, file=sys.stdout, multi=False):
             improved_str = str(improved)
         row = row_fmt.format(gen=i, fit=fit_str, size=size_str, same=same_str,
                              improved=improved_str)
+        # multi run records are summarized by their mean
+        value = (lambda stat: stats[stat][i].mean) if multi else \
+                (lambda stat: stats[stat][i])
+        if instrumented:
+            times = ", ".join("{} {:.3e}s".format(phase,
+                                                  value('time_' + phase))
+                              for phase in PHASES)
+            row += instrument_fmt.format(times=times, evals=value('evals'),
+                                         moves=value('moves'))
+        if adaptive:
+            row += "/Rates: " + ", ".join(
+                "{} {:.4g}".format(stat, value(stat))
+                for stat in ADAPTIVE_STATS)
+        if beam:
+            row += "/Nodes: {:.6g}, Nodes/s: {:.4g}".format(
+                value('nodes'), value('node_rate'))
+        if lazy:
+            row += "/Skipped: {:.6g}".format(value('skipped'))
         print(row, file=file)
 
 
-def log_run(run_dir, config, stats, duration):
+def log_stop_summary(stop_records, file=sys.stdout):
+    """Prints how many runs stopped for each reason, and when.
+
+    Parameters:
+    - stop_records: list of ga.StopRecord, one per run
+    - file: stream to which the summary should be printed."""
+    reasons = sorted({record.reason for record in stop_records})
+    for reason in reasons:
+        gens = [record.gen for record in stop_records
+                if record.reason == reason]
+        print("{} runs stopped: {} (generations {} to {})".format(
+            len(gens), reason, min(gens), max(gens)), file=file)
+    print(file=file)
+
+
+def log_run(run_dir, config, stats, duration, budget=None, cache_report=None):
     """Logs a single run's stats and plots graphs for these stats
 
     Parameters:
     - run_dir: directory to which these stats should be saved
     - config: configuration object for the run
     - stats: stats dictionary returned by the run
-    - duration: duration of the run, in seconds"""
+    - duration: duration of the run, in seconds
+    - budget: budget.Budget used by the run, if any
+    - cache_report: line describing the fitness cache's use, if any"""
     log_file_path = os.path.join(run_dir, "run.log")
     with open(log_file_path, "a") as f:
         pp = pprint.PrettyPrinter(stream=f, indent=4)
@@ -65,6 +107,16 @@ def log_run(run_dir, config, stats, duration):
 
         This run took {duration}s to finish\n"""
         log(header_fmt.format(duration=duration))
+        log("Stopped after {gen} generations: {reason}".format(
+            **stats['stop']._asdict()))
+        if budget:
+            log(budget.report())
+        if cache_report:
+            log(cache_report)
+        if 'skipped' in stats:
+            log("Lazy evaluation: {} full evaluations avoided".format(
+                sum(stats['skipped'])))
+        log()
         log("Configuration:")
         pp.pprint(config)
         log("\nRun stats:")
@@ -72,14 +124,17 @@ def log_run(run_dir, config, stats, duration):
         plot_graphs(stats, run_dir, file=f)
 
 
-def log_multi_run(all_runs_dir, config, summary, duration):
+def log_multi_run(all_runs_dir, config, summary, duration, budget=None,
+                  cache_report=None):
     """Logs summarized stats for a set of GA runs and plots graphs.
 
     Parameters:
     - all_runs_dir: directory to which these stats should be saved
     - config: configuration object for the runs
     - stats: summarized stats dictionary obtained via rc.summarize_stats
-    - duration: duration of all runs, in seconds"""
+    - duration: duration of all runs, in seconds
+    - budget: budget.Budget used by the runs, if any
+    - cache_report: line describing the fitness cache's use, if any"""
     log_file_path = os.path.join(all_runs_dir, "all_runs.log")
     with open(log_file_path, "a") as f:
         pp = pprint.PrettyPrinter(stream=f, indent=4)
@@ -89,6 +144,11 @@ def log_multi_run(all_runs_dir, config, summary, duration):
 
         All {runs} runs combined took {duration}s to finish\n"""
         log(header_fmt.format(runs=config['Runs'], duration=duration))
+        log_stop_summary(summary['stop'], file=f)
+        if budget:
+            log(budget.report() + "\n")
+        if cache_report:
+            log(cache_report + "\n")
         log("Configuration:")
         pp.pprint(config)
         log("\nRun stat summary:")
@@ -99,7 +159,7 @@ def log_multi_run(all_runs_dir, config, summary, duration):
 Individuals = namedtuple("Individuals", ["best", "pop"])
 
 
-def log_individuals(run_dir, fit_and_pop, best_cube):
+def log_individuals(run_dir, fit_and_pop, best_cube, best=None):
     """Saves information about a run's individuals to a directory
 
     Also saves the individuals themselves in a pickle file. May be
@@ -109,9 +169,11 @@ def log_individuals(run_dir, fit_and_pop, best_cube):
     - run_dir: directory to which these stats should be saved
     - fit_and_pop: list of tuples of an individual's fitness and the
                    individual itself.
-    - best_cube: the cube generated by the best individual."""
+    - best_cube: the cube generated by the best individual.
+    - best: (fitness, individual) pair of the best individual, if it
+            isn't necessarily in fit_and_pop."""
     fitness, pop = list(zip(*fit_and_pop))
-    best_fitness, best = min(fit_and_pop)
+    best_fitness, best = best or min(fit_and_pop)
 
     pickle_path = os.path.join(run_dir, "individuals.pickle")
     with open(pickle_path, "wb") as f:
@@ -0,0 +1,333 @@
+"""Machine-readable progress metrics of running GA runs.
+
+While a run goes on, a background thread periodically writes a snapshot
+of its metrics to metrics.json and metrics.prom (in the Prometheus
+textfile format) in the run directory, and optionally to a shared
+directory read by a textfile collector. The GA only updates a few
+counters at the end of every generation, through the toolkit's report
+hook, so a snapshot whose generation doesn't change over time shows a
+stuck run.
+
+Process metrics are read from the standard library and /proc, where
+available; tracemalloc is only enabled on request, since it slows down
+every allocation."""
+
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import resource
+import threading
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+
+# name, help text and type of every metric, in the order they're written
+METRICS = (
+    ("generation", "Generations completed by the run.", "gauge"),
+    ("best_fitness", "Best fitness found so far.", "gauge"),
+    ("min_fitness", "Minimum fitness of the last generation.", "gauge"),
+    ("mean_fitness", "Mean fitness of the last generation.", "gauge"),
+    ("last_improvement_generation",
+     "Last generation in which the best fitness improved.", "gauge"),
+    ("evaluations_total", "Fitness evaluations done by the run.", "counter"),
+    ("evaluations_per_second",
+     "Fitness evaluations per second since the last snapshot.", "gauge"),
+    ("moves_total", "Estimated cube moves applied by the run's evaluations.",
+     "counter"),
+    ("moves_per_second",
+     "Estimated cube moves applied per second since the last snapshot.",
+     "gauge"),
+    ("cache_hit_ratio",
+     "Fraction of the run's fitness cache lookups which hit.", "gauge"),
+    ("process_cpu_utilization",
+     "CPU time of the run's process per second since the last snapshot.",
+     "gauge"),
+    ("worker_cpu_utilization",
+     "Mean CPU time of the pool workers per second since the last "
+     "snapshot.", "gauge"),
+    ("workers", "Live worker processes of the run's process.", "gauge"),
+    ("peak_rss_bytes", "Peak resident set size of the run's process.",
+     "gauge"),
+    ("worker_peak_rss_bytes",
+     "Largest peak resident set size of the pool workers.", "gauge"),
+    ("traced_memory_bytes", "Memory currently traced by tracemalloc.",
+     "gauge"),
+    ("traced_peak_memory_bytes", "Peak memory traced by tracemalloc.",
+     "gauge"),
+    ("elapsed_seconds", "Wall-clock time since the run started.", "gauge"),
+    ("finished", "Whether the run is over.", "gauge"),
+    ("timestamp_seconds", "Time of the snapshot, in seconds since the epoch.",
+     "gauge"),
+)
+
+PREFIX = "rubicon_"
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def proc_stats(pid):
+    """Read the CPU time and peak RSS of a process from /proc.
+
+    Parameters:
+    - pid: id of the process
+
+    Returns a (cpu seconds, peak rss bytes) tuple, or None if /proc
+    isn't available or the process is gone."""
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            # the command name may contain spaces, but not ")"
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+        peak_rss = None
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak_rss = int(line.split()[1]) * 1024
+                    break
+        return cpu, peak_rss
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class RunMetrics:
+    """Periodic snapshots of a run's metrics.
+
+    Parameters:
+    - run_dir: directory of the run, to which the snapshots are written
+    - labels: dict of labels of the run's Prometheus metrics
+    - interval: seconds between snapshots
+    - budget: budget.Budget of the run, counting its evaluations
+    - cache: fitness_cache.FitnessCache used by the run, if any
+    - textfile_dir: directory to which a .prom file named after the run
+                    is also written, e.g. for node_exporter's textfile
+                    collector
+    - trace_memory: whether to trace Python allocations with
+                    tracemalloc"""
+    def __init__(self, run_dir, labels, interval=10, budget=None, cache=None,
+                 textfile_dir=None, trace_memory=False):
+        self.paths = [os.path.join(run_dir, "metrics.prom")]
+        if textfile_dir:
+            if not os.path.exists(textfile_dir):
+                os.makedirs(textfile_dir)
+            run_hash = hashlib.sha1(os.path.realpath(run_dir).encode())
+            self.paths.append(os.path.join(textfile_dir, "rubicon-{}.prom"
+                                           .format(run_hash.hexdigest()[:16])))
+        self.json_path = os.path.join(run_dir, "metrics.json")
+        self.labels = labels
+        self.interval = interval
+        self.budget = budget
+        self.cache = cache
+        self.trace_memory = trace_memory
+
+        self.values = {}
+        self.moves = 0
+        self.start_time = time.monotonic()
+        self._evals = 0
+        self._best = None
+        self._last = None  # (time, evals, moves, cpu, worker cpu) of the
+                           # last snapshot
+        self._cache_counts = cache.counts() if cache else None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, config, run_dir, budget=None, cache=None):
+        """Create the run metrics described by a configuration.
+
+        The optional 'Metrics' setting of the configuration is either
+        true or a dict, which may contain:
+        - 'Interval': seconds between snapshots (default 10)
+        - 'Directory': textfile collector directory (default: none)
+        - 'Tracemalloc': whether to trace allocations (default false)
+
+        Parameters:
+        - config: configuration object of the run
+        - run_dir: directory of the run
+        - budget, cache: as in RunMetrics
+
+        Returns a RunMetrics object, or None if the setting is
+        missing."""
+        metrics_config = config.get('Metrics')
+        if not metrics_config:
+            return None
+        if not isinstance(metrics_config, dict):
+            metrics_config = {}
+        labels = {"name": config.get('Name', ""),
+                  "run": os.path.basename(os.path.normpath(run_dir))}
+        return cls(run_dir, labels,
+                   interval=metrics_config.get('Interval', 10),
+                   budget=budget, cache=cache,
+                   textfile_dir=metrics_config.get('Directory'),
+                   trace_memory=metrics_config.get('Tracemalloc', False))
+
+    def update(self, gen, stats):
+        """Record the progress of a generation (a Toolkit.report hook).
+
+        Parameters:
+        - gen: index of the generation
+        - stats: stats of the run so far (see ga.run_ga)"""
+        evals = self.budget.used_evals if self.budget else None
+        if evals is not None:
+            # every individual of the generation had its moves applied
+            self.moves += stats['size'][-1].mean * (evals - self._evals)
+            self._evals = evals
+        best = float(stats['best'][0])
+        values = {
+            "generation": gen + 1,
+            "best_fitness": best,
+            "min_fitness": float(stats['fitness'][-1].min),
+            "mean_fitness": float(stats['fitness'][-1].mean),
+            "last_improvement_generation": self.values.get(
+                "last_improvement_generation", 0),
+            "evaluations_total": evals,
+            "moves_total": int(self.moves),
+        }
+        if self._best is None or best < self._best:
+            values['last_improvement_generation'] = gen + 1
+            self._best = best
+        self.values = values
+
+    def snapshot(self, finished=False):
+        """Collect the current metrics.
+
+        Parameters:
+        - finished: whether the run is over
+
+        Returns a dict mapping the names of METRICS to their values
+        (None if unknown)."""
+        now = time.monotonic()
+        values = dict(self.values)
+        evals = values.get("evaluations_total") or 0
+        moves = values.get("moves_total") or 0
+
+        cpu = time.process_time()
+        workers = mp.active_children()
+        worker_stats = [s for s in map(proc_stats, (w.pid for w in workers))
+                        if s is not None]
+        worker_cpu = sum(s[0] for s in worker_stats)
+        if self._last:
+            last_time, last_evals, last_moves, last_cpu, last_worker_cpu = \
+                self._last
+            elapsed = max(now - last_time, 1e-9)
+            values['evaluations_per_second'] = (evals - last_evals) / elapsed
+            values['moves_per_second'] = (moves - last_moves) / elapsed
+            values['process_cpu_utilization'] = (cpu - last_cpu) / elapsed
+            if worker_stats:
+                values['worker_cpu_utilization'] = (
+                    (worker_cpu - last_worker_cpu) /
+                    (elapsed * len(worker_stats)))
+        self._last = (now, evals, moves, cpu, worker_cpu)
+
+        if self.cache:
+            hits, misses = (now_count - before for now_count, before in
+                            zip(self.cache.counts(), self._cache_counts))
+            if hits + misses:
+                values['cache_hit_ratio'] = hits / (hits + misses)
+        values['workers'] = len(workers)
+        # ru_maxrss is in kilobytes on Linux
+        values['peak_rss_bytes'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss * 1024
+        worker_rss = [s[1] for s in worker_stats if s[1] is not None]
+        if worker_rss:
+            values['worker_peak_rss_bytes'] = max(worker_rss)
+        if self.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            values['traced_memory_bytes'] = current
+            values['traced_peak_memory_bytes'] = peak
+        values['elapsed_seconds'] = now - self.start_time
+        values['finished'] = int(finished)
+        values['timestamp_seconds'] = time.time()
+        return {name: values.get(name) for name, _, _ in METRICS}
+
+    def prometheus_text(self, values):
+        """Format a snapshot in the Prometheus text exposition format,
+        leaving out unknown values."""
+        labels = ",".join('{}="{}"'.format(
+            key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+            for key, value in sorted(self.labels.items()))
+        lines = []
+        for name, help_text, metric_type in METRICS:
+            if values[name] is None:
+                continue
+            lines.append("# HELP {}{} {}".format(PREFIX, name, help_text))
+            lines.append("# TYPE {}{} {}".format(PREFIX, name, metric_type))
+            lines.append("{}{}{{{}}} {}".format(PREFIX, name, labels,
+                                                repr(float(values[name]))))
+        return "\n".join(lines) + "\n"
+
+    def write(self, finished=False):
+        """Write a snapshot of the metrics to the run's files.
+
+        Every file is replaced atomically, so readers never see a
+        partial snapshot."""
+        values = self.snapshot(finished)
+        text = self.prometheus_text(values)
+        for path in self.paths:
+            _replace(path, text)
+        _replace(self.json_path, json.dumps(
+            {"labels": self.labels, "metrics": values}, indent=4) + "\n")
+
+    def start(self):
+        """Start writing snapshots every interval, in a daemon thread."""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.write()
+
+        def loop():
+            while not self._stopped.wait(self.interval):
+                try:
+                    self.write()
+                except OSError:
+                    pass  # e.g. a full disk, retried at the next snapshot
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the snapshot thread and write the final snapshot."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        self.write(finished=True)
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def _replace(path, text):
+    """Atomically replace the contents of a file."""
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def reporting(toolkit, metrics):
+    """Update run metrics from a toolkit's report hook while a run goes
+    on, writing snapshots in the background.
+
+    Parameters:
+    - toolkit: ga.Toolkit of the run, whose report hook is restored
+               afterwards
+    - metrics: RunMetrics of the run, or None to do nothing"""
+    if metrics is None:
+        yield
+        return
+    report = toolkit.report
+    overridden = 'report' in vars(toolkit)
+
+    def report_and_update(gen, stats):
+        report(gen, stats)
+        metrics.update(gen, stats)
+
+    toolkit.report = report_and_update
+    metrics.start()
+    try:
+        yield
+    finally:
+        if overridden:
+            toolkit.report = report
+        else:
+            del toolkit.report
+        metrics.stop()
@@ -1,6 +1,8 @@
 import os.path
 import sys
 
+from ga.ga import RUN_STATS
+
 import matplotlib as mpl
 mpl.use('Agg')
 import matplotlib.pyplot as plt
@@ -48,6 +50,9 @@ def plot_graphs(stats, run_dir, file=sys.stdout):
     - run_dir: directory to which the graphs should be saved.
     """
     for stat_name, records in stats.items():
+        # runs stopped before their first generation have no records
+        if stat_name in RUN_STATS or not records:
+            continue
         filename = "{}.pdf".format(stat_name)
         path = os.path.join(run_dir, filename)
         plot_records(path, records)
@@ -0,0 +1,24 @@
+"""Messages exchanged by the solve server and its clients.
+
+Messages are JSON objects, one per line, over a Unix domain socket (see
+server.py for the requests and replies)."""
+
+import json
+import os
+import tempfile
+
+SOCKET_PATH = os.path.join(tempfile.gettempdir(),
+                           "rubicon-{}.sock".format(os.getuid()))
+
+
+def send(wfile, message):
+    """Write a message as a line of JSON."""
+    wfile.write((json.dumps(message) + "\n").encode())
+    wfile.flush()
+
+
+def receive(rfile):
+    """Read a message written by send, or None at the end of the
+    stream."""
+    line = rfile.readline()
+    return json.loads(line.decode()) if line else None
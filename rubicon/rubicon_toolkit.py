@@ -1,16 +1,81 @@
+import copy
+import os
 import random
 import math
 from functools import partial
 
+import numpy as np
+
 import rubikscube as rc
 import ga.operators as ops
 
-from ga import Toolkit
+from ga import Toolkit, FitnessBound
 from graph_fitness import solution_distance
+from cubie_fitness import cubie_distance
 from cube_fitness import wrong_color_facelets, wrong_cubelets
+from elite_archive import EliteArchive, archive_path
+from fitness_cache import FitnessCache, instance_hash
+from rubikscube.macros import adjacent_commutators, mine_sequences
+
+
+def cube_scores(cube, cubie=False):
+    """Compute the terms of combined_fitness which only depend on the
+    evaluated cube.
+
+    Parameters:
+    - cube: flat array Rubik's Cube
+    - cubie: whether to compute the cubie distance (0 otherwise)
+
+    Returns a (wrong cubelets, wrong color facelets, solution distance,
+    cubie distance) tuple."""
+    return (wrong_cubelets(cube), wrong_color_facelets(cube),
+            solution_distance(cube), cubie_distance(cube) if cubie else 0)
+
+
+def weigh_scores(scores, length, cubie_weight=0):
+    """Combine the scores of a cube (see cube_scores) and the length of
+    the individual which reached it into the individual's fitness."""
+    cubelets, facelets, distance, cubies = scores
+    fitness = (cubelets +
+               facelets / 2.4 +
+               distance / 4.8 +
+               math.log(length) / 30)
+    if cubie_weight:
+        fitness += cubie_weight * cubies
+    return fitness
+
 
+def staged_scores(cube, length, cutoff, cubie=False):
+    """Compute cube_scores in two stages, skipping the solution and
+    cubie distances once the fitness is known to be at least a cutoff.
 
-def combined_fitness(ind, initial_cube):
+    A facelet with the wrong color is at least a move away from its
+    position, so the solution distance is at least the number of such
+    facelets, which bounds the fitness along with the wrong cubelets.
+
+    Parameters:
+    - cube: flat array Rubik's Cube
+    - length: length of the individual which reached the cube
+    - cutoff: fitness from which the scores aren't needed
+    - cubie: whether to compute the cubie distance (0 otherwise)
+
+    Returns the scores, or a ga.FitnessBound if the fitness is at least
+    the cutoff."""
+    cubelets = wrong_cubelets(cube)
+    facelets = wrong_color_facelets(cube)
+    # weigh_scores's expression, so rounding keeps it below the fitness
+    bound = (cubelets +
+             facelets / 2.4 +
+             facelets / 4.8 +
+             math.log(length) / 30)
+    if bound >= cutoff:
+        return FitnessBound(bound)
+    return (cubelets, facelets, solution_distance(cube),
+            cubie_distance(cube) if cubie else 0)
+
+
+def combined_fitness(ind, initial_cube, apply_moves=rc.apply_moves,
+                     cubie_weight=0, cache=None, cutoff=None):
     """Evaluate an individual based on an initial cube
 
     Combines four different fitness functions:
@@ -19,17 +84,42 @@ def combined_fitness(ind, initial_cube):
     - The graph solution distance of the evaluated cube
     - The size of the individual
 
-    Applies different, hard-coded coefficients to each function.
-
-    Returns a fitness value."""
-    cube = rc.apply_moves(initial_cube, ind)
-    return (wrong_cubelets(cube) +
-            wrong_color_facelets(cube) / 2.4 +
-            solution_distance(cube) / 4.8 +
-            math.log(len(ind)) / 30)
-
+    Applies different, hard-coded coefficients to each function (see
+    weigh_scores). The cubie distance of the evaluated cube (see
+    cubie_fitness) may be added as a fifth term, with a configurable
+    weight.
 
-def create_ind(min_size, max_size):
+    Parameters:
+    - ind: individual to be evaluated
+    - initial_cube: initial state of the cube
+    - apply_moves: function applying the individual's genes to a cube
+                   (e.g. MacroLibrary.apply)
+    - cubie_weight: coefficient of the cubie distance (0 to disable it)
+    - cache: fitness_cache.FitnessCache of the evaluated cubes' scores
+             (see cube_scores), if any
+    - cutoff: fitness from which the exact value isn't needed, if any
+              (see staged_scores)
+
+    Returns a fitness value, or a ga.FitnessBound if it's at least the
+    cutoff."""
+    cube = apply_moves(initial_cube, ind)
+    cubie = bool(cubie_weight)
+    key = scores = None
+    if cache is not None:
+        key, scores = cache.lookup(cube, variant=cubie)
+    if scores is None:
+        if cutoff is None:
+            scores = cube_scores(cube, cubie)
+        else:
+            scores = staged_scores(cube, len(ind), cutoff, cubie)
+            if isinstance(scores, FitnessBound):
+                return scores
+        if cache is not None:
+            cache.store(key, scores)
+    return weigh_scores(scores, len(ind), cubie_weight)
+
+
+def create_ind(min_size, max_size, num_genes=len(rc.moves)):
     """Randomly create an individual.
 
     In this GA, an individual is an array of integer indiced which
@@ -37,8 +127,9 @@ def create_ind(min_size, max_size):
 
     Parameters:
     - min_size: minimum size of the individual
-    - max_size: maximum size of the individual"""
-    return [random.randint(0, len(rc.moves) - 1)
+    - max_size: maximum size of the individual
+    - num_genes: number of possible gene values (moves and macros)"""
+    return [random.randint(0, num_genes - 1)
             for _ in range(random.randint(min_size, max_size))]
 
 
@@ -55,13 +146,14 @@ def cx_point(a, b):
     return a[:i] + b[j:], b[:j] + a[i:]
 
 
-def mutate_replace(ind, min_size, max_size):
+def mutate_replace(ind, min_size, max_size, num_genes=len(rc.moves)):
     """Mutate an individual by replacing a fragment with a new one.
 
     Parameters:
     - ind: individual to be mutated
     - min_size: minimum size of the new/removed fragment
     - max_size: minimum size of the new/removed fragment
+    - num_genes: number of possible gene values (moves and macros)
 
     Returns the mutated individual."""
 
@@ -69,36 +161,218 @@ def mutate_replace(ind, min_size, max_size):
     remove_begin = random.randint(0, len(ind) - removed_fragment_size)
     remove_end = remove_begin + removed_fragment_size
 
-    new_fragment = create_ind(min_size, max_size)
+    new_fragment = create_ind(min_size, max_size, num_genes)
     return (ind[:remove_begin] + new_fragment + ind[remove_end:],)
 
 
+def mutate_adaptive(ind, min_size, rates, num_genes=len(rc.moves)):
+    """Mutate an individual as in mutate_replace, with the maximum
+    fragment size taken from an ops.AdaptiveRates object.
+
+    Parameters:
+    - ind: individual to be mutated
+    - min_size: minimum size of the new/removed fragment
+    - rates: ops.AdaptiveRates object
+    - num_genes: number of possible gene values (moves and macros)
+
+    Returns the mutated individual."""
+    max_size = max(min_size, rates.mut_max_size())
+    return mutate_replace(ind, min_size, max_size, num_genes)
+
+
+def neighbour_ind(ind, max_size, num_genes=len(rc.moves)):
+    """Create a neighbour of an individual for local search, by
+    appending, deleting or substituting a single gene.
+
+    Parameters:
+    - ind: individual whose neighbour is created
+    - max_size: maximum size of the neighbour
+    - num_genes: number of possible gene values (moves and macros)
+
+    Returns the new individual."""
+    changes = ["substitute"]
+    if len(ind) < max_size:
+        changes.append("append")
+    if len(ind) > 1:
+        changes.append("delete")
+    change = random.choice(changes)
+
+    if change == "append":
+        return ind + [random.randint(0, num_genes - 1)]
+    i = random.randint(0, len(ind) - 1)
+    if change == "delete":
+        return ind[:i] + ind[i + 1:]
+    # a different gene, so the neighbour isn't the individual itself
+    gene = random.randint(0, num_genes - 2)
+    if gene >= ind[i]:
+        gene += 1
+    return ind[:i] + [gene] + ind[i + 1:]
+
+
+def load_macros(config, side=rc.SIDE):
+    """Build the macro library described by a configuration.
+
+    The GA's optional 'Macros' section may contain:
+    - 'Commutators': whether to include the commutators of adjacent
+                     faces' quarter turns
+    - 'Sequences': list of space-separated move name strings
+    - 'Mined': number of macros to mine from the best individuals found
+               by previous runs on the same instance, as indexed in the
+               run database ('Database', run_db.DB_PATH by default)
+    - 'Elites': number of individuals to mine from (default 100)
+
+    The side parameter is the side length of the instance's cube.
+
+    Returns a rc.MacroLibrary, or None if the section is missing."""
+    macro_config = config['GA'].get('Macros')
+    if not macro_config:
+        return None
+
+    sequences = []
+    if macro_config.get('Commutators'):
+        sequences.extend(adjacent_commutators())
+    for names in macro_config.get('Sequences', []):
+        sequences.append(rc.move_names_to_ids(names, side))
+    if macro_config.get('Mined'):
+        import run_db
+        db_path = macro_config.get('Database', run_db.DB_PATH)
+        if os.path.exists(db_path):
+            conn = run_db.connect(db_path)
+            elites = run_db.elite_individuals(
+                conn, config['Rubiks'].get('InitialPath'),
+                macro_config.get('Elites', 100))
+            conn.close()
+            sequences.extend(mine_sequences([ind for _, ind in elites],
+                                            macro_config['Mined']))
+    return rc.MacroLibrary(sequences, side)
+
+
+def load_cache(config, initial_cube):
+    """Create the fitness cache described by a configuration.
+
+    The GA's optional 'Cache' setting is either true or a dict, which
+    may contain:
+    - 'Slots': number of slots of the table (default 2 ** 20)
+    - 'Save': whether to keep the table in a file named after the
+              instance, reused by later runs (default false)
+    - 'Directory': directory of the saved tables (default: cache in
+                   run_db.RUNS_DIR)
+
+    The initial_cube parameter is the cube of the instance.
+
+    Returns a fitness_cache.FitnessCache, or None if the setting is
+    missing."""
+    cache_config = config['GA'].get('Cache')
+    if not cache_config:
+        return None
+    if not isinstance(cache_config, dict):
+        cache_config = {}
+
+    slots = cache_config.get('Slots', 1 << 20)
+    path = None
+    if cache_config.get('Save'):
+        import run_db
+        cache_dir = cache_config.get('Directory',
+                                     os.path.join(run_db.RUNS_DIR, "cache"))
+        path = os.path.join(cache_dir, "{}-{}.npy".format(
+            instance_hash(initial_cube)[:16], slots))
+    return FitnessCache(slots, path)
+
+
+def load_archive(config, initial_cube):
+    """Open the elite archive described by a configuration.
+
+    The GA's optional 'Archive' setting is either true or a dict, which
+    may contain:
+    - 'Size': number of individuals kept for the instance (default 50)
+    - 'Fraction': fraction of every initial population taken from the
+                  archive, best first (default 0.1)
+    - 'Directory': directory of the archive files (default: elites in
+                   run_db.RUNS_DIR)
+
+    The initial_cube parameter is the cube of the instance.
+
+    Returns an elite_archive.EliteArchive and the fraction, or None and
+    0 if the setting is missing."""
+    archive_config = config['GA'].get('Archive')
+    if not archive_config:
+        return None, 0
+    if not isinstance(archive_config, dict):
+        archive_config = {}
+
+    import run_db
+    archive_dir = archive_config.get('Directory',
+                                     os.path.join(run_db.RUNS_DIR, "elites"))
+    archive = EliteArchive(initial_cube, archive_config.get('Size', 50),
+                           archive_path(archive_dir, initial_cube))
+    return archive, archive_config.get('Fraction', 0.1)
+
+
 class RubiconToolkit(Toolkit):
     """Toolkit for the Rubik's Cube GA solver.
 
     Utilizes relevant operators for the problem:
-    - create: random array of movements
+    - create: random array of movements, and optionally of macros
+              (see load_macros)
+    - init_pop: random individuals, and optionally the best ones of
+                previous runs on the instance (see load_archive)
     - select: tournament with elitism
     - vary: crossover, mutation and reproduction on independent
-            probabilities
+            probabilities, optionally adapted to the operators' success
+            (see ops.AdaptiveRates) with the GA's 'Adaptive' setting
     - mate: single-point crossover
     - mutate: random fragment replacement
+    - refine: optional memetic hill climbing on the best individuals
+              (see ops.refine_elites), from the GA's 'Memetic' setting
+    - stop: optional early termination criteria (see
+            ops.stop_criteria), from the GA's 'Stop' configuration
     - fitness: combined fitness described in combined_fitness's
-               docstring."""
-    def __init__(self, config):
+               docstring, optionally cached across processes and runs
+               (see load_cache), and optionally lazy with the GA's
+               'Lazy' setting: individuals which can't be selected get
+               a bound of their fitness (see staged_scores)."""
+    def __init__(self, config, initial_cube=None, cache=None):
         """Initialize the toolkit, binding the configuration to the
         operators.
 
         Parameters:
-        - config: configuration object with the execution parameters."""
+        - config: configuration object with the execution parameters.
+        - initial_cube: flat facelet cube to be solved, instead of the
+                        one described by the configuration.
+        - cache: fitness_cache.FitnessCache of another toolkit of the
+                 same configuration, e.g. in the process which created
+                 it, instead of a new one (see load_cache)."""
         self.config = config
         c = config['GA']
 
+        # initial cube, of any size, from a file or a facelet string
+        rubiks = config['Rubiks']
+        if initial_cube is not None:
+            initial_cube = np.asarray(initial_cube)
+        elif 'Facelets' in rubiks:
+            initial_cube = rc.from_string(rubiks['Facelets'], flatten=True,
+                                          validate=True)
+        else:
+            initial_cube = rc.from_file(rubiks['InitialPath'], flatten=True,
+                                        validate=True)
+        self.initial_cube = initial_cube
+        side = rc.cube_side(initial_cube)
+
+        # genome alphabet: primitive moves and, optionally, macros
+        macros = load_macros(config, side)
+        self.macros = macros
+        num_genes = len(macros) if macros else len(rc.move_table(side).moves)
+
         # create individual
         create = partial(create_ind, min_size=c['InitMinSize'],
-                         max_size=c['InitMaxSize'])
+                         max_size=c['InitMaxSize'], num_genes=num_genes)
         self.create = create
 
+        # seed initial populations with the best individuals of
+        # previous runs
+        self.archive, fraction = load_archive(config, initial_cube)
+        self.archive_seeds = int(round(c['PopSize'] * fraction))
+
         # select offspring
         not_elitist = c['PopSize'] - c['NumElitism']
         select = partial(ops.sel_tourn, num_offspring=not_elitist,
@@ -120,19 +394,108 @@ class RubiconToolkit(Toolkit):
 
         # mutate an individual
         mutate = partial(mutate_replace, min_size=c['MutMinSize'],
-                         max_size=c['MutMaxSize'])
+                         max_size=c['MutMaxSize'], num_genes=num_genes)
         mutate = ops.size_limit(mutate, c['IndMaxSize'])
         self.mutate = mutate
 
+        # adapt variation rates, from the configured ones in every run
+        self.num_genes = num_genes
+        self.rates = None
+        if c.get('Adaptive'):
+            self.adapt_rates()
+
+        # memetic local search on the best individuals
+        memetic_config = c.get('Memetic')
+        if memetic_config:
+            memetic = (memetic_config if isinstance(memetic_config, dict)
+                       else {})
+            self.neighbour = partial(neighbour_ind, max_size=c['IndMaxSize'],
+                                     num_genes=num_genes)
+            self.refine = partial(ops.refine_elites, toolkit=self,
+                                  interval=memetic.get('Interval', 10),
+                                  elites=memetic.get('Elites', 5),
+                                  steps=memetic.get('Steps', 5),
+                                  neighbours=memetic.get('Neighbours', 20))
+
+        # stop before the last generation
+        stop_config = c.get('Stop')
+        if stop_config:
+            stop = partial(ops.stop_criteria,
+                           target_fitness=stop_config.get('TargetFitness'),
+                           stagnation_gens=stop_config.get('StagnationGens'),
+                           min_improvement=stop_config.get('MinImprovement'),
+                           improvement_window=stop_config.get(
+                               'ImprovementWindow', 100))
+            self.stop = stop
+
         # compute fitness of an individual
-        initial_cube = rc.from_file(config['Rubiks']['InitialPath'],
-                                    flatten=True)
-        self.initial_cube = initial_cube
-        fitness = partial(combined_fitness, initial_cube=initial_cube)
+        apply_moves = macros.apply if macros else rc.apply_moves
+        if cache is None:
+            cache = load_cache(config, initial_cube)
+        self.cache = cache
+        fitness = partial(combined_fitness, initial_cube=initial_cube,
+                          apply_moves=apply_moves,
+                          cubie_weight=c.get('CubieWeight', 0), cache=cache)
         self.fitness = fitness
 
+        # bound the fitness of individuals which can't be selected
+        if c.get('Lazy'):
+            self.lazy = True
+            self.cutoff = partial(ops.tourn_cutoff, k=c['TournSize'],
+                                  num_elites=c['NumElitism'])
+
+    def adapt_rates(self):
+        """Create adaptive variation rates (see ops.AdaptiveRates),
+        starting from the configured ones, and bind vary, adapt and
+        mutate to them.
+
+        The GA's 'Adaptive' setting is either true or a dict, which may
+        contain 'MaxMutSize', 'LearningRate', 'TargetSuccess', 'Memory',
+        'MinProb' and 'MaxProb' (see ops.AdaptiveRates)."""
+        c = self.config['GA']
+        adaptive = c['Adaptive'] if isinstance(c['Adaptive'], dict) else {}
+        rates = ops.AdaptiveRates(
+            cx_prob=c['CxProb'], mut_prob=c['MutProb'],
+            mut_size=c['MutMaxSize'], min_mut_size=c['MutMinSize'],
+            max_mut_size=adaptive.get('MaxMutSize', c['IndMaxSize']),
+            learning_rate=adaptive.get('LearningRate', 0.1),
+            target_success=adaptive.get('TargetSuccess', 0.2),
+            memory=adaptive.get('Memory', 0.8),
+            min_prob=adaptive.get('MinProb', 0.01),
+            max_prob=adaptive.get('MaxProb', 1.0))
+        self.rates = rates
+        self.vary = partial(ops.vary_adaptive, toolkit=self, rates=rates)
+        self.adapt = rates.update
+        mutate = partial(mutate_adaptive, min_size=c['MutMinSize'],
+                         rates=rates, num_genes=self.num_genes)
+        self.mutate = ops.size_limit(mutate, c['IndMaxSize'])
+
+    def for_run(self):
+        """Copy the toolkit for a single run, with adaptive rates of its
+        own which start from the configured ones, so runs don't carry
+        over each other's rates.
+
+        Returns the copy, or the toolkit itself without adaptive
+        rates."""
+        if self.rates is None:
+            return self
+        toolkit = copy.copy(self)
+        toolkit.adapt_rates()
+        return toolkit
+
     def init_pop(self):
-        """Initialize a new population of Rubik's Cube GA individuals.
+        """Initialize a new population of Rubik's Cube GA individuals,
+        starting with the archive's best individuals, if any.
 
         Returns a list of individuals."""
-        return super().init_pop(self.config['GA']['PopSize'])
+        c = self.config['GA']
+        seeds = []
+        if self.archive is not None:
+            seeds = self.archive.best(self.archive_seeds, c['IndMaxSize'])
+        return seeds + super().init_pop(c['PopSize'] - len(seeds))
+
+    def expand(self, ind):
+        """Expand an individual's macros into primitive moves."""
+        if self.macros:
+            return self.macros.expand(ind)
+        return ind
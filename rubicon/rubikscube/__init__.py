@@ -1,5 +1,11 @@
-"""3x3x3 Rubik's Cube representation and rotation functions."""
+"""NxNxN Rubik's Cube representation and rotation functions."""
 
 from rubikscube.rubikscube import gen_cube, gen_3d_cube, print_3d_cube, piece_iter
-from rubikscube.file_io import from_file
-from rubikscube.movement import rotate, apply_moves, moves, move_list
+from rubikscube.rubikscube import cube_side, gen_pieces, SIDE, FACES
+from rubikscube.file_io import from_file, from_string, to_file, to_string
+from rubikscube.validation import cube_errors, validate_cube, InvalidCubeError
+from rubikscube.movement import rotate, apply_moves, moves, move_list, move_perms
+from rubikscube.movement import move_names_to_ids, move_table
+from rubikscube.macros import MacroLibrary
+from rubikscube.zobrist import zobrist_hash, zobrist_hashes, zobrist_update
+from rubikscube.zobrist import child_hashes, apply_moves_hashed
@@ -1,6 +1,13 @@
 import rubikscube.rubikscube as rc
 import numpy as np
 
+from functools import lru_cache
+from itertools import chain
+from math import sqrt
+
+from rubikscube.movement import move_table
+from rubikscube.validation import validate_cube, InvalidCubeError
+
 _colors = ["O", "G", "B", "R", "Y", "W"]
 _color_num = {color: num
               for num, color in enumerate(_colors)}
@@ -9,6 +16,31 @@ _face_names = ["Up", "Left", "Front", "Right", "Back", "Down"]
 _face_num = {face: num
              for num, face in enumerate(_face_names)}
 
+# color code of every byte (-1 for non-colors)
+_color_codes = np.full(256, -1)
+_color_codes[[ord(color) for color in _colors]] = range(len(_colors))
+_whitespace = np.zeros(256, dtype=bool)
+_whitespace[[ord(c) for c in " \t\r\n"]] = True
+
+
+def letters_to_colors(text):
+    """Convert color letters into color codes, ignoring whitespace.
+
+    Parameters:
+    - text: string of color letters
+
+    Returns an array of color codes.
+
+    Raises InvalidCubeError if a letter isn't a color."""
+    codes = np.frombuffer(text.encode(), dtype=np.uint8)
+    codes = codes[~_whitespace[codes]]
+    colors = _color_codes[codes]
+    if (colors < 0).any():
+        unknown = sorted(set(codes[colors < 0].tobytes().decode()))
+        raise InvalidCubeError(["unknown colors: {}".format(
+            ", ".join(unknown))])
+    return colors
+
 
 def read_cube(f):
     """Read a color-coded Rubik's Cube from a file.
@@ -18,17 +50,20 @@ def read_cube(f):
 
     Returns a color-coded cube, with colors from 0 to 5 in no
     particular order."""
-    side = int(next(f)[:-1])
-    cube = rc.gen_3d_cube()
+    side = int(next(f))
+    cube = rc.gen_3d_cube(side)
 
     for _ in range(rc.FACES):
-        face_name = next(f)[:-1]
+        face_name = next(f).strip()
         k = _face_num[face_name]
 
-        for i in range(side):
-            row = next(f)[:-1]
-            for j, facelet in enumerate(row.split()):
-                cube[k, i, j] = _color_num[facelet]
+        rows = "".join(next(f) for _ in range(side))
+        colors = letters_to_colors(rows)
+        if len(colors) != side * side:
+            raise InvalidCubeError(["face {} has {} colors instead of "
+                                    "{}".format(face_name, len(colors),
+                                                side * side)])
+        cube[k] = colors.reshape(side, side)
 
     return cube
 
@@ -36,12 +71,37 @@ def read_cube(f):
 def center_colors(cube):
     """List the center colors of a cube's faces, in order.
 
+    Cubes with an even side have no fixed centers, so the colors of the
+    up, left and back faces are taken from the up-left-back corner, and
+    each opposite face gets the only color which never shares a corner
+    with its opposite's.
+
     Parameters:
     - cube: color-coded 3D Rubik's Cube
 
     Returns a numpy array with the color code of the central piece of
     each face, indexed by face number."""
-    return np.array([cube[k, 1, 1] for k in range(rc.FACES)])
+    side = cube.shape[1]
+    if side % 2:
+        return np.array([cube[k, side // 2, side // 2]
+                         for k in range(rc.FACES)])
+
+    colors = set(np.unique(cube))
+    corners = [set(cube[index]) for index in rc.piece_iter(side)
+               if len(index[0]) == 3]
+
+    def opposite(color):
+        adjacent = set(chain.from_iterable(corner for corner in corners
+                                           if color in corner))
+        remaining = colors - adjacent
+        if len(remaining) != 1:
+            raise InvalidCubeError(["can't find the color opposite to "
+                                    "{}".format(_colors[color])])
+        return remaining.pop()
+
+    up, left, back = cube[0, 0, 0], cube[1, 0, 0], cube[4, 0, side - 1]
+    return np.array([up, left, opposite(back), opposite(left), back,
+                     opposite(up)])
 
 
 def remap_colors(cube, before_colors, after_colors):
@@ -54,49 +114,155 @@ def remap_colors(cube, before_colors, after_colors):
                     with before_colors
 
     Returns a cube with remapped colors."""
-    color_dict = {before: after
-                  for before, after in zip(before_colors, after_colors)}
+    color_map = np.zeros(max(np.max(cube), np.max(before_colors)) + 1,
+                         dtype=int)
+    color_map[before_colors] = after_colors
+    return color_map[cube]
+
 
-    color_map = np.vectorize(lambda before: color_dict[before])
-    return color_map(cube)
+class PieceGroup:
+    """Positions of the pieces of a cube size with the same number of
+    facelets, for converting colors to facelets (see color_to_facelet).
+
+    Each facelet of a piece is described by a code combining the orbit
+    of its position and its color, and each piece by a key combining
+    its sorted codes.
+
+    Parameters:
+    - positions: (pieces, k) array of flat facelet indices
+    - orbit_codes: array of dense orbit labels, per facelet position"""
+    def __init__(self, positions, orbit_codes):
+        self.positions = positions
+        self.orbit_codes = orbit_codes[positions] * rc.FACES
+        self.base = (orbit_codes.max() + 1) * rc.FACES
+        self.weights = self.base ** np.arange(positions.shape[1])
+
+        # solved pieces: their facelets are their positions
+        face_area = orbit_codes.size // rc.FACES
+        keys, order = self.keys(positions // face_area)
+        home_order = np.argsort(keys, kind="stable")
+        self.home_keys = keys[home_order]
+        self.home_facelets = np.take_along_axis(positions, order,
+                                                axis=1)[home_order]
+
+    def keys(self, colors):
+        """Compute the keys of pieces with the given colors.
+
+        Returns the keys, and the order of each piece's facelets by
+        code."""
+        codes = self.orbit_codes + colors
+        order = np.argsort(codes, axis=1)
+        sorted_codes = np.take_along_axis(codes, order, axis=1)
+        return sorted_codes @ self.weights, order
+
+
+@lru_cache(maxsize=None)
+def piece_groups(side):
+    """Group the pieces of a cube size by their number of facelets.
+
+    Parameters:
+    - side: side length of the cube
+
+    Returns a list of PieceGroup objects."""
+    shape = (rc.FACES, side, side)
+    _, orbit_codes = np.unique(move_table(side).orbits, return_inverse=True)
+    pieces = {}
+    for index in rc.piece_iter(side):
+        facelets = np.ravel_multi_index(index, shape)
+        pieces.setdefault(len(facelets), []).append(facelets)
+    return [PieceGroup(np.array(group), orbit_codes)
+            for _, group in sorted(pieces.items())]
 
 
 def color_to_facelet(color_cube):
     """Transforms a color-coded cube into a facelet cube.
 
+    Pieces are identified by their colors and by the orbits of the
+    positions of their facelets, which tell apart pieces of the same
+    colors on larger cubes (e.g. the two edge pieces between the same
+    faces of a 4x4x4). Among identical pieces, the first ones in
+    reading order get the lowest facelet ids.
+
     Parameters:
     - cube: color-coded 3D Rubik's Cube
 
-    Returns a facelet Rubik's Cube, with values from 0 to 53."""
+    Returns a facelet Rubik's Cube, with values from 0 to
+    6 * side ** 2 - 1.
 
-    side = color_cube.shape[1]
-    facelet_cube = color_cube.copy()
+    Raises InvalidCubeError if a piece doesn't exist, or appears more
+    times than it should."""
 
-    piece_ids = rc.piece_facelets()
+    side = color_cube.shape[1]
+    colors = color_cube.reshape(-1)
+    facelets = np.empty_like(colors)
+
+    for group in piece_groups(side):
+        keys, order = group.keys(colors[group.positions])
+        slot_order = np.argsort(keys, kind="stable")
+        if (keys[slot_order] != group.home_keys).any():
+            raise InvalidCubeError(_piece_errors(group, keys, colors))
+
+        # the i-th slot in key order gets the i-th solved piece in key
+        # order, and its facelets are matched by code
+        positions = np.take_along_axis(group.positions, order, axis=1)
+        facelets[positions[slot_order]] = group.home_facelets
+
+    return facelets.reshape(color_cube.shape)
+
+
+def _piece_errors(group, keys, colors):
+    """Describe the pieces whose colors don't match any solved piece,
+    or which appear too many times."""
+    home_keys, home_counts = np.unique(group.home_keys, return_counts=True)
+    expected = dict(zip(home_keys.tolist(), home_counts.tolist()))
+    errors = []
+    seen = {}
+    for slot, key in enumerate(keys.tolist()):
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] > expected.get(key, 0):
+            positions = group.positions[slot]
+            names = "".join(_colors[color] for color in colors[positions])
+            side = rc.cube_side(colors)
+            where = list(zip(*(index.tolist() for index in np.unravel_index(
+                positions, (rc.FACES, side, side)))))
+            errors.append("piece with colors {} at {} doesn't exist or is "
+                          "repeated".format(names, where))
+    return errors
+
+
+def read_facelet_string(text):
+    """Read a color-coded Rubik's Cube from a string of color letters.
+
+    The string lists the colors of the up, left, front, right, back and
+    down faces, in this order, each one row by row, as in a cube file.
+    Whitespace is ignored.
 
-    for index in rc.piece_iter():
-        color_vector = color_cube[index]
-        color_sort = sorted(zip(color_vector, range(len(color_vector))))
-        sorted_colors, order = zip(*color_sort)
+    Parameters:
+    - text: string of color letters
 
-        sorted_ids = piece_ids[tuple(sorted_colors)]
-        id_sort = sorted(zip(order, sorted_ids))
-        _, ids = zip(*id_sort)
-        facelet_cube[index] = ids
+    Returns a color-coded 3D cube, as in read_cube."""
+    colors = letters_to_colors(text)
+    side = int(round(sqrt(len(colors) / rc.FACES)))
+    if len(colors) != rc.FACES * side ** 2:
+        raise InvalidCubeError(["{} colors given, which isn't 6 times a "
+                                "square".format(len(colors))])
+    return colors.reshape(rc.FACES, side, side)
 
-    return facelet_cube
 
-
-def from_file(path, flatten=False):
-    """Read a facelet Rubik's Cube from a color-coded file.
+def from_colors(cube, flatten=False, validate=False, source=None):
+    """Convert a color-coded Rubik's Cube into a facelet cube.
 
     Parameters:
-    - path: path to the file containing the color-coded cube
+    - cube: color-coded 3D cube, with colors in any order
     - flatten: whether to flatten the cube
+    - validate: whether to check that the cube is solvable, raising
+                rc.InvalidCubeError otherwise
+    - source: description of where the cube came from, for errors
 
-    Returns a facelet Rubik's Cube, with values from 0 to 53."""
-    with open(path) as f:
-        cube = read_cube(f)
+    Returns a facelet Rubik's Cube, with values from 0 to
+    6 * side ** 2 - 1."""
+    if validate:
+        validate_cube(cube, source=source)
 
     before_colors = center_colors(cube)
     after_colors = np.array(range(rc.FACES))
@@ -105,3 +271,67 @@ def from_file(path, flatten=False):
     if flatten:
         cube = cube.flatten()
     return cube
+
+
+def from_file(path, flatten=False, validate=False):
+    """Read a facelet Rubik's Cube from a color-coded file.
+
+    Parameters:
+    - path: path to the file containing the color-coded cube
+    - flatten: whether to flatten the cube
+    - validate: whether to check that the cube is solvable, raising
+                rc.InvalidCubeError otherwise
+
+    Returns a facelet Rubik's Cube, with values from 0 to
+    6 * side ** 2 - 1."""
+    with open(path) as f:
+        cube = read_cube(f)
+    return from_colors(cube, flatten, validate, source=path)
+
+
+def from_string(text, flatten=False, validate=False):
+    """Read a facelet Rubik's Cube from a string of color letters (see
+    read_facelet_string).
+
+    Parameters:
+    - text: string of color letters
+    - flatten: whether to flatten the cube
+    - validate: whether to check that the cube is solvable, raising
+                rc.InvalidCubeError otherwise
+
+    Returns a facelet Rubik's Cube, with values from 0 to
+    6 * side ** 2 - 1."""
+    cube = read_facelet_string(text)
+    return from_colors(cube, flatten, validate, source="facelet string")
+
+
+def to_string(cube):
+    """Write a facelet Rubik's Cube in the format of a cube file.
+
+    Every facelet is given the color of the face it belongs to when the
+    cube is solved.
+
+    Parameters:
+    - cube: facelet cube, flat or 3D
+
+    Returns the text of the cube file, which from_file reads back into
+    the same cube."""
+    cube = np.asarray(cube).reshape(-1)
+    side = rc.cube_side(cube)
+    letters = np.array(_colors)[cube // (side * side)]
+    lines = [str(side)]
+    for face_name, face in zip(_face_names,
+                               letters.reshape(rc.FACES, side, side)):
+        lines.append(face_name)
+        lines.extend(" ".join(row) for row in face)
+    return "\n".join(lines) + "\n"
+
+
+def to_file(path, cube):
+    """Write a facelet Rubik's Cube to a cube file (see to_string).
+
+    Parameters:
+    - path: path of the file to be written
+    - cube: facelet cube, flat or 3D"""
+    with open(path, "w") as f:
+        f.write(to_string(cube))
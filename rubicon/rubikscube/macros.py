@@ -0,0 +1,128 @@
+import numpy as np
+
+from collections import Counter
+from itertools import chain
+
+from rubikscube.rubikscube import SIDE
+from rubikscube.movement import move_table
+
+FACE_NAMES = ["U", "L", "F", "R", "B", "D"]
+OPPOSITE_FACES = ({0, 5}, {1, 3}, {2, 4})
+QUARTER, HALF, INVERSE = range(3)
+
+
+def move_id(face, turn=QUARTER):
+    """Id of a face move (turn: QUARTER, HALF or INVERSE)."""
+    return face * 3 + turn
+
+
+def compile_sequence(sequence, side=SIDE):
+    """Compile a sequence of move ids into a single permutation.
+
+    Parameters:
+    - sequence: list of move ids
+    - side: side length of the cube
+
+    Returns a permutation array p such that cube[p] is the cube after
+    the sequence is applied."""
+    move_perms = move_table(side).perms
+    perm = np.arange(move_perms.shape[1])
+    for move in sequence:
+        perm = perm[move_perms[move]]
+    return perm
+
+
+def adjacent_commutators():
+    """Generate the commutators X Y X' Y' of clockwise quarter turns of
+    adjacent faces X and Y.
+
+    Returns a list of move id sequences."""
+    sequences = []
+    for x in range(len(FACE_NAMES)):
+        for y in range(len(FACE_NAMES)):
+            if x == y or {x, y} in OPPOSITE_FACES:
+                continue
+            sequences.append([move_id(x), move_id(y), move_id(x, INVERSE),
+                              move_id(y, INVERSE)])
+    return sequences
+
+
+def mine_sequences(individuals, count, min_len=2, max_len=6):
+    """Find the most frequent move subsequences in a set of individuals.
+
+    Subsequences are ranked by their number of occurrences times their
+    length, i.e. the number of genes they would save.
+
+    Parameters:
+    - individuals: lists of primitive move ids (e.g. elites of past runs)
+    - count: maximum number of subsequences to return
+    - min_len, max_len: bounds for the subsequences' lengths
+
+    Returns a list of move id sequences, best ranked first."""
+    counts = Counter()
+    for ind in individuals:
+        for length in range(min_len, max_len + 1):
+            for i in range(len(ind) - length + 1):
+                counts[tuple(ind[i:i + length])] += 1
+    ranked = sorted(counts.items(), key=lambda item: -item[1] * len(item[0]))
+    return [list(sequence) for sequence, n in ranked[:count] if n > 1]
+
+
+class MacroLibrary:
+    """Extended genome alphabet with macro moves.
+
+    The first gene values are the primitive moves (0 to 17 for a
+    3x3x3), and the following ones are macros, i.e. sequences of
+    primitive moves. Every gene is compiled into a single permutation,
+    so applying it costs a single gather regardless of its length.
+
+    Macros which are equivalent to the identity, to a primitive move or
+    to another macro are discarded.
+
+    Parameters:
+    - sequences: list of macros, as lists of primitive move ids
+    - side: side length of the cube"""
+    def __init__(self, sequences=(), side=SIDE):
+        self.side = side
+        move_perms = move_table(side).perms
+        self.sequences = [[move] for move in range(len(move_perms))]
+        seen = {perm.tobytes() for perm in move_perms}
+        seen.add(np.arange(move_perms.shape[1]).tobytes())
+
+        perms = list(move_perms)
+        for sequence in sequences:
+            perm = compile_sequence(sequence, side)
+            key = perm.tobytes()
+            if key in seen:
+                continue
+            seen.add(key)
+            self.sequences.append(list(sequence))
+            perms.append(perm)
+        self.perms = np.array(perms)
+
+    def __len__(self):
+        return len(self.sequences)
+
+    def apply(self, cube, genes):
+        """Perform a series of genes (moves or macros) onto a cube.
+
+        Parameters:
+        - cube: initial state of the flat cube
+        - genes: gene values
+
+        Returns a new cube onto which the genes have been performed."""
+        perms = self.perms
+        for gene in genes:
+            cube = cube[perms[gene]]
+        return cube
+
+    def expand(self, genes):
+        """Expand a list of gene values into primitive move ids."""
+        return list(chain.from_iterable(self.sequences[gene]
+                                        for gene in genes))
+
+    def name(self, gene):
+        """Mnemonic name of a gene, e.g. "(R U R' U')" for a macro."""
+        names = list(move_table(self.side).moves)
+        sequence = " ".join(names[move] for move in self.sequences[gene])
+        return sequence if gene < len(names) else "({})".format(sequence)
@@ -1,19 +1,22 @@
 import rubikscube.rubikscube as rc
 
 from collections import namedtuple, OrderedDict
-from functools import partial
+from functools import lru_cache, partial
 
 import numpy as np
 
 
-def rotate(cube, face, k=1):
-    """Rotate a Rubik's Cube's face clockwise.
+def rotate(cube, face, k=1, depth=0):
+    """Rotate a Rubik's Cube's face, or one of its inner slices,
+    clockwise.
 
     Parameters:
     - cube: Rubik's Cube np.ndarray (in 3D form, not flat)
     - face: index of the face to be rotated
     - k: number of subsequent rotations to perform
-         (1: clockwise, 2: 180o, 3: counterclockwise)"""
+         (1: clockwise, 2: 180o, 3: counterclockwise)
+    - depth: depth of the rotated slice (0 for the face itself, 1 for
+             the inner slice next to it etc.)"""
 
     assert cube.shape[0] == rc.FACES
     assert cube.shape[1] == cube.shape[2]
@@ -21,31 +24,33 @@ def rotate(cube, face, k=1):
     side = cube.shape[1]
 
     # Rotate facelets of the face itself
-    cube[face] = np.rot90(cube[face], 3)  # rot90 is ccw
+    if depth == 0:
+        cube[face] = np.rot90(cube[face], 3)  # rot90 is ccw
 
     # Rotate vectors adjacent to the face
-    adj_vector_indices = rc.adjacent_vector_indices()[face]
+    adj_vector_indices = rc.adjacent_vector_indices(side, depth)[face]
 
     prev_vector = cube[adj_vector_indices[-1]].copy()
     for vector_index in adj_vector_indices:
         prev_vector, cube[vector_index] = cube[vector_index].copy(), prev_vector
 
     if k > 1:
-        rotate(cube, face, k - 1)
+        rotate(cube, face, k - 1, depth)
 
 
 Move = namedtuple("Move", ("name", "function"))
 
 
-def freeze_move(f):
+def freeze_move(f, side=rc.SIDE):
     """Transform a 3D cube transformation function into a constant-time,
     equivalent function for a flat array-based Rubik's Cube.
 
     Parameters:
     - f: cube transformation function
+    - side: side length of the cubes f is applied to
 
     Returns: flat array transformation function equivalent to f"""
-    cube_before = rc.gen_3d_cube()
+    cube_before = rc.gen_3d_cube(side)
     cube_after = cube_before.copy()
 
     f(cube_after)
@@ -61,14 +66,22 @@ def freeze_move(f):
     return frozen
 
 
-def gen_moves():
+def gen_moves(side=rc.SIDE):
     """Generate all valid moves for a cube.
 
+    The face moves come first, in the same order for every size,
+    followed by the moves of the inner slices, from the outermost.
+
+    Parameters:
+    - side: side length of the cube
+
     Returns an OrderedDict of move functions, indexed by their
     mnemonic move names."""
     rotations = [
-        Move(name=name_fmt.format(face_name),
-             function=partial(rotate, face=face, k=k))
+        Move(name=("{}" if depth == 0 else str(depth + 1) + "{}").format(
+                 name_fmt.format(face_name)),
+             function=partial(rotate, face=face, k=k, depth=depth))
+        for depth in range(side // 2)
         for face, face_name in enumerate(["U", "L", "F", "R", "B", "D"])
         for k, name_fmt in enumerate(["{}", "{}2", "{}'"], start=1)
     ]
@@ -76,44 +89,142 @@ def gen_moves():
     moves = OrderedDict()
 
     for move in rotations:
-        f = freeze_move(move.function)
+        f = freeze_move(move.function, side)
         f.__name__ = move.name
         moves[move.name] = f
 
     return moves
 
 
-moves = gen_moves()
+def gen_move_perms(move_list, side=rc.SIDE):
+    """Generate the permutation array of every move.
+
+    Applying move i to a flat cube is equivalent to cube[perms[i]].
+
+    Parameters:
+    - move_list: list of flat cube move functions
+    - side: side length of the cube
+
+    Returns an integer array of shape (moves, facelets)."""
+    perms = []
+    for move in move_list:
+        cube = rc.gen_cube(side)
+        move(cube)
+        perms.append(cube)
+    return np.array(perms)
+
+
+def gen_orbits(perms):
+    """Label the orbits of the facelets under a set of moves.
+
+    Two facelets are in the same orbit if some sequence of moves takes
+    one to the other's position.
+
+    Parameters:
+    - perms: move permutation array, as in gen_move_perms
+
+    Returns an array with the label of each facelet's orbit (the
+    smallest facelet index in the orbit)."""
+    labels = np.arange(perms.shape[1])
+    while True:
+        # the set of moves is closed under inversion
+        new_labels = np.minimum(labels, labels[perms].min(axis=0))
+        if (new_labels == labels).all():
+            return labels
+        labels = new_labels
+
+
+def gen_classes(side, orbits):
+    """Label identical pieces and interchangeable facelets.
+
+    On larger cubes, pieces whose facelets have the same colors and
+    orbits (e.g. the four centers of a face of a 4x4x4) can't be told
+    apart, and so can their corresponding facelets.
+
+    Parameters:
+    - side: side length of the cube
+    - orbits: orbit labels of the facelets (see gen_orbits)
+
+    Returns a (piece_classes, facelet_classes) tuple of arrays with,
+    for every facelet, the label of its piece's class and of its own
+    class (the smallest facelet index of the first such piece)."""
+    face_area = side * side
+    piece_classes = rc.gen_cube(side)
+    facelet_classes = rc.gen_cube(side)
+    first_pieces = {}
+    for index in rc.piece_iter(side):
+        facelets = np.ravel_multi_index(index, (rc.FACES, side, side))
+        pairs = list(zip(orbits[facelets], facelets // face_area))
+        first = first_pieces.setdefault(tuple(sorted(pairs)),
+                                        dict(zip(pairs, facelets)))
+        piece_classes[facelets] = min(first.values())
+        facelet_classes[facelets] = [first[pair] for pair in pairs]
+    return piece_classes, facelet_classes
+
+
+MoveTable = namedtuple("MoveTable", ("moves", "perms", "orbits",
+                                     "piece_classes", "facelet_classes",
+                                     "ids"))
+
+
+@lru_cache(maxsize=None)
+def move_table(side=rc.SIDE):
+    """Build the moves of a cube size, once per size.
+
+    Parameters:
+    - side: side length of the cube
+
+    Returns a MoveTable with the OrderedDict of move functions, their
+    permutation array (see gen_move_perms), the facelets' orbits (see
+    gen_orbits), the facelets' piece and facelet classes (see
+    gen_classes) and a dict of move ids indexed by name."""
+    moves = gen_moves(side)
+    perms = gen_move_perms(moves.values(), side)
+    orbits = gen_orbits(perms)
+    piece_classes, facelet_classes = gen_classes(side, orbits)
+    ids = {move_str: move_id for move_id, move_str in enumerate(moves)}
+    table = MoveTable(moves=moves, perms=perms, orbits=orbits,
+                      piece_classes=piece_classes,
+                      facelet_classes=facelet_classes, ids=ids)
+    _perms_by_size[perms.shape[1]] = perms
+    return table
+
+
+_perms_by_size = {}
+
+moves = move_table().moves
 move_list = list(moves.values())
+move_perms = move_table().perms
 
-_move_str_to_id = {
-    move_str: move_id
-    for move_id, move_str in enumerate(moves)
-}
 
-def move_names_to_ids(move_names):
+def move_names_to_ids(move_names, side=rc.SIDE):
     """Transforms a list of move names to a list of integer ids.
 
     Parameters:
     - move_names: list or space-separated string of move names
+    - side: side length of the cube the moves are applied to
 
     Returns a list of move ids (integers), corresponding to values in
     the move_list."""
-    if issubclass(move_names, str):
+    if isinstance(move_names, str):
         move_names = move_names.split()
-    return [_move_str_to_id[move_name] for move_name in move_names]
+    ids = move_table(side).ids
+    return [ids[move_name] for move_name in move_names]
 
 
 def apply_moves(cube, move_ids):
     """Perform a series of moves onto a cube.
 
     Parameters:
-    - cube: initial state of the cube
+    - cube: initial state of the flat cube, of any size
     - move_ids: identifiers of each move
 
     Returns a copy of the cube onto which the moves have been
     performed."""
+    perms = _perms_by_size.get(cube.size)
+    if perms is None:
+        perms = move_table(rc.cube_side(cube)).perms
     cube = cube.copy()
     for move_id in move_ids:
-        move_list[move_id](cube)
+        cube = cube[perms[move_id]]
     return cube
@@ -1,6 +1,6 @@
 import sys
 import numpy as np
-from itertools import chain
+from functools import lru_cache
 from math import sqrt
 
 """
@@ -18,6 +18,12 @@ are the clockwise rotation of each of the six faces. Other moves
 often used can be made from these basic moves: counter-clockwise
 rotation, 180-degree rotation, rotation of the middle row of a face
 etc.
+
+Larger NxN cubes are stored the same way, in arrays of length
+6 * N ** 2. Besides the faces, their inner slices can be rotated: the
+slice at depth d from a face (counting the face as depth 1) is turned
+along with it by the move "dF" (e.g. "2R"). Middle slices of odd cubes
+aren't turned, so that their centers stay fixed.
 """
 
 FACES = 6
@@ -25,18 +31,23 @@ SQR_SIDES = 4
 SIDE = 3
 
 
-def gen_cube():
+def gen_cube(side=SIDE):
     """Generate a solved, flat array Rubik's Cube.
 
     The facelets in the cube are indexed from 0 to 6 * side ** 2."""
-    return np.array(range(FACES * SIDE ** 2))
+    return np.array(range(FACES * side ** 2))
 
 
-def gen_3d_cube():
+def gen_3d_cube(side=SIDE):
     """Generate a solved, 3D array Rubik's Cube.
 
     The facelets in the cube are indexed from 0 to 6 * side ** 2."""
-    return gen_cube().reshape((FACES, SIDE, SIDE))
+    return gen_cube(side).reshape((FACES, side, side))
+
+
+def cube_side(cube):
+    """Side length of a flat or 3D Rubik's Cube."""
+    return int(round(sqrt(np.size(cube) / FACES)))
 
 
 def print_3d_cube(cube, file=sys.stdout):
@@ -73,7 +84,7 @@ def print_3d_cube(cube, file=sys.stdout):
 
     up_face = cube[0]
     for row in up_face:
-        print_line(row, padding=9)
+        print_line(row, padding=3 * side)
 
     middle_faces = cube[1:5]
     for first_row, *other_rows in zip(*middle_faces):
@@ -82,7 +93,7 @@ def print_3d_cube(cube, file=sys.stdout):
 
     down_face = cube[5]
     for row in down_face:
-        print_line(row, padding=9)
+        print_line(row, padding=3 * side)
 
 
 def adjacent_faces():
@@ -107,10 +118,15 @@ def adjacent_faces():
     ])
 
 
-def adjacent_vector_indices():
+def adjacent_vector_indices(side=SIDE, depth=0):
     """List the indices to the vectors adjacent to each face in the
     Rubik's Cube, in clockwise order.
 
+    Parameters:
+    - side: side length of the cube
+    - depth: depth of the slice whose ring is listed (0 for the face
+             itself, 1 for the inner slice next to it etc.)
+
     Returns a list of lists of indiced for the adjacent vector rings
     to each face, indexed by face first and direction second."""
     # Faces
@@ -124,42 +140,47 @@ def adjacent_vector_indices():
     pos = slice(None)
     neg = slice(None, None, -1)
 
+    # rows/columns nearest to and farthest from each adjacent face's
+    # edge with the face
+    near = depth
+    far = side - 1 - depth
+
     return [
         [ # up
-            (back, 0, pos),
-            (right, 0, pos),
-            (front, 0, pos),
-            (left, 0, pos)
+            (back, near, pos),
+            (right, near, pos),
+            (front, near, pos),
+            (left, near, pos)
         ],
         [ # left
-            (up, pos, 0),
-            (front, pos, 0),
-            (down, pos, 0),
-            (back, 0, neg)
+            (up, pos, near),
+            (front, pos, near),
+            (down, pos, near),
+            (back, neg, far)
         ],
         [ # front
-            (up, 2, pos),
-            (right, pos, 0),
-            (down, 0, neg),
-            (left, neg, 2)
+            (up, far, pos),
+            (right, pos, near),
+            (down, near, neg),
+            (left, neg, far)
         ],
         [ # right
-            (up, neg, 2),
-            (back, pos, 0),
-            (down, neg, 2),
-            (front, neg, 2)
+            (up, neg, far),
+            (back, pos, near),
+            (down, neg, far),
+            (front, neg, far)
         ],
         [ # back
-            (up, 0, neg),
-            (right, pos, 0),
-            (down, 2, pos),
-            (left, neg, 2)
+            (up, near, neg),
+            (left, pos, near),
+            (down, far, pos),
+            (right, neg, far)
         ],
         [ # down
-            (front, 2, pos),
-            (right, 2, pos),
-            (back, 2, pos),
-            (left, 2, pos)
+            (front, far, pos),
+            (right, far, pos),
+            (back, far, pos),
+            (left, far, pos)
         ]
     ]
 
@@ -202,26 +223,41 @@ CENTERS = [
 ]
 
 
-def piece_iter():
-    """Iterator for every piece in a Rubik's Cube.
+@lru_cache(maxsize=None)
+def gen_pieces(side=SIDE):
+    """List the pieces of a Rubik's Cube of any size.
 
-    Yields multi-indices for a numpy 3D array."""
-    for vector_of_indices in chain(CORNERS, EDGES, CENTERS):
-        yield tuple(zip(*vector_of_indices))
+    Facelets belong to the same piece if they are turned by the same
+    layers, i.e. the same faces and slices.
 
+    Parameters:
+    - side: side length of the cube
 
-def piece_facelets():
-    """Generates a dict of color vector to facelet vector."""
-    facelet_cube = gen_3d_cube()
-    color_cube = gen_3d_cube()
+    Returns a tuple of pieces (corners first, then edges, then
+    centers), each one a tuple of the 3D indices of its facelets, as in
+    CORNERS."""
+    cube = gen_3d_cube(side)
+    layers = [set() for _ in range(cube.size)]
     for face in range(FACES):
-        color_cube[face].fill(face)
+        for facelet in cube[face].flat:
+            layers[facelet].add((face, 0))
+        for depth in range((side + 1) // 2):
+            for vector_index in adjacent_vector_indices(side, depth)[face]:
+                for facelet in cube[vector_index]:
+                    layers[facelet].add((face, depth))
+
+    pieces = {}
+    for facelet, facelet_layers in enumerate(layers):
+        pieces.setdefault(frozenset(facelet_layers), []).append(facelet)
+
+    pieces = sorted(pieces.values(), key=lambda piece: -len(piece))
+    return tuple(tuple(zip(*np.unravel_index(piece, cube.shape)))
+                 for piece in pieces)
 
-    color_to_facelet = {}
 
-    for index in piece_iter():
-        sort = sorted(zip(color_cube[index], facelet_cube[index]))
-        color_vector, facelet_vector = zip(*sort)
-        color_to_facelet[color_vector] = facelet_vector
+def piece_iter(side=SIDE):
+    """Iterator for every piece in a Rubik's Cube.
 
-    return color_to_facelet
+    Yields multi-indices for a numpy 3D array."""
+    for vector_of_indices in gen_pieces(side):
+        yield tuple(zip(*vector_of_indices))
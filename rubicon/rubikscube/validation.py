@@ -0,0 +1,254 @@
+"""Solvability validation of color-coded 3x3x3 Rubik's Cubes.
+
+A color-coded cube is solvable if and only if:
+- every corner and edge position holds an existing piece, and every
+  piece appears exactly once;
+- the corner twists add up to a multiple of 3;
+- the edge flips add up to a multiple of 2;
+- the corner and edge permutations have the same parity.
+
+Pieces are described by the faces they touch (e.g. "ULB" for the corner
+between the up, left and back faces), and stickers by the face whose
+center has the same color.
+
+Cubes of other sizes only get their color counts checked."""
+
+from collections import deque
+
+import numpy as np
+
+import rubikscube.rubikscube as rc
+from rubikscube.movement import move_perms
+
+FACE_LETTERS = "ULFRBD"
+UP, DOWN = 0, 5
+FRONT, BACK = 2, 4
+
+
+class InvalidCubeError(ValueError):
+    """Raised for unsolvable or malformed cubes.
+
+    The errors attribute lists a description of each problem found, and
+    the source attribute names where the cube came from, if known."""
+    def __init__(self, errors, source=None):
+        self.errors = errors
+        self.source = source
+        header = "Invalid cube{}:\n".format(
+            " in {}".format(source) if source else "")
+        super().__init__(header + "\n".join("- " + e for e in errors))
+
+
+def _flat_slots(pieces):
+    """Convert a list of pieces' 3D facelet indices into flat indices."""
+    side = rc.SIDE
+    return np.array([[k * side * side + i * side + j for k, i, j in piece]
+                     for piece in pieces])
+
+
+def _consistent_chirality(slots):
+    """Reorder corner slots so they all go around their corner in the
+    same rotational direction.
+
+    The direction of the first corner is propagated to the others via
+    the cube's moves, which preserve the cyclic order of the facelets.
+
+    Parameters:
+    - slots: (corners, 3) array of flat facelet indices
+
+    Returns the reordered slots."""
+    position_of = {frozenset(row): p for p, row in enumerate(slots)}
+
+    direction = {0: 1}
+    queue = deque([0])
+    while queue:
+        b = queue.popleft()
+        for perm in move_perms:
+            image = perm[slots[b]]
+            a = position_of[frozenset(image)]
+            if a in direction:
+                continue
+            rotations = [tuple(np.roll(slots[a], r)) for r in range(3)]
+            same = tuple(image) in rotations
+            direction[a] = direction[b] if same else -direction[b]
+            queue.append(a)
+
+    slots = slots.copy()
+    for p, d in direction.items():
+        if d < 0:
+            slots[p] = slots[p][[0, 2, 1]]
+    return slots
+
+
+CORNER_SLOTS = _consistent_chirality(_flat_slots(rc.CORNERS))
+EDGE_SLOTS = _flat_slots(rc.EDGES)
+CENTER_SLOTS = _flat_slots(rc.CENTERS)[:, 0]
+
+_slot_faces_corners = CORNER_SLOTS // (rc.SIDE * rc.SIDE)
+_slot_faces_edges = EDGE_SLOTS // (rc.SIDE * rc.SIDE)
+
+# reference slot of each position: its U/D facelet, or, for edges in the
+# middle layer, its F/B facelet
+_corner_ref = np.argmax((_slot_faces_corners == UP) |
+                        (_slot_faces_corners == DOWN), axis=1)
+_edge_ud = (_slot_faces_edges == UP) | (_slot_faces_edges == DOWN)
+_edge_fb = (_slot_faces_edges == FRONT) | (_slot_faces_edges == BACK)
+_edge_ref = np.where(_edge_ud.any(axis=1), np.argmax(_edge_ud, axis=1),
+                     np.argmax(_edge_fb, axis=1))
+
+
+def _piece_keys(colors):
+    """Encode each row of piece colors, regardless of their order, as
+    a single integer."""
+    sorted_colors = np.sort(colors, axis=1)
+    weights = rc.FACES ** np.arange(colors.shape[1])
+    return sorted_colors @ weights
+
+
+def _key_table(slot_faces):
+    """Map each solved piece's key to its home position (-1 if none)."""
+    table = np.full(rc.FACES ** slot_faces.shape[1], -1)
+    table[_piece_keys(slot_faces)] = np.arange(len(slot_faces))
+    return table
+
+
+_corner_table = _key_table(_slot_faces_corners)
+_edge_table = _key_table(_slot_faces_edges)
+
+
+def _name(faces):
+    """Name a piece or a sticker sequence by its face letters."""
+    return "".join(FACE_LETTERS[face] for face in faces)
+
+
+def _parity(perm):
+    """Parity (0 for even, 1 for odd) of a permutation array."""
+    n = len(perm)
+    inversions = (perm[:, None] > perm[None, :]) & np.triu(
+        np.ones((n, n), dtype=bool), 1)
+    return int(inversions.sum()) % 2
+
+
+def _piece_errors(kind, colors, slot_faces, table):
+    """Check piece existence and uniqueness for corners or edges.
+
+    Returns a list of errors and the permutation of the pieces (None
+    if any piece is wrong)."""
+    errors = []
+    homes = table[_piece_keys(colors)]
+    for p in np.flatnonzero(homes < 0):
+        errors.append("{} at {} has stickers {}, which is not a valid "
+                      "{}".format(kind, _name(slot_faces[p]),
+                                  _name(colors[p]), kind))
+
+    found, counts = np.unique(homes[homes >= 0], return_counts=True)
+    for home, count in zip(found, counts):
+        if count > 1:
+            at = ", ".join(_name(slot_faces[p])
+                           for p in np.flatnonzero(homes == home))
+            errors.append("{} {} appears {} times (at {})".format(
+                kind, _name(slot_faces[home]), count, at))
+    missing = np.setdiff1d(np.arange(len(slot_faces)), found)
+    for home in missing:
+        errors.append("{} {} is missing".format(kind, _name(slot_faces[home])))
+
+    return errors, (None if errors else homes)
+
+
+def cube_errors(cube):
+    """List the reasons why a color-coded cube is unsolvable.
+
+    Only the color counts are checked for cubes other than 3x3x3;
+    their pieces are checked when converted to facelets (see
+    file_io.color_to_facelet).
+
+    Parameters:
+    - cube: color-coded Rubik's Cube (flat or 3D), with any numbering
+            of the colors
+
+    Returns a list of error descriptions, empty if the cube is
+    solvable."""
+    cube = np.asarray(cube).reshape(-1)
+    side = rc.cube_side(cube)
+    if len(cube) != rc.FACES * side ** 2:
+        return ["cube has {} facelets, which isn't 6 times a square".format(
+            len(cube))]
+
+    if side != rc.SIDE:
+        colors, counts = np.unique(cube, return_counts=True)
+        if len(colors) != rc.FACES or (counts != side ** 2).any():
+            return ["colors should appear {} times each, but their counts "
+                    "are {}".format(side ** 2, dict(zip(colors.tolist(),
+                                                        counts.tolist())))]
+        return []
+
+    centers = cube[CENTER_SLOTS]
+    if len(np.unique(centers)) != rc.FACES:
+        return ["center colors are not all different: {}".format(
+            list(centers))]
+
+    # remap colors so that each color is the index of its face
+    color_map = np.full(cube.max() + 1, -1)
+    color_map[centers] = np.arange(rc.FACES)
+    colors = color_map[cube]
+    if (colors < 0).any():
+        return ["colors {} don't match any center".format(
+            sorted(set(cube[colors < 0])))]
+
+    corner_colors = colors[CORNER_SLOTS]
+    edge_colors = colors[EDGE_SLOTS]
+
+    corner_errors, corner_perm = _piece_errors(
+        "corner", corner_colors, _slot_faces_corners, _corner_table)
+    edge_errors, edge_perm = _piece_errors(
+        "edge", edge_colors, _slot_faces_edges, _edge_table)
+    errors = corner_errors + edge_errors
+    if errors:
+        return errors
+
+    # corner twist: offset of the U/D sticker from the U/D slot
+    ud_sticker = np.argmax((corner_colors == UP) | (corner_colors == DOWN),
+                           axis=1)
+    twists = (ud_sticker - _corner_ref) % 3
+    if twists.sum() % 3:
+        twisted = ", ".join("{} ({})".format(_name(_slot_faces_corners[p]),
+                                              twists[p])
+                            for p in np.flatnonzero(twists))
+        errors.append("corner twists add up to {} (mod 3), should be 0; "
+                      "twisted corners: {}".format(twists.sum() % 3, twisted))
+
+    # edge flip: the reference slot doesn't hold the reference sticker
+    ref_color = edge_colors[np.arange(len(edge_colors)), _edge_ref]
+    piece_ud = ((edge_colors == UP) | (edge_colors == DOWN)).any(axis=1)
+    ref_ok = np.where(piece_ud, (ref_color == UP) | (ref_color == DOWN),
+                      (ref_color == FRONT) | (ref_color == BACK))
+    flips = (~ref_ok).astype(int)
+    if flips.sum() % 2:
+        flipped = ", ".join(_name(_slot_faces_edges[p])
+                            for p in np.flatnonzero(flips))
+        errors.append("an odd number of edges is flipped; flipped edges: "
+                      "{}".format(flipped))
+
+    corner_parity = _parity(corner_perm)
+    edge_parity = _parity(edge_perm)
+    if corner_parity != edge_parity:
+        errors.append("corner permutation is {} but edge permutation is {} "
+                      "(two pieces are swapped)".format(
+                          ("even", "odd")[corner_parity],
+                          ("even", "odd")[edge_parity]))
+
+    return errors
+
+
+def validate_cube(cube, source=None):
+    """Check that a color-coded cube is solvable.
+
+    Parameters:
+    - cube: color-coded Rubik's Cube (flat or 3D)
+    - source: description of where the cube came from (e.g. its path),
+              used in the error message
+
+    Raises InvalidCubeError, describing every problem found, if the
+    cube is unsolvable."""
+    errors = cube_errors(cube)
+    if errors:
+        raise InvalidCubeError(errors, source)
@@ -0,0 +1,140 @@
+"""Zobrist hashing of cube states.
+
+The hash of a flat cube is the XOR of a random 64-bit key per
+(position, facelet) pair. A move only changes the facelets at the
+positions it touches (20 of 54 for a 3x3x3 face turn), so the hash of
+the cube after a move is the hash before it XOR the keys of the touched
+positions' old and new facelets, without hashing the whole cube again.
+Updates pay off in batches: child_hashes hashes every child of a set of
+states at once, before any child is computed.
+
+Keys are drawn from a generator seeded with the cube size, so hashes
+are the same in every process and run, and may be saved."""
+
+import numpy as np
+
+from collections import namedtuple
+from functools import lru_cache
+
+from rubikscube.rubikscube import SIDE, cube_side
+from rubikscube.movement import apply_moves, move_table
+
+MoveUpdates = namedtuple("MoveUpdates", ("touched", "sources"))
+
+
+@lru_cache(maxsize=None)
+def zobrist_keys(num_facelets):
+    """Random keys of the Zobrist hashes of a cube size.
+
+    Returns a flat array of num_facelets ** 2 keys, where the key of
+    facelet f at position p is at index p * num_facelets + f."""
+    rng = np.random.default_rng(num_facelets)
+    return rng.integers(0, np.iinfo(np.uint64).max, size=num_facelets ** 2,
+                        dtype=np.uint64, endpoint=True)
+
+
+@lru_cache(maxsize=None)
+def move_updates(side=SIDE):
+    """Find the positions every move of a cube size touches.
+
+    Returns a MoveUpdates tuple of (positions, moves) arrays, whose
+    columns are the moves: 'touched' are the positions whose facelet
+    every move changes, and 'sources' the positions from which those
+    facelets come. Moves which touch fewer positions than others (e.g.
+    inner slices) are padded with a position they don't change, whose
+    keys cancel out."""
+    perms = move_table(side).perms
+    positions = np.arange(perms.shape[1])
+    touched = [np.nonzero(perm != positions)[0] for perm in perms]
+    width = max(len(row) for row in touched)
+    padded = np.empty((len(perms), width), dtype=int)
+    for move, (perm, row) in enumerate(zip(perms, touched)):
+        fixed = np.nonzero(perm == positions)[0][0]
+        padded[move] = np.pad(row, (0, width - len(row)),
+                              constant_values=fixed)
+    sources = np.take_along_axis(perms, padded, axis=1)
+    return MoveUpdates(touched=np.ascontiguousarray(padded.T),
+                       sources=np.ascontiguousarray(sources.T))
+
+
+def zobrist_hashes(cubes):
+    """Hash every row of a (states, facelets) array of cubes.
+
+    Returns an array of 64-bit hashes."""
+    cubes = np.asarray(cubes)
+    num_facelets = cubes.shape[1]
+    offsets = np.arange(0, num_facelets ** 2, num_facelets)
+    keys = zobrist_keys(num_facelets).take(offsets + cubes)
+    return np.bitwise_xor.reduce(keys, axis=1)
+
+
+def zobrist_hash(cube):
+    """Hash a flat cube.
+
+    Returns the 64-bit hash as an int."""
+    return int(zobrist_hashes(np.asarray(cube)[None, :])[0])
+
+
+def child_hashes(cubes, hashes, parents, moves):
+    """Hash the children of states, from their parents' hashes.
+
+    Only the facelets the moves touch are read, and the children don't
+    need to be computed.
+
+    Parameters:
+    - cubes: (states, facelets) array of parent cubes
+    - hashes: Zobrist hashes of the parent cubes
+    - parents: row of the parent of every child
+    - moves: move id applied to the parent of every child
+
+    Returns an array with the 64-bit hash of every child."""
+    num_facelets = cubes.shape[1]
+    updates = move_updates(cube_side(cubes[0]))
+    keys = zobrist_keys(num_facelets)
+    facelets = np.ascontiguousarray(cubes).ravel()
+    rows = np.asarray(parents) * num_facelets
+    child = np.asarray(hashes, dtype=np.uint64)[parents]
+    # one touched position of every child at a time, XORing the keys of
+    # its old facelet and of its new one, from the source position
+    for touched, sources in zip(updates.touched, updates.sources):
+        touched = touched[moves]
+        offsets = touched * num_facelets
+        child ^= keys.take(offsets + facelets.take(rows + touched))
+        child ^= keys.take(offsets + facelets.take(rows + sources[moves]))
+    return child
+
+
+def zobrist_update(cube_hash, cube, move_id):
+    """Update a cube's hash with a move, from the facelets it touches.
+
+    Parameters:
+    - cube_hash: Zobrist hash of the cube
+    - cube: flat cube, before the move
+    - move_id: identifier of the move
+
+    Returns the hash of the cube after the move, as an int."""
+    updates = move_updates(cube_side(cube))
+    keys = zobrist_keys(cube.size)
+    touched = updates.touched[:, move_id]
+    offsets = touched * cube.size
+    changes = (keys.take(offsets + cube[touched]) ^
+               keys.take(offsets + cube[updates.sources[:, move_id]]))
+    return cube_hash ^ int(np.bitwise_xor.reduce(changes))
+
+
+def apply_moves_hashed(cube, move_ids):
+    """Perform a series of moves onto a cube, and hash the result.
+
+    Every update costs a few NumPy calls, whatever the number of
+    facelets it touches, so hashing the final cube once is cheaper
+    than updating the hash along with more than one move (see
+    zobrist_update).
+
+    Parameters:
+    - cube: initial state of the flat cube, of any size
+    - move_ids: identifiers of each move
+
+    Returns a copy of the cube onto which the moves have been performed
+    and its Zobrist hash, as an int."""
+    cube = apply_moves(cube, move_ids)
+    return cube, zobrist_hash(cube)
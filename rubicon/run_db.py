@@ -0,0 +1,308 @@
+"""SQLite index of GA experiment results.
+
+Walks a runs directory (see __main__.RUNS_DIR), parses the logs written
+by log_tools for every run and stores them in a local SQLite database,
+so experiments can be compared without re-parsing text logs.
+
+Usage: python3 rubicon/run_db.py [runs_dir] [db_path]"""
+
+import ast
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+
+import numpy as np
+
+THIS_FILE = os.path.realpath(__file__)
+RUNS_DIR = os.path.join(os.path.dirname(THIS_FILE), "../runs")
+DB_PATH = os.path.join(RUNS_DIR, "runs.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    experiment TEXT,
+    name TEXT,
+    config TEXT,
+    config_hash TEXT,
+    initial_path TEXT,
+    duration REAL,
+    gens INTEGER,
+    best_fitness REAL,
+    best TEXT
+);
+CREATE TABLE IF NOT EXISTS gen_stats (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    gen INTEGER NOT NULL,
+    fit_min REAL, fit_max REAL, fit_mean REAL, fit_std REAL,
+    size_min REAL, size_max REAL, size_mean REAL, size_std REAL,
+    same INTEGER,
+    improved INTEGER,
+    PRIMARY KEY (run_id, gen)
+);
+CREATE INDEX IF NOT EXISTS runs_name ON runs(name);
+CREATE INDEX IF NOT EXISTS runs_config_hash ON runs(config_hash);
+"""
+
+GEN_STATS_FIELDS = ("fit_min", "fit_max", "fit_mean", "fit_std",
+                    "size_min", "size_max", "size_mean", "size_std",
+                    "same", "improved")
+
+_duration_re = re.compile(r"This run took (\S+)s to finish")
+_record = r"(\S+) to (\S+) \(mean (\S+), std (\S+)\)"
+_row_re = re.compile(r"(\d+)\tFit: {rec}/Size: {rec}/Same: (\d+), "
+                     r"Improved: (\d+)".format(rec=_record))
+_best_re = re.compile(r"Best individual: (\[.*\]) / Fitness: (\S+)")
+
+
+def config_hash(config):
+    """Compute a content hash for a configuration object.
+
+    Parameters:
+    - config: configuration object (JSON-serializable)
+
+    Returns a hex digest which only depends on the configuration's
+    contents, not on key order."""
+    text = json.dumps(config, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def connect(db_path=DB_PATH):
+    """Open the run database, creating its tables if needed.
+
+    Parameters:
+    - db_path: path to the SQLite database file
+
+    Returns an sqlite3 connection."""
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def parse_run_log(path):
+    """Parse a run.log file written by log_tools.log_run.
+
+    Parameters:
+    - path: path to the run.log file
+
+    Returns a (duration, config, rows) tuple, where rows is a list of
+    per-generation tuples ordered as GEN_STATS_FIELDS."""
+    with open(path) as f:
+        text = f.read()
+
+    duration = float(_duration_re.search(text).group(1))
+
+    config_begin = text.index("Configuration:") + len("Configuration:")
+    config_end = text.index("\n\n", config_begin)
+    config = ast.literal_eval(text[config_begin:config_end].strip())
+
+    rows = []
+    for line in text[config_end:].splitlines():
+        match = _row_re.match(line)
+        if match:
+            gen, *values = match.groups()
+            rows.append((int(gen),) + tuple(float(v) for v in values[:8]) +
+                        tuple(int(v) for v in values[8:]))
+    return duration, config, rows
+
+
+def parse_individuals_log(path):
+    """Read the best individual from an individuals.log file.
+
+    Parameters:
+    - path: path to the individuals.log file
+
+    Returns a (best_fitness, best) tuple, or (None, None) if the file
+    doesn't exist."""
+    if not os.path.exists(path):
+        return None, None
+    with open(path) as f:
+        for line in f:
+            match = _best_re.match(line)
+            if match:
+                return float(match.group(2)), ast.literal_eval(match.group(1))
+    return None, None
+
+
+def find_run_dirs(runs_dir):
+    """Find every single run directory under a runs directory.
+
+    A run directory is any directory containing a run.log file.
+
+    Parameters:
+    - runs_dir: root directory of the experiments
+
+    Yields (experiment, run_dir) tuples."""
+    for experiment in sorted(os.listdir(runs_dir)):
+        experiment_dir = os.path.join(runs_dir, experiment)
+        if not os.path.isdir(experiment_dir):
+            continue
+        for dirpath, dirnames, filenames in os.walk(experiment_dir):
+            dirnames.sort()
+            if "run.log" in filenames:
+                yield experiment, dirpath
+
+
+def ingest_run(conn, experiment, run_dir):
+    """Insert a single run into the database.
+
+    Parameters:
+    - conn: database connection
+    - experiment: name of the experiment directory the run belongs to
+    - run_dir: directory of the run
+
+    Returns the id of the new run."""
+    duration, config, rows = parse_run_log(os.path.join(run_dir, "run.log"))
+    best_fitness, best = parse_individuals_log(
+        os.path.join(run_dir, "individuals.log"))
+
+    cursor = conn.execute(
+        "INSERT INTO runs (path, experiment, name, config, config_hash, "
+        "initial_path, duration, gens, best_fitness, best) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (run_dir, experiment, config.get('Name'),
+         json.dumps(config, sort_keys=True), config_hash(config),
+         config.get('Rubiks', {}).get('InitialPath'), duration, len(rows),
+         best_fitness, json.dumps(best)))
+    run_id = cursor.lastrowid
+
+    placeholders = ", ".join("?" * (len(GEN_STATS_FIELDS) + 2))
+    conn.executemany(
+        "INSERT INTO gen_stats (run_id, gen, {}) VALUES ({})".format(
+            ", ".join(GEN_STATS_FIELDS), placeholders),
+        [(run_id,) + row for row in rows])
+    return run_id
+
+
+def ingest(conn, runs_dir=RUNS_DIR, verbose=True):
+    """Index every run not yet present in the database.
+
+    Parameters:
+    - conn: database connection
+    - runs_dir: root directory of the experiments
+    - verbose: if False, nothing is printed to stdout.
+
+    Returns the number of newly indexed runs."""
+    known = {path for path, in conn.execute("SELECT path FROM runs")}
+    new_runs = 0
+    for experiment, run_dir in find_run_dirs(runs_dir):
+        run_dir = os.path.realpath(run_dir)
+        if run_dir in known:
+            continue
+        # individuals.log is the last file written for a run
+        if not os.path.exists(os.path.join(run_dir, "individuals.log")):
+            continue
+        try:
+            with conn:
+                ingest_run(conn, experiment, run_dir)
+        except (OSError, ValueError, SyntaxError, AttributeError) as e:
+            if verbose:
+                print("Skipping {}: {}".format(run_dir, e))
+            continue
+        new_runs += 1
+    if verbose:
+        print("Indexed {} new runs".format(new_runs))
+    return new_runs
+
+
+def _run_filter(name=None, config_hash=None, experiment=None):
+    """Build a WHERE clause selecting runs by name, hash or experiment."""
+    clauses = []
+    params = []
+    for column, value in (("name", name), ("config_hash", config_hash),
+                          ("experiment", experiment)):
+        if value is not None:
+            clauses.append("{} = ?".format(column))
+            params.append(value)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
+
+
+def run_ids(conn, **filters):
+    """List run ids matching a filter (name, config_hash, experiment).
+
+    Returns a numpy array of run ids, in path order."""
+    where, params = _run_filter(**filters)
+    query = "SELECT id FROM runs{} ORDER BY path".format(where)
+    return np.array([i for i, in conn.execute(query, params)], dtype=int)
+
+
+def run_values(conn, column, **filters):
+    """Fetch a per-run column (e.g. best_fitness, duration, gens).
+
+    Parameters:
+    - conn: database connection
+    - column: name of a numerical column of the runs table
+    - filters: name, config_hash and/or experiment to filter runs by
+
+    Returns a numpy array with one value per matching run."""
+    if column not in ("duration", "gens", "best_fitness"):
+        raise ValueError("Unknown run column: {}".format(column))
+    where, params = _run_filter(**filters)
+    query = "SELECT {} FROM runs{} ORDER BY path".format(column, where)
+    return np.array([v for v, in conn.execute(query, params)], dtype=float)
+
+
+def gen_curves(conn, field="fit_min", **filters):
+    """Fetch per-generation curves of a stat for a set of runs.
+
+    Parameters:
+    - conn: database connection
+    - field: one of GEN_STATS_FIELDS
+    - filters: name, config_hash and/or experiment to filter runs by
+
+    Returns a (runs, gens) numpy array. Runs shorter than the longest
+    one are padded with NaN."""
+    if field not in GEN_STATS_FIELDS:
+        raise ValueError("Unknown stat field: {}".format(field))
+    ids = run_ids(conn, **filters)
+    row_of = {run_id: row for row, run_id in enumerate(ids)}
+    where, params = _run_filter(**filters)
+    query = ("SELECT run_id, gen, {} FROM gen_stats "
+             "JOIN runs ON runs.id = gen_stats.run_id{}").format(field, where)
+    data = np.array(conn.execute(query, params).fetchall(), dtype=float)
+    data = data.reshape(-1, 3)
+
+    gens = int(data[:, 1].max()) + 1 if len(data) else 0
+    curves = np.full((len(ids), gens), np.nan)
+    rows = [row_of[run_id] for run_id in data[:, 0].astype(int)]
+    curves[rows, data[:, 1].astype(int)] = data[:, 2]
+    return curves
+
+
+def elite_individuals(conn, initial_path, count):
+    """Fetch the best individuals found for an instance.
+
+    Parameters:
+    - conn: database connection
+    - initial_path: path of the instance (the Rubiks.InitialPath
+                    configuration entry)
+    - count: maximum number of individuals
+
+    Returns a list of (fitness, individual) tuples, best first."""
+    query = ("SELECT best_fitness, best FROM runs WHERE initial_path = ? "
+             "AND best_fitness IS NOT NULL ORDER BY best_fitness LIMIT ?")
+    return [(fitness, json.loads(best))
+            for fitness, best in conn.execute(query, (initial_path, count))]
+
+
+def main():
+    """Index the runs directory given as the first command line
+    argument (default: RUNS_DIR) into the database given as the
+    second (default: runs.db inside the runs directory)."""
+    runs_dir = sys.argv[1] if len(sys.argv) > 1 else RUNS_DIR
+    db_path = (sys.argv[2] if len(sys.argv) > 2
+               else os.path.join(runs_dir, "runs.db"))
+    conn = connect(db_path)
+    ingest(conn, runs_dir)
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,503 @@
+import cProfile
+import math
+import time
+import os
+import pprint
+
+import rubikscube as rc
+from budget import Budget, handle_signals
+from beam import run_beam
+from ga import run_ga, run_steady, summarize_stats
+from ga.ga import StopRecord, ga_steps
+from log_tools import log_run, log_multi_run, log_individuals
+from metrics import RunMetrics, reporting
+
+
+def run_dir_path(all_runs_dir, run, runs):
+    """Build the path of a single run's directory inside a multi run.
+
+    Parameters:
+    - all_runs_dir: directory of the whole set of runs
+    - run: index of the run
+    - runs: total number of runs
+
+    Returns the path to the run's directory."""
+    digits = int(math.log(runs, 10)) + 1
+    run_id = str(run).zfill(digits)
+    return os.path.join(all_runs_dir, "run_{}".format(run_id))
+
+
+def run_search(toolkit, verbose=True, instrument=False, budget=None):
+    """Run the search engine selected by a toolkit's configuration.
+
+    The 'Engine' entry of the configuration is either "ga" (default),
+    which runs the GA on a new population, "steady", which runs the
+    asynchronous steady-state GA (see ga.run_steady) with the 'Batch'
+    (default 32) and 'InFlight' (default: twice the CPUs) of its
+    'Steady' section, or "beam", which runs a beam search (see
+    beam.run_beam) with the 'Width' (default 100) and 'Depth' (default:
+    the GA's 'Gens') of its 'Beam' section.
+
+    Parameters:
+    - toolkit: Toolkit object containing the operators and the fitness
+               function
+    - verbose: if False, nothing is printed to stdout.
+    - instrument: whether to instrument the GA's phases (see run_ga)
+    - budget: budget.Budget for the run, if any
+
+    Returns the final population, as (fitness, individual) tuples, and
+    the stats of the run."""
+    config = toolkit.config
+    budget = budget or Budget()
+    engine = config.get('Engine', "ga")
+    if engine == "beam":
+        beam_config = config.get('Beam', {})
+        with budget.phase("search"):
+            return run_beam(toolkit, beam_config.get('Width', 100),
+                            beam_config.get('Depth', config['GA']['Gens']),
+                            verbose, budget=budget)
+    if engine not in ("ga", "steady"):
+        raise ValueError("Unknown engine: {}".format(engine))
+
+    with budget.phase("init"):
+        pop = toolkit.init_pop()
+    with budget.phase("evolution"):
+        if engine == "steady":
+            steady_config = config.get('Steady', {})
+            return run_steady(pop, config['GA']['Gens'], toolkit,
+                              config['GA']['TournSize'],
+                              batch_size=steady_config.get('Batch', 32),
+                              in_flight=steady_config.get('InFlight'),
+                              verbose=verbose, budget=budget)
+        return run_ga(pop, config['GA']['Gens'], toolkit, verbose,
+                      instrument=instrument, budget=budget)
+
+
+def single_run(toolkit, run_dir, verbose=True, budget=None):
+    """Perform a single run of the genetic algorithm.
+
+    Parameters:
+    - toolkit: Toolkit object containing the operators and the fitness
+               function, to be passed to the GA procedure.
+    - run_dir: directory to which the log data should be saved for
+               the run
+    - verbose: if False, nothing is printed to stdout.
+    - budget: budget.Budget for the run. By default, it is created from
+              the 'Budget' section of the configuration.
+
+    The run uses its own copy of the toolkit's per-run state (see
+    Toolkit.for_run).
+
+    When the budget is exhausted, or on SIGINT/SIGTERM, the run stops
+    at the end of the current generation and the best individual found
+    so far is returned and logged.
+
+    The optional 'Metrics' setting of the configuration writes
+    periodic snapshots of the run's progress to its directory (see
+    metrics.RunMetrics.from_config).
+
+    The optional 'Profile' section of the configuration enables
+    per-phase instrumentation of the GA ('Phases') and profiling of the
+    whole run with cProfile ('CProfile'), whose results are dumped to
+    run.prof in the run directory.
+
+    Returns the best individual and its fitness, the entire population
+    after all generations and the execution stats."""
+    toolkit = toolkit.for_run()
+    config = toolkit.config
+    profile_config = config.get('Profile', {})
+    instrument = profile_config.get('Phases', False)
+    profiler = cProfile.Profile() if profile_config.get('CProfile') else None
+
+    if not os.path.exists(run_dir):
+        os.makedirs(run_dir)
+
+    if budget is None:
+        budget = Budget.from_config(config)
+
+    cache = getattr(toolkit, 'cache', None)
+    if cache:
+        cache_counts = cache.counts()
+
+    start_time = time.time()
+
+    if profiler:
+        profiler.enable()
+
+    metrics = RunMetrics.from_config(config, run_dir, budget=budget,
+                                     cache=cache)
+
+    with handle_signals(budget), reporting(toolkit, metrics):
+        fit_and_pop, stats = run_search(toolkit, verbose, instrument, budget)
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(run_dir, "run.prof"))
+
+    end_time = time.time()
+    duration = end_time - start_time  # in seconds
+
+    cache_report = cache.report(since=cache_counts) if cache else None
+    return finish_run(toolkit, run_dir, fit_and_pop, stats, duration, budget,
+                      verbose, cache_report)
+
+
+def finish_run(toolkit, run_dir, fit_and_pop, stats, duration, budget,
+               verbose=True, cache_report=None, archive=True):
+    """Report and log the results of a single run.
+
+    Parameters:
+    - toolkit: Toolkit object used for the run
+    - run_dir: directory to which the log data should be saved
+    - fit_and_pop: final population, as (fitness, individual) tuples
+    - stats: stats of the run
+    - duration: duration of the run, in seconds
+    - budget: budget.Budget used by the run
+    - verbose: if False, nothing is printed to stdout.
+    - cache_report: line describing the fitness cache's use by the run,
+                    to be reported in the log
+    - archive: whether to add the individuals to the toolkit's elite
+               archive (see archive_run)
+
+    Returns the best individual and its fitness, the entire population
+    and the stats, as single_run."""
+    pop = [ind for _, ind in fit_and_pop]
+
+    # report individuals as primitive moves, expanding any macros
+    best_fitness, best = stats['best']
+    best = toolkit.expand(best)
+    fit_and_pop = [(fitness, toolkit.expand(ind))
+                   for fitness, ind in fit_and_pop]
+
+    with budget.phase("logging"):
+        best_final_cube = rc.apply_moves(toolkit.initial_cube, best)
+        if verbose:
+            pprint.pprint(best, indent=4, compact=True)
+            print("Fitness:", best_fitness)
+            rc.print_3d_cube(best_final_cube)
+            if cache_report:
+                print(cache_report)
+
+        log_run(run_dir, toolkit.config, stats, duration, budget=budget,
+                cache_report=cache_report)
+        log_individuals(run_dir, fit_and_pop, best_final_cube,
+                        best=(best_fitness, best))
+
+        if archive:
+            archive_run(toolkit, [ind for _, ind in fit_and_pop] + [best])
+
+    return (best_fitness, best), pop, stats
+
+
+def archive_run(toolkit, inds):
+    """Add a run's individuals to the toolkit's elite archive, if it
+    has one (see rubicon_toolkit.load_archive), and save it.
+
+    The individuals are evaluated again, since the run's fitnesses are
+    those of their macro genomes, whose lengths differ, or lower bounds
+    with lazy evaluation.
+
+    Parameters:
+    - toolkit: Toolkit object used for the run
+    - inds: individuals, as primitive moves"""
+    archive = getattr(toolkit, 'archive', None)
+    if archive is None:
+        return
+    inds = list({tuple(ind): ind for ind in inds}.values())
+    fitnesses = toolkit.map(toolkit.fitness, inds)
+    archive.add(list(zip(fitnesses, inds)))
+    archive.save()
+
+
+def multi_run(toolkit, all_runs_dir, budget=None):
+    """Performs a set of GA runs.
+
+    Parameters:
+    - toolkit: Toolkit object containing the operators and the fitness
+               function, to be passed to the GA procedure.
+    - all_runs_dir: directory to which the summarized log data for all
+                    runs should be saved.
+    - budget: budget.Budget for all runs. By default, it is created
+              from the 'Budget' section of the configuration.
+
+    The remaining budget is divided equally among the remaining runs
+    before each run starts. Runs whose part of the budget can't afford
+    the initial population and a generation, or which would start after
+    a SIGINT/SIGTERM, are skipped.
+
+    With the optional 'Race' setting of the configuration, the runs
+    race against each other instead (see race).
+    """
+    config = toolkit.config
+    runs = config['Runs']
+    if budget is None:
+        budget = Budget.from_config(config)
+    if config.get('Race'):
+        return race(toolkit, all_runs_dir, budget)
+
+    fit_and_best = []
+    run_stats = []
+
+    start_time = time.time()
+
+    # the initial population and at least one generation
+    min_evals = 2 * config['GA']['PopSize']
+
+    with handle_signals(budget):
+        for run in range(runs):
+            run_budget = budget.split(runs - run)
+            reason = run_budget.exhausted(min_evals)
+            if reason:
+                print("Skipping the remaining {} runs: {}".format(runs - run,
+                                                                  reason))
+                break
+            run_dir = run_dir_path(all_runs_dir, run, runs)
+            run_fit_and_best, _, stats = single_run(
+                toolkit, run_dir, verbose=True, budget=run_budget)
+            log_fmt = "Run {}: Fitness {}\nBest: {}"
+            print(log_fmt.format(run, *run_fit_and_best))
+            fit_and_best.append(run_fit_and_best)
+            run_stats.append(stats)
+
+    end_time = time.time()
+    duration = end_time - start_time  # in seconds
+
+    if fit_and_best:
+        cache = getattr(toolkit, 'cache', None)
+        finish_multi_run(toolkit, all_runs_dir, fit_and_best, run_stats,
+                         duration, budget=budget,
+                         cache_report=cache.report() if cache else None)
+
+
+class RaceRun:
+    """A run of a race, advanced a few generations at a time.
+
+    The run's initial population is created and evaluated at once,
+    with the run's own copy of the toolkit's per-run state (see
+    Toolkit.for_run), since runs are interleaved.
+
+    Parameters:
+    - toolkit: Toolkit object containing the operators and the fitness
+               function
+    - run_dir: directory to which the log data should be saved
+    - budget: budget.Budget of the race, of which the run's budget is a
+              part
+    - generations: maximum number of generations of the run
+    - instrument: whether to instrument the GA's phases (see run_ga)"""
+    def __init__(self, toolkit, run_dir, budget, generations,
+                 instrument=False):
+        self.toolkit = toolkit = toolkit.for_run()
+        self.run_dir = run_dir
+        if not os.path.exists(run_dir):
+            os.makedirs(run_dir)
+        self.budget = Budget(parent=budget)
+        self.running = True
+        self.duration = 0
+        start_time = time.time()
+        with self.budget.phase("init"):
+            pop = toolkit.init_pop()
+        self.steps = ga_steps(pop, generations, toolkit, verbose=False,
+                              instrument=instrument, budget=self.budget)
+        with self.budget.phase("evolution"):
+            self.fitnesses, self.pop, self.stats = next(self.steps)
+        self.duration += time.time() - start_time
+
+    @property
+    def best_fitness(self):
+        """Best fitness found by the run so far."""
+        return self.stats['best'][0]
+
+    def advance(self, generations):
+        """Run the next generations, unless the run stops first."""
+        start_time = time.time()
+        with self.budget.phase("evolution"):
+            for _ in range(generations):
+                try:
+                    self.fitnesses, self.pop, self.stats = next(self.steps)
+                except StopIteration:
+                    self.running = False
+                    break
+        self.duration += time.time() - start_time
+
+    def stop(self, reason):
+        """Stop the run, recording the reason in its stats."""
+        self.steps.close()
+        self.running = False
+        self.stats['stop'] = StopRecord(reason=reason,
+                                        gen=len(self.stats['fitness']))
+
+    def finish(self):
+        """Log the run (see finish_run), returning its best fitness and
+        individual, and its stats. The run's individuals aren't added
+        to the elite archive (see archive)."""
+        best, _, stats = finish_run(self.toolkit, self.run_dir,
+                                    list(zip(self.fitnesses, self.pop)),
+                                    self.stats, self.duration, self.budget,
+                                    verbose=False, archive=False)
+        return best, stats
+
+    def archive(self):
+        """Add the run's final population and best individual to the
+        elite archive (see archive_run)."""
+        toolkit = self.toolkit
+        inds = list(self.pop) + [self.stats['best'][1]]
+        with self.budget.phase("logging"):
+            archive_run(toolkit, [toolkit.expand(ind) for ind in inds])
+
+
+def race_rounds(runs, drop):
+    """Count the rounds of a race without restarts until a single run
+    is left, if each round drops a fraction of the runs (see race)."""
+    rounds = 1
+    while runs > 1 and drop > 0:
+        runs -= min(math.ceil(runs * drop), runs - 1)
+        rounds += 1
+    return rounds
+
+
+def race(toolkit, all_runs_dir, budget=None):
+    """Performs a set of GA runs which race against each other, by
+    successive halving.
+
+    The runs share the generations the runs of multi_run would run
+    (Runs * Gens), divided equally among rounds. In every round, each
+    running run advances by the same number of generations, so those
+    of the runs dropped by previous rounds go to the survivors. After
+    every round but the last, the runs with the worst best fitnesses
+    are dropped: they stop, and are logged with their stats so far.
+
+    The configuration's 'Race' setting is either true or a dict, which
+    may contain:
+    - 'Drop': fraction of the running runs dropped after every round,
+              rounded up (default 0.5)
+    - 'Rounds': number of rounds (default: until a single run is left,
+                see race_rounds)
+    - 'Restarts': whether every dropped run is replaced by a new run
+                  (default false)
+
+    Runs use the generational GA, even if another engine is configured,
+    without the 'Metrics' and 'CProfile' settings. Runs which stop by
+    themselves (e.g. on the GA's 'Stop' criteria) leave the race. The
+    race stops early once the budget is exhausted. The runs' individuals
+    are only added to the elite archive, if any, once the race is over,
+    so all runs, restarts included, are seeded from the same archive.
+
+    Parameters:
+    - toolkit: Toolkit object containing the operators and the fitness
+               function
+    - all_runs_dir: directory to which the summarized log data for all
+                    runs should be saved.
+    - budget: budget.Budget for all runs. By default, it is created
+              from the 'Budget' section of the configuration."""
+    config = toolkit.config
+    race_config = config['Race'] if isinstance(config['Race'], dict) else {}
+    drop = race_config.get('Drop', 0.5)
+    runs = config['Runs']
+    rounds = race_config.get('Rounds') or race_rounds(runs, drop)
+    restarts = race_config.get('Restarts', False)
+    total_gens = runs * config['GA']['Gens']
+    instrument = config.get('Profile', {}).get('Phases', False)
+    if budget is None:
+        budget = Budget.from_config(config)
+
+    # restarts add runs, whose directories are named like the others
+    max_runs = runs * rounds if restarts else runs
+    results = {}
+
+    def start(run):
+        return RaceRun(toolkit, run_dir_path(all_runs_dir, run, max_runs),
+                       budget, total_gens, instrument)
+
+    def finish(run, racer):
+        results[run] = racer.finish()
+        print("Run {}: Fitness {} after {} generations ({})".format(
+            run, racer.best_fitness, racer.stats['stop'].gen,
+            racer.stats['stop'].reason))
+
+    start_time = time.time()
+
+    with handle_signals(budget):
+        racers = {run: start(run) for run in range(runs)}
+        for round_index in range(rounds):
+            running = {run: racer for run, racer in racers.items()
+                       if racer.running}
+            if not running or budget.exhausted():
+                break
+            gens = max(total_gens // rounds // len(running), 1)
+            for run, racer in running.items():
+                racer.advance(gens)
+                if not racer.running:
+                    finish(run, racer)
+
+            ranked = sorted((run for run, racer in running.items()
+                             if racer.running),
+                            key=lambda run: racers[run].best_fitness)
+            dropped = []
+            if round_index < rounds - 1 and ranked:
+                count = min(math.ceil(len(ranked) * drop), len(ranked) - 1)
+                dropped = ranked[len(ranked) - count:]
+            print("Round {}: {} runs ran {} generations, best fitness {}, "
+                  "dropping {} runs".format(
+                      round_index + 1, len(running), gens,
+                      min(racer.best_fitness for racer in racers.values()),
+                      len(dropped)))
+            for run in dropped:
+                racers[run].stop("dropped in round {}".format(
+                    round_index + 1))
+                finish(run, racers[run])
+                if restarts and not budget.exhausted():
+                    new_run = len(racers)
+                    racers[new_run] = start(new_run)
+
+        for run, racer in racers.items():
+            if racer.running:
+                racer.stop("end of race")
+                finish(run, racer)
+
+        # restarts are seeded from the archive as it was before the race
+        for run in sorted(results):
+            racers[run].archive()
+
+    end_time = time.time()
+    duration = end_time - start_time  # in seconds
+
+    fit_and_best = [results[run][0] for run in sorted(results)]
+    run_stats = [results[run][1] for run in sorted(results)]
+    cache = getattr(toolkit, 'cache', None)
+    finish_multi_run(toolkit, all_runs_dir, fit_and_best, run_stats,
+                     duration, budget=budget,
+                     cache_report=cache.report() if cache else None)
+
+
+def finish_multi_run(toolkit, all_runs_dir, fit_and_best, run_stats,
+                     duration, verbose=True, budget=None, cache_report=None):
+    """Summarize and log the results of a set of GA runs.
+
+    Parameters:
+    - toolkit: Toolkit object used for the runs
+    - all_runs_dir: directory to which the summarized log data for all
+                    runs should be saved.
+    - fit_and_best: list of (fitness, best individual) tuples, one
+                    per run
+    - run_stats: list of stats dictionaries, one per run
+    - duration: duration of all runs, in seconds
+    - verbose: if False, nothing is printed to stdout.
+    - budget: budget.Budget used by the runs, to be reported in the log
+    - cache_report: line describing the fitness cache's use by the
+                    runs, to be reported in the log
+
+    Returns the best fitness and individual among all runs."""
+    fitness, best = min(fit_and_best)
+    best_final_cube = rc.apply_moves(toolkit.initial_cube, best)
+    if verbose:
+        print('Best:', best)
+        print('Fitness:', fitness)
+        rc.print_3d_cube(best_final_cube)
+
+    summary = summarize_stats(run_stats)
+
+    log_multi_run(all_runs_dir, toolkit.config, summary, duration,
+                  budget=budget, cache_report=cache_report)
+    log_individuals(all_runs_dir, fit_and_best, best_final_cube)
+
+    return fitness, best
@@ -0,0 +1,287 @@
+"""Generate reproducible corpora of scrambled cubes.
+
+Usage: python3 rubicon/scramble.py OUTPUT [-n SIDE] [-d DEPTHS...]
+                                   [-c COUNT] [-s SEED] [-v VERIFY_DEPTH]
+
+COUNT scrambles are generated for every depth of DEPTHS, each a random
+canonical move sequence (see beam.successor_table) applied to a solved
+cube of side SIDE. Scrambles are checked against a breadth-first search
+from the solved cube up to VERIFY_DEPTH moves: those solvable in fewer
+moves than their depth are drawn again, so the depth of the remaining
+ones is their optimal solution length, if it's at most VERIFY_DEPTH, and
+a known solution length otherwise.
+
+If OUTPUT ends with .npz, the corpus is saved as a single compressed
+array file (see load_corpus). Otherwise, OUTPUT is a directory to which
+a cube file, in the format of inputs/inN/inN, is written per scramble,
+along with scrambles.csv, which lists their scrambles and solutions.
+Both can be given to batch.py."""
+
+import argparse
+import csv
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+import rubikscube as rc
+from beam import successor_table
+
+SCRAMBLE_FIELDS = ("name", "side", "depth", "optimal", "scramble", "solution")
+
+Corpus = namedtuple("Corpus", ("side", "names", "cubes", "moves", "depths",
+                               "optimal"))
+
+
+@lru_cache(maxsize=None)
+def scramble_moves(side=rc.SIDE):
+    """List the moves used in the scrambles of a cube size.
+
+    Cubes with an even side have no fixed centers, and cube files are
+    read with their up-left-back corner in place (see
+    file_io.center_colors), so their scrambles don't use the moves which
+    turn that corner. Any state is still reachable, up to a rotation of
+    the whole cube.
+
+    Returns an array of move ids."""
+    perms = rc.move_table(side).perms
+    if side % 2:
+        return np.arange(len(perms))
+    return np.nonzero(perms[:, 0] == 0)[0]
+
+
+def inverse_moves(moves):
+    """Invert a sequence of moves.
+
+    Returns the move ids which undo the sequence, in order."""
+    moves = np.asarray(moves)[::-1]
+    # X and X' swap, X2 stays
+    return moves - moves % 3 + 2 - moves % 3
+
+
+def random_scrambles(rng, count, depth, side=rc.SIDE):
+    """Draw random canonical move sequences.
+
+    Parameters:
+    - rng: numpy random Generator
+    - count: number of sequences
+    - depth: number of moves of every sequence
+    - side: side length of the cube
+
+    Returns a (count, depth) array of move ids."""
+    usable = scramble_moves(side)
+    successors = successor_table(side)[:, usable]
+    moves = np.empty((count, depth), dtype=int)
+    last = np.full(count, len(successors) - 1)  # successor row of no move
+    for step in range(depth):
+        allowed = successors[last]
+        choices = (rng.random(count) * allowed.sum(axis=1)).astype(int)
+        columns = (allowed.cumsum(axis=1) > choices[:, None]).argmax(axis=1)
+        last = moves[:, step] = usable[columns]
+    return moves
+
+
+def apply_scrambles(moves, side=rc.SIDE):
+    """Apply move sequences to solved cubes, all at once.
+
+    Parameters:
+    - moves: (scrambles, depth) array of move ids
+    - side: side length of the cube
+
+    Returns a (scrambles, facelets) array of cubes, equal to applying
+    each sequence with rc.apply_moves."""
+    perms = rc.move_table(side).perms
+    cubes = np.tile(rc.gen_cube(side), (len(moves), 1))
+    for step in range(moves.shape[1]):
+        cubes = np.take_along_axis(cubes, perms[moves[:, step]], axis=1)
+    return cubes
+
+
+@lru_cache(maxsize=None)
+def bfs_levels(side=rc.SIDE, max_depth=4):
+    """Search every state up to a number of moves from the solved cube.
+
+    Parameters:
+    - side: side length of the cube
+    - max_depth: depth of the search
+
+    Returns a list with the sorted state hashes (see rc.zobrist_hashes)
+    at each distance from the solved cube, from 0 to max_depth."""
+    usable = scramble_moves(side)
+    perms = rc.move_table(side).perms
+    solved = rc.gen_cube(side)
+    frontier = solved[None, :].astype(np.min_scalar_type(solved.size))
+    frontier_hashes = rc.zobrist_hashes(frontier)
+    levels = [frontier_hashes]
+    seen = levels[0]
+    for _ in range(max_depth):
+        # every move from every state, since a state's other last moves
+        # may allow successors the canonical rules would prune
+        parents = np.repeat(np.arange(len(frontier)), len(usable))
+        moves = np.tile(usable, len(frontier))
+        hashes = rc.child_hashes(frontier, frontier_hashes, parents, moves)
+        hashes, first = np.unique(hashes, return_index=True)
+        new = ~np.isin(hashes, seen, assume_unique=True)
+        first = first[new]
+        frontier = np.take_along_axis(frontier[parents[first]],
+                                      perms[moves[first]], axis=1)
+        frontier_hashes = hashes[new]
+        levels.append(frontier_hashes)
+        seen = np.union1d(seen, frontier_hashes)
+    return levels
+
+
+def known_distances(cubes, levels):
+    """Look up the distances of cubes from the solved cube.
+
+    Parameters:
+    - cubes: (states, facelets) array of cubes
+    - levels: state hashes by distance, as returned by bfs_levels
+
+    Returns an array with the distance of every cube, or -1 if it's
+    farther than the search went."""
+    hashes = rc.zobrist_hashes(cubes)
+    distances = np.full(len(cubes), -1)
+    for distance, level in enumerate(levels):
+        distances[(distances < 0) & np.isin(hashes, level)] = distance
+    return distances
+
+
+def generate(depths, count, side=rc.SIDE, seed=0, verify_depth=4):
+    """Generate a corpus of scrambles.
+
+    Parameters:
+    - depths: number of moves of each tier of scrambles
+    - count: number of scrambles per tier
+    - side: side length of the cube
+    - seed: seed of the random generator, which determines the corpus
+    - verify_depth: depth of the search against which scrambles are
+                    checked (0 to skip the check)
+
+    Returns a Corpus, whose moves are padded with -1 to the largest
+    depth and whose 'optimal' entries are the optimal solution lengths,
+    or -1 where they're unknown."""
+    rng = np.random.default_rng(seed)
+    levels = bfs_levels(side, verify_depth) if verify_depth else None
+    max_depth = max(depths)
+    names, cubes, moves, optimal = [], [], [], []
+    for depth in depths:
+        tier_moves = random_scrambles(rng, count, depth, side)
+        tier_cubes = apply_scrambles(tier_moves, side)
+        while levels is not None:
+            expected = depth if depth <= verify_depth else -1
+            redraw = np.nonzero(known_distances(tier_cubes, levels) !=
+                                expected)[0]
+            if not len(redraw):
+                break
+            tier_moves[redraw] = random_scrambles(rng, len(redraw), depth,
+                                                  side)
+            tier_cubes[redraw] = apply_scrambles(tier_moves[redraw], side)
+
+        digits = len(str(count - 1))
+        names.extend("d{}-{}".format(str(depth).zfill(2), str(i).zfill(digits))
+                     for i in range(count))
+        cubes.append(tier_cubes)
+        moves.append(np.pad(tier_moves, ((0, 0), (0, max_depth - depth)),
+                            constant_values=-1))
+        verified = levels is not None and depth <= verify_depth
+        optimal.append(np.full(count, depth if verified else -1))
+
+    depths = np.repeat(depths, count)
+    return Corpus(side=side, names=names, cubes=np.concatenate(cubes),
+                  moves=np.concatenate(moves), depths=depths,
+                  optimal=np.concatenate(optimal))
+
+
+def scramble_rows(corpus):
+    """Describe every scramble of a corpus.
+
+    Returns a list of dicts with the SCRAMBLE_FIELDS, where 'optimal' is
+    empty if unknown."""
+    names = list(rc.move_table(corpus.side).moves)
+    rows = []
+    for name, moves, depth, optimal in zip(corpus.names, corpus.moves,
+                                           corpus.depths, corpus.optimal):
+        moves = moves[:depth]
+        rows.append({
+            "name": name,
+            "side": corpus.side,
+            "depth": int(depth),
+            "optimal": int(optimal) if optimal >= 0 else "",
+            "scramble": " ".join(names[move] for move in moves),
+            "solution": " ".join(names[move] for move in inverse_moves(moves)),
+        })
+    return rows
+
+
+def write_text(corpus, out_dir):
+    """Write a corpus as a directory of cube files and scrambles.csv."""
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    for name, cube in zip(corpus.names, corpus.cubes):
+        rc.to_file(os.path.join(out_dir, name), cube)
+    with open(os.path.join(out_dir, "scrambles.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SCRAMBLE_FIELDS)
+        writer.writeheader()
+        writer.writerows(scramble_rows(corpus))
+
+
+def write_array(corpus, path):
+    """Write a corpus as a single compressed .npz file."""
+    cube_type = np.min_scalar_type(corpus.cubes.shape[1])
+    np.savez_compressed(path, side=corpus.side, names=np.array(corpus.names),
+                        cubes=corpus.cubes.astype(cube_type),
+                        moves=corpus.moves.astype(np.int16),
+                        depths=corpus.depths, optimal=corpus.optimal)
+
+
+def read_array(path):
+    """Read a corpus written by write_array.
+
+    Returns a Corpus."""
+    with np.load(path) as data:
+        return Corpus(side=int(data['side']), names=data['names'].tolist(),
+                      cubes=data['cubes'].astype(int),
+                      moves=data['moves'].astype(int),
+                      depths=data['depths'], optimal=data['optimal'])
+
+
+def load_corpus(path):
+    """Read the instances of a corpus written by write_array.
+
+    Returns a list of (name, facelet cube) tuples, named after the file
+    and the scramble."""
+    corpus = read_array(path)
+    return [("{}:{}".format(path, name), cube)
+            for name, cube in zip(corpus.names, corpus.cubes)]
+
+
+def main():
+    """Parse the command line and write the corpus."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("output", help=".npz file or directory")
+    parser.add_argument("-n", "--side", type=int, default=rc.SIDE,
+                        help="side length of the cubes")
+    parser.add_argument("-d", "--depths", type=int, nargs="+",
+                        default=[5, 10, 15, 20],
+                        help="number of moves of each tier")
+    parser.add_argument("-c", "--count", type=int, default=100,
+                        help="number of scrambles per tier")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+                        help="seed of the corpus")
+    parser.add_argument("-v", "--verify-depth", type=int, default=4,
+                        help="depth of the search checking the scrambles")
+    args = parser.parse_args()
+
+    corpus = generate(args.depths, args.count, args.side, args.seed,
+                      args.verify_depth)
+    if args.output.endswith(".npz"):
+        write_array(corpus, args.output)
+    else:
+        write_text(corpus, args.output)
+    print("{} scrambles written to {}".format(len(corpus.names), args.output))
+
+
+if __name__ == '__main__':
+    main()
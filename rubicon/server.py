@@ -0,0 +1,261 @@
+"""Warm local solve server.
+
+Keeps the interpreter, the cube tables and a process pool alive between
+solve jobs, so small jobs don't pay for the startup of a new process.
+Jobs are submitted over a Unix domain socket, e.g. with client.py.
+
+Usage: python3 rubicon/server.py [-s SOCKET] [-j CORES]
+
+Every connection carries a single request (see protocol.py):
+- {"solve": {"config": CONFIG, "run_dir": DIR}} runs the configuration's
+  search engine (see runner.run_search) once on its instance
+  (Rubiks.InitialPath, or Rubiks.Facelets, see rc.from_string). The
+  server replies with {"job": ID}, then one {"progress": {...}} line per
+  generation, and finally {"result": {...}} or {"error": MESSAGE}. If a
+  run directory is given, the run is logged to it as by single_run.
+- {"cancel": ID} stops a job at the end of its current generation; its
+  best individual is still sent as its result.
+- {"status": true} lists the running jobs.
+- {"shutdown": true} stops the server."""
+
+import argparse
+import errno
+import itertools
+import multiprocessing as mp
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+import rubikscube as rc
+from budget import Budget
+from protocol import SOCKET_PATH, send, receive
+from rubicon_toolkit import RubiconToolkit
+from runner import run_search, single_run
+
+
+def progress_message(gen, stats, budget):
+    """Summarize a generation's stats as a progress message.
+
+    Parameters:
+    - gen: index of the generation
+    - stats: stats of the run so far (see ga.run_ga)
+    - budget: budget.Budget of the job
+
+    Returns a dict with the generation's fitness and size stats, the
+    best fitness so far and the evaluations done."""
+    fitness = stats['fitness'][-1]
+    return {
+        "gen": gen,
+        "min": float(fitness.min),
+        "mean": float(fitness.mean),
+        "size": float(stats['size'][-1].mean),
+        "best": float(stats['best'][0]),
+        "evals": budget.used_evals,
+        "seconds": budget.elapsed(),
+    }
+
+
+def socket_in_use(path):
+    """Check whether a server is listening on a Unix socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+class SolveServer(socketserver.ThreadingMixIn,
+                  socketserver.UnixStreamServer):
+    """Unix socket server running solve jobs on a shared process pool.
+
+    Parameters:
+    - path: path of the socket
+    - pool: multiprocessing.Pool for fitness evaluations (None to
+            evaluate in the server process)
+
+    Raises OSError if another server is listening on the socket. A
+    socket left over by a server which didn't stop cleanly is replaced."""
+    daemon_threads = True
+
+    def __init__(self, path, pool=None):
+        if os.path.exists(path):
+            if socket_in_use(path):
+                raise OSError(errno.EADDRINUSE,
+                              "A server is already listening", path)
+            os.remove(path)
+        super().__init__(path, SolveHandler)
+        self.pool = pool
+        self.jobs = {}
+        self.job_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def solve(self, request, wfile):
+        """Run a solve job, streaming its progress.
+
+        Parameters:
+        - request: solve request, with a 'config' and an optional
+                   'run_dir' entry
+        - wfile: file to which the job's messages are written"""
+        config = request['config']
+        try:
+            toolkit = RubiconToolkit(config)
+        except (OSError, KeyError, ValueError) as e:
+            send(wfile, {"error": "{}: {}".format(type(e).__name__, e)})
+            return
+        if self.pool:
+            toolkit.map = self.pool.map
+            toolkit.apply_async = self.pool.apply_async
+        budget = Budget.from_config(config)
+
+        with self.lock:
+            job_id = next(self.job_ids)
+            self.jobs[job_id] = (config.get('Name'), budget)
+        try:
+            send(wfile, {"job": job_id})
+
+            def report(gen, stats):
+                try:
+                    send(wfile, {"progress": progress_message(gen, stats,
+                                                              budget)})
+                except OSError:
+                    budget.interrupt()  # the client is gone
+            toolkit.report = report
+
+            run_dir = request.get('run_dir')
+            if run_dir:
+                (fitness, best), _, stats = single_run(
+                    toolkit, run_dir, verbose=False, budget=budget)
+            else:
+                _, stats = run_search(toolkit, verbose=False, budget=budget)
+                fitness, best = stats['best']
+                best = toolkit.expand(best)
+
+            names = list(rc.move_table(rc.cube_side(toolkit.initial_cube))
+                         .moves)
+            send(wfile, {"result": {
+                "job": job_id,
+                "fitness": float(fitness),
+                "best": [int(move) for move in best],
+                "moves": " ".join(names[move] for move in best),
+                "gens": stats['stop'].gen,
+                "stop": stats['stop'].reason,
+                "evals": budget.used_evals,
+                "seconds": budget.elapsed(),
+            }})
+        finally:
+            with self.lock:
+                del self.jobs[job_id]
+
+    def cancel(self, job_id):
+        """Interrupt a job's budget. Returns whether the job exists."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job:
+            job[1].interrupt()
+        return job is not None
+
+    def status(self):
+        """List the running jobs' ids, names and progress."""
+        with self.lock:
+            jobs = list(self.jobs.items())
+        return [{"job": job_id, "name": name, "evals": budget.used_evals,
+                 "seconds": budget.elapsed()}
+                for job_id, (name, budget) in jobs]
+
+
+class SolveHandler(socketserver.StreamRequestHandler):
+    """Handles a single request of a SolveServer connection."""
+    def handle(self):
+        try:
+            request = receive(self.rfile)
+        except ValueError as e:
+            send(self.wfile, {"error": "invalid request: {}".format(e)})
+            return
+        if request is None:
+            return
+
+        server = self.server
+        try:
+            if 'solve' in request:
+                server.solve(request['solve'], self.wfile)
+            elif 'cancel' in request:
+                send(self.wfile,
+                     {"cancelled": server.cancel(request['cancel'])})
+            elif 'status' in request:
+                send(self.wfile, {"jobs": server.status()})
+            elif 'shutdown' in request:
+                send(self.wfile, {"shutdown": True})
+                threading.Thread(target=server.shutdown).start()
+            else:
+                send(self.wfile, {"error": "unknown request"})
+        except OSError:
+            pass  # the client is gone
+        except (KeyError, TypeError, ValueError) as e:
+            send(self.wfile, {"error": "{}: {}".format(type(e).__name__, e)})
+        except Exception as e:
+            # e.g. a failed job: the client still gets a reply, and the
+            # server goes on
+            try:
+                send(self.wfile, {"error": "internal error: {}: {}".format(
+                    type(e).__name__, e)})
+            except OSError:
+                pass
+            raise
+
+
+def serve(path=SOCKET_PATH, cores=None, verbose=True):
+    """Run a solve server until it's shut down or interrupted.
+
+    Parameters:
+    - path: path of the socket
+    - cores: number of worker processes (default: all cores, 0 to
+             evaluate in the server process)
+    - verbose: if False, nothing is printed to stdout."""
+    pool = None
+    if cores != 0:
+        # workers ignore SIGINT, which is handled by the server
+        pool = mp.Pool(cores, initializer=signal.signal,
+                       initargs=(signal.SIGINT, signal.SIG_IGN))
+
+    try:
+        server = SolveServer(path, pool)
+    except OSError:
+        if pool:
+            pool.terminate()
+        raise
+    if verbose:
+        print("Listening on", path)
+    start_time = time.time()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+        if pool:
+            pool.terminate()
+    if verbose:
+        print("Server stopped after {:.1f}s".format(time.time() - start_time))
+
+
+def main():
+    """Parse the command line and run the server."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-s", "--socket", default=SOCKET_PATH,
+                        help="path of the Unix socket")
+    parser.add_argument("-j", "--cores", type=int, default=None,
+                        help="number of worker processes (0: no pool)")
+    args = parser.parse_args()
+    try:
+        serve(args.socket, args.cores)
+    except OSError as e:
+        parser.exit(1, "{}\n".format(e))
+
+
+if __name__ == '__main__':
+    main()
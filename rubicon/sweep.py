@@ -0,0 +1,265 @@
+"""Run sweeps over many experiment configurations.
+
+Every run of every configuration is scheduled as an independent task in
+a single process pool, so the pool is kept busy across experiments.
+Configurations which already have all their runs indexed in the run
+database (see run_db) are skipped.
+
+Usage: python3 rubicon/sweep.py [-j CORES] [-g GRID] CONFIG_DIR_OR_GLOB...
+
+The optional grid is a JSON object mapping dotted configuration keys to
+lists of values, e.g. {"GA.PopSize": [50, 100], "GA.TournSize": [3, 5]},
+and every configuration is expanded into the cartesian product of those
+values."""
+
+import argparse
+import copy
+import datetime
+import glob
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+import time
+
+import run_db
+from budget import Budget
+from rubicon_toolkit import RubiconToolkit
+from runner import single_run, finish_multi_run, run_dir_path
+
+
+def find_configs(patterns):
+    """List the configuration files matched by directories or globs.
+
+    Parameters:
+    - patterns: list of directories (searched recursively for .json
+                files) and glob patterns
+
+    Returns a sorted list of configuration file paths."""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*.json")
+        paths.update(glob.glob(pattern, recursive=True))
+    return sorted(paths)
+
+
+def set_param(config, key, value):
+    """Set a nested configuration parameter.
+
+    Parameters:
+    - config: configuration object, modified in place
+    - key: dotted path to the parameter, such as "GA.PopSize"
+    - value: new value of the parameter"""
+    *parents, name = key.split(".")
+    for parent in parents:
+        config = config.setdefault(parent, {})
+    config[name] = value
+
+
+def expand_grid(config, grid):
+    """Expand a configuration over a grid of parameter values.
+
+    Parameters:
+    - config: base configuration object
+    - grid: dict mapping dotted parameter keys to lists of values
+
+    Returns a list of configurations, one per point of the grid, whose
+    names are suffixed with the grid values."""
+    if not grid:
+        return [config]
+    keys = sorted(grid)
+    configs = []
+    for values in itertools.product(*(grid[key] for key in keys)):
+        point = copy.deepcopy(config)
+        suffix = []
+        for key, value in zip(keys, values):
+            set_param(point, key, value)
+            suffix.append("{}={}".format(key.split(".")[-1], value))
+        point['Name'] = "-".join([config['Name']] + suffix)
+        configs.append(point)
+    return configs
+
+
+def completed_runs(conn, config):
+    """Count the indexed runs of a configuration.
+
+    Parameters:
+    - conn: run database connection
+    - config: configuration object
+
+    Returns the number of runs in the database with the same content
+    hash as the configuration."""
+    query = "SELECT COUNT(*) FROM runs WHERE config_hash = ?"
+    return conn.execute(query, (run_db.config_hash(config),)).fetchone()[0]
+
+
+_toolkits = {}
+
+
+def _run_task(task):
+    """Execute a single run inside a worker process.
+
+    Parameters:
+    - task: (config index, run index, config, fitness cache, run_dir,
+            seed) tuple, where the fitness cache is the one of the
+            configuration's toolkit in the main process, or None
+
+    Returns the config and run indices, the best fitness and individual,
+    the run stats and its duration."""
+    config_index, run, config, cache, run_dir, seed = task
+    random.seed(seed)
+
+    key = run_db.config_hash(config)
+    if key not in _toolkits:
+        # runs are scheduled by configuration: the previous one's
+        # toolkit, and its mapping of the cache, are dropped
+        _toolkits.clear()
+        _toolkits[key] = RubiconToolkit(config, cache=cache)
+    toolkit = _toolkits[key]
+
+    # each run gets an equal share of the configuration's budget
+    budget = Budget.from_config(config).split(config['Runs'])
+
+    start_time = time.time()
+    (fitness, best), _, stats = single_run(toolkit, run_dir, verbose=False,
+                                           budget=budget)
+    duration = time.time() - start_time
+    return config_index, run, (fitness, best), stats, duration
+
+
+def sweep(configs, runs_dir, cores=None, verbose=True):
+    """Run every pending run of a list of configurations.
+
+    Parameters:
+    - configs: list of (config file path, config object) tuples
+    - runs_dir: root directory for the experiments' logs
+    - cores: number of worker processes (default: all cores)
+    - verbose: if False, nothing is printed to stdout.
+
+    Returns a list of summary dicts, one per configuration."""
+    conn = run_db.connect(os.path.join(runs_dir, "runs.db"))
+    run_db.ingest(conn, runs_dir, verbose=False)
+
+    timestr = datetime.datetime.now().strftime("%Y%m%d-%Hh%Mm%Ss")
+    summaries = []
+    toolkits = {}  # config index -> toolkit, until its runs are finished
+    tasks = []
+    for i, (path, config) in enumerate(configs):
+        all_runs_dir = os.path.join(runs_dir,
+                                    "{}-{}".format(timestr, config['Name']))
+        summary = {
+            "config_path": path,
+            "name": config['Name'],
+            "config_hash": run_db.config_hash(config),
+            "runs_dir": all_runs_dir,
+            "status": "pending",
+        }
+        summaries.append(summary)
+
+        if completed_runs(conn, config) >= config['Runs']:
+            query = "SELECT MIN(best_fitness) FROM runs WHERE config_hash = ?"
+            best_fitness, = conn.execute(query, (summary['config_hash'],))
+            summary.update(status="skipped", runs_dir=None,
+                           best_fitness=best_fitness[0])
+            continue
+
+        # the fitness cache of the toolkit is shared by all runs
+        toolkit = RubiconToolkit(config)
+        toolkits[i] = toolkit
+        for run in range(config['Runs']):
+            if config['Runs'] == 1:
+                run_dir = all_runs_dir
+            else:
+                run_dir = run_dir_path(all_runs_dir, run, config['Runs'])
+            tasks.append((i, run, config, toolkit.cache, run_dir,
+                          random.getrandbits(32)))
+
+    if verbose:
+        skipped = sum(s['status'] == "skipped" for s in summaries)
+        print("{} configurations ({} skipped), {} runs".format(
+            len(configs), skipped, len(tasks)))
+
+    results = {i: [] for i, _, _, _, _, _ in tasks}
+    start_times = {}
+    start_time = time.time()
+    with mp.Pool(cores) as pool:
+        for result in pool.imap_unordered(_run_task, tasks):
+            i, run, fit_and_best, stats, duration = result
+            path, config = configs[i]
+            results[i].append((run, fit_and_best, stats))
+            start_times.setdefault(i, time.time() - duration)
+            if verbose:
+                print("{} run {}: Fitness {} ({:.1f}s)".format(
+                    config['Name'], run, fit_and_best[0], duration))
+
+            if len(results[i]) < config['Runs']:
+                continue
+
+            # all runs of the configuration are finished
+            summary = summaries[i]
+            config_duration = time.time() - start_times[i]
+            runs = sorted(results.pop(i), key=lambda r: r[0])
+            fit_and_best = [r[1] for r in runs]
+            toolkit = toolkits.pop(i)
+            cache = toolkit.cache
+            if config['Runs'] > 1:
+                cache_report = cache.report() if cache else None
+                finish_multi_run(toolkit, summary['runs_dir'], fit_and_best,
+                                 [r[2] for r in runs], config_duration,
+                                 verbose=False, cache_report=cache_report)
+            if cache:
+                cache.close()
+            best_fitness, best = min(fit_and_best)
+            summary.update(status="done", best_fitness=float(best_fitness),
+                           best=best, duration=config_duration)
+
+    run_db.ingest(conn, runs_dir, verbose=False)
+    conn.close()
+
+    if verbose:
+        print("Sweep took {:.1f}s".format(time.time() - start_time))
+    return summaries
+
+
+def main():
+    """Parse the command line and run the sweep."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("configs", nargs="+",
+                        help="configuration files, directories or globs")
+    parser.add_argument("-j", "--cores", type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument("-g", "--grid", default=None,
+                        help="JSON file with a parameter grid")
+    parser.add_argument("-s", "--seed", type=int, default=None,
+                        help="seed for the runs' random seeds")
+    parser.add_argument("--runs-dir", default=run_db.RUNS_DIR,
+                        help="root directory for the experiments' logs")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+
+    grid = None
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+
+    configs = []
+    for path in find_configs(args.configs):
+        with open(path) as f:
+            config = json.load(f)
+        configs.extend((path, point) for point in expand_grid(config, grid))
+
+    summaries = sweep(configs, args.runs_dir, args.cores)
+
+    timestr = datetime.datetime.now().strftime("%Y%m%d-%Hh%Mm%Ss")
+    summary_path = os.path.join(args.runs_dir,
+                                "sweep-{}.json".format(timestr))
+    with open(summary_path, "w") as f:
+        json.dump(summaries, f, indent=4)
+    print("Sweep summary written to", summary_path)
+
+
+if __name__ == '__main__':
+    main()